@@ -1,40 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 import pandas as pd
 import io
 import json
 from ..database import get_db
 from .. import models, schemas
 from ..services.optimization import optimize_shipments
+from ..services.routing import plan_milk_runs
+from ..services.sharding import optimize_sharded, should_shard
+from ..services.fleet import load_fleet, vehicle_classes, assign_fleet, committed_vehicles, AWAITING_VEHICLE
+from ..services.horizon import load_open_po_loads, plan_horizon, HORIZON_CYCLES, MAX_HORIZON_CYCLES
+from ..services.scenarios import run_scenarios, WEEKDAYS, MAX_SCENARIOS
+from ..services.optimization import VEHICLE_CLASSES
 from ..services.erpnext import erpnext_service
+from ..services.erpnext_webhook import (
+    ERPNEXT_WEBHOOK_SECRET, verify_signature, parse_payload, enqueue_po, queue_stats
+)
 from ..services.pdf_parser import extract_po_from_pdf
-from ..services.performance import get_supplier_performance
+from ..services.performance import (
+    get_supplier_performance, get_windowed_supplier_scores, get_supplier_trend, refresh_supplier_rollups
+)
+from ..services.archive import archive_terminal_pos, archived_po_numbers
+from ..services.dashboard import get_dashboard_summary
+from ..services.events import event_bus
+from ..services.changes import get_changes, record_tombstones, InvalidToken
+from ..services.item_master import resolve_dimensions, fill_missing_dimensions, upsert_item_master
+from ..services.profiling import phase
+from ..services import wire
+from ..services.db_metrics import db_metrics, server_lock_stats
+from sqlalchemy import select
 from fastapi import BackgroundTasks
 
 router = APIRouter()
 
+@router.get("/dashboard/summary")
+def read_dashboard_summary(supplier: Optional[str] = None, db: Session = Depends(get_db)):
+    return get_dashboard_summary(db, supplier_name=supplier)
+
 @router.get("/suppliers/performance")
-def read_performance(db: Session = Depends(get_db)):
-    return get_supplier_performance(db)
+def read_performance(include_history: bool = False, db: Session = Depends(get_db)):
+    return get_supplier_performance(db, include_history=include_history)
+
+@router.get("/suppliers/performance/windows")
+def read_windowed_performance(db: Session = Depends(get_db)):
+    return get_windowed_supplier_scores(db)
+
+@router.get("/suppliers/{supplier_name}/trend")
+def read_supplier_trend(supplier_name: str, days: int = 90, bucket_days: int = 7, db: Session = Depends(get_db)):
+    if days < 1 or bucket_days < 1:
+        raise HTTPException(status_code=400, detail="days and bucket_days must be positive")
+    return get_supplier_trend(db, supplier_name, days=days, bucket_days=bucket_days)
+
+@router.post("/suppliers/rollups/refresh")
+def run_supplier_rollups(full: bool = False, db: Session = Depends(get_db)):
+    return refresh_supplier_rollups(db, full=full)
+
+@router.get("/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    after_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    return StreamingResponse(
+        event_bus.stream(request, after_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/erpnext/health")
+def read_erpnext_health(db: Session = Depends(get_db)):
+    return {**erpnext_service.client.stats(), "webhook_queue": queue_stats(db)}
+
+@router.post("/erpnext/webhook", status_code=202)
+async def receive_erpnext_webhook(request: Request, event: Optional[str] = None,
+                                  x_frappe_webhook_signature: Optional[str] = Header(None),
+                                  db: Session = Depends(get_db)):
+    if not ERPNEXT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="ERPNext webhooks are not configured")
+    body = await request.body()
+    if not verify_signature(body, x_frappe_webhook_signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    payload = parse_payload(body, event)
+    if not payload:
+        raise HTTPException(status_code=400, detail="Webhook body has no document name")
+    if payload["doctype"] != "Purchase Order":
+        return {"ignored": payload["doctype"]}
+    # Only queued here; the drain job fetches the PO once its debounce window has passed
+    entry = enqueue_po(db, payload["name"], payload["event"])
+    return {"queued": entry.po_number, "event": entry.event, "version": entry.version}
 
 @router.post("/erpnext/sync")
 def sync_erpnext(db: Session = Depends(get_db)):
     return erpnext_service.fetch_purchase_orders(db)
 
+@router.get("/metrics/db")
+def read_db_metrics(db: Session = Depends(get_db)):
+    # Counters are per worker process; the pid tells load tests which worker answered
+    return {**db_metrics.snapshot(), "server": server_lock_stats(db)}
+
+@router.post("/archive")
+def run_archive(older_than_days: Optional[int] = None, batch_size: Optional[int] = None, db: Session = Depends(get_db)):
+    return archive_terminal_pos(db, older_than_days=older_than_days, batch_size=batch_size)
+
 @router.get("/purchase-orders", response_model=List[schemas.PurchaseOrder])
-def read_pos(db: Session = Depends(get_db)):
-    return db.query(models.PurchaseOrder).all()
+def read_pos(request: Request, include_history: bool = False, db: Session = Depends(get_db)):
+    # Compact formats (NDJSON, columnar JSON, MessagePack) are opt-in via the Accept header
+    wire_format = wire.negotiate(request.headers.get("accept"))
+    if wire_format:
+        payload = wire.purchase_order_columns(db, include_history)
+        return wire.render(payload, wire_format, request.headers.get("accept-encoding"))
+    pos = db.query(models.PurchaseOrder).options(selectinload(models.PurchaseOrder.items)).all()
+    if include_history:
+        pos += db.query(models.PurchaseOrderHistory).options(selectinload(models.PurchaseOrderHistory.items)).all()
+    return pos
+
+@router.get("/changes", response_model=schemas.ChangeSet)
+def read_changes(since: Optional[str] = None, db: Session = Depends(get_db)):
+    try:
+        return get_changes(db, since)
+    except InvalidToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/purchase-orders")
 def delete_all_pos(db: Session = Depends(get_db)):
+    record_tombstones(db, "item", select(models.Item.id))
+    record_tombstones(db, "purchase_order", select(models.PurchaseOrder.id))
     db.query(models.Item).delete()
     db.query(models.PurchaseOrder).delete()
     db.commit()
+    event_bus.publish(db, "po.deleted", all=True)
     return {"message": "All Purchase Orders and items deleted successfully"}
 
 @router.patch("/purchase-orders/{po_id}/status")
-def update_po_status(po_id: int, payload: dict, db: Session = Depends(get_db)):
+def update_po_status(po_id: int, payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     # Allowed statuses based on user request (Luggage Manufacturing Flow)
     allowed_statuses = ["Open", "Confirmed", "In Production", "Quality Checked", "Ready for Dispatch", "Dispatch", "Partially Shipped", "Cancelled"]
     new_status = payload.get("status")
@@ -48,14 +145,12 @@ def update_po_status(po_id: int, payload: dict, db: Session = Depends(get_db)):
         
     db_po.status = new_status
     db.commit()
+    event_bus.publish(db, "po.updated", ids=[po_id])
     
-    # Push update back to source
-    try:
-        erpnext_service.update_purchase_order_status(db_po.po_number, new_status)
-    except:
-        pass # Don't block core flow if Sync update fails
+    # Push update back to source in background so a slow ERPNext never holds the request
+    background_tasks.add_task(erpnext_service.update_purchase_order_status, db_po.po_number, new_status)
         
-    return {"message": f"PO status updated to {new_status} and synced", "status": new_status}
+    return {"message": f"PO status updated to {new_status}; queued for sync to ERPNext", "status": new_status}
 
 @router.patch("/purchase-orders/{po_id}/delivery-date")
 def update_delivery_date(po_id: int, payload: dict, db: Session = Depends(get_db)):
@@ -70,11 +165,13 @@ def update_delivery_date(po_id: int, payload: dict, db: Session = Depends(get_db
         db_po.status = "Cancelled"
         db_po.date_change_count += 1
         db.commit()
+        event_bus.publish(db, "po.updated", ids=[po_id])
         return {"message": "Change limit exceeded. PO has been automatically CANCELLED.", "status": "Cancelled"}
     
     db_po.expected_delivery_date = new_date
     db_po.date_change_count += 1
     db.commit()
+    event_bus.publish(db, "po.updated", ids=[po_id])
     return {"message": f"Date updated. Change count: {db_po.date_change_count}/3", "new_count": db_po.date_change_count}
 
 @router.post("/purchase-orders", response_model=schemas.PurchaseOrder)
@@ -82,6 +179,7 @@ def create_po(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
     db_po = models.PurchaseOrder(
         po_number=po.po_number,
         order_date=po.order_date,
+        expected_delivery_date=po.expected_delivery_date,
         supplier_name=po.supplier_name,
         location=po.location
     )
@@ -89,6 +187,7 @@ def create_po(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_po)
     
+    new_items = []
     for item in po.items:
         db_item = models.Item(
             item_code=item.item_code,
@@ -101,104 +200,269 @@ def create_po(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
             cbm_per_unit=float(item.cbm_per_unit or 0),
             po_id=db_po.id
         )
-        db.add(db_item)
-    
+        new_items.append(db_item)
+
+    fill_missing_dimensions(db, new_items)
+    db.add_all(new_items)
     db.commit()
     db.refresh(db_po)
+    event_bus.publish(db, "po.created", ids=[db_po.id])
     return db_po
 
 @router.post("/purchase-orders/upload")
 async def upload_purchase_orders(file: UploadFile = File(...), db: Session = Depends(get_db)):
     try:
-        content = await file.read()
-        if file.filename.endswith('.json'):
-            data = json.loads(content)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(content))
-            data = df.to_dict(orient='records')
-        elif file.filename.endswith('.pdf'):
-            data = extract_po_from_pdf(io.BytesIO(content))
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file format")
+        with phase("parse"):
+            content = await file.read()
+            if file.filename.endswith('.json'):
+                data = json.loads(content)
+            elif file.filename.endswith(('.xlsx', '.xls')):
+                df = pd.read_excel(io.BytesIO(content))
+                data = df.to_dict(orient='records')
+            elif file.filename.endswith('.pdf'):
+                data = extract_po_from_pdf(io.BytesIO(content))
+            else:
+                raise HTTPException(status_code=400, detail="Unsupported file format")
 
         if not isinstance(data, list):
             data = [data]
 
         created_pos = {} # Map PO Number to PO object to handle flat files
+        archived = set()
+        new_po_ids = []
+        new_items = []
+        master_records = []
         
-        for po_item_data in data:
-            # Smart mapping for Source system headers
-            po_no = (po_item_data.get('po_number') or 
-                     po_item_data.get('Document No.') or 
-                     po_item_data.get('Document No') or
-                     po_item_data.get('name'))
+        with phase("map"):
+            for po_item_data in data:
+                # Smart mapping for Source system headers
+                po_no = (po_item_data.get('po_number') or 
+                         po_item_data.get('Document No.') or 
+                         po_item_data.get('Document No') or
+                         po_item_data.get('name'))
             
-            if not po_no:
-                continue
-
-            if po_no not in created_pos:
-                # Check if PO already exists in DB
-                db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == str(po_no)).first()
-                if not db_po:
-                    db_po = models.PurchaseOrder(
-                        po_number=str(po_no),
-                        order_date=po_item_data.get('order_date') or po_item_data.get('Date') or po_item_data.get('transaction_date'),
-                        supplier_name=po_item_data.get('supplier_name') or po_item_data.get('Supplier') or po_item_data.get('supplier'),
-                        location=po_item_data.get('state') or po_item_data.get('State') or po_item_data.get('Supplier State') or po_item_data.get('location') or po_item_data.get('Location') or "Bihar"
-                    )
-                    db.add(db_po)
-                    db.commit()
-                    db.refresh(db_po)
-                created_pos[po_no] = db_po
-
-            db_po = created_pos[po_no]
-
-            # Add Item (handling both nested "items" list or flat rows)
-            items_to_process = po_item_data.get('items', [po_item_data])
-            if not isinstance(items_to_process, list):
-                items_to_process = [items_to_process]
-
-            for item_data in items_to_process:
-                # Skip if it's the main PO row but doesn't have item info
-                item_code = item_data.get('item_code') or item_data.get('Item Code')
-                if not item_code:
+                if not po_no:
+                    continue
+
+                if po_no in archived:
                     continue
+                if po_no not in created_pos:
+                    # Check if PO already exists in DB
+                    db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == str(po_no)).first()
+                    if not db_po and archived_po_numbers(db, [po_no]):
+                        # Already consolidated and archived; its rows must not reopen it
+                        archived.add(po_no)
+                        continue
+                    if not db_po:
+                        db_po = models.PurchaseOrder(
+                            po_number=str(po_no),
+                            order_date=po_item_data.get('order_date') or po_item_data.get('Date') or po_item_data.get('transaction_date'),
+                            supplier_name=po_item_data.get('supplier_name') or po_item_data.get('Supplier') or po_item_data.get('supplier'),
+                            location=po_item_data.get('state') or po_item_data.get('State') or po_item_data.get('Supplier State') or po_item_data.get('location') or po_item_data.get('Location') or "Bihar"
+                        )
+                        db.add(db_po)
+                        db.commit()
+                        db.refresh(db_po)
+                        new_po_ids.append(db_po.id)
+                    created_pos[po_no] = db_po
+
+                db_po = created_pos[po_no]
+
+                # Add Item (handling both nested "items" list or flat rows)
+                items_to_process = po_item_data.get('items', [po_item_data])
+                if not isinstance(items_to_process, list):
+                    items_to_process = [items_to_process]
 
-                db_item = models.Item(
-                    item_code=str(item_code),
-                    item_name=item_data.get('item_name') or item_data.get('Item Name'),
-                    hsn_code=item_data.get('hsn_code') or item_data.get('HSN/SAC') or item_data.get('gst_hsn_code'),
-                    uom=item_data.get('uom') or item_data.get('UOM'),
-                    quantity=int(item_data.get('pending_qty') or item_data.get('Pending Qty') or item_data.get('quantity') or item_data.get('qty') or 0),
-                    rate=float(item_data.get('rate') or item_data.get('Rate') or 0),
-                    weight_per_unit=float(item_data.get('weight_per_unit') or item_data.get('Weight/Unit') or 0),
-                    cbm_per_unit=float(item_data.get('cbm_per_unit') or item_data.get('CBM/Unit') or 0),
-                    po_id=db_po.id
-                )
-                db.add(db_item)
+                for item_data in items_to_process:
+                    # Skip if it's the main PO row but doesn't have item info
+                    item_code = item_data.get('item_code') or item_data.get('Item Code')
+                    if not item_code:
+                        continue
+
+                    db_item = models.Item(
+                        item_code=str(item_code),
+                        item_name=item_data.get('item_name') or item_data.get('Item Name'),
+                        hsn_code=item_data.get('hsn_code') or item_data.get('HSN/SAC') or item_data.get('gst_hsn_code'),
+                        uom=item_data.get('uom') or item_data.get('UOM'),
+                        quantity=int(item_data.get('pending_qty') or item_data.get('Pending Qty') or item_data.get('quantity') or item_data.get('qty') or 0),
+                        rate=float(item_data.get('rate') or item_data.get('Rate') or 0),
+                        weight_per_unit=float(item_data.get('weight_per_unit') or item_data.get('Weight/Unit') or 0),
+                        cbm_per_unit=float(item_data.get('cbm_per_unit') or item_data.get('CBM/Unit') or 0),
+                        po_id=db_po.id
+                    )
+                    new_items.append(db_item)
+                    if db_item.weight_per_unit or db_item.cbm_per_unit:
+                        master_records.append({
+                            "item_code": db_item.item_code,
+                            "item_name": db_item.item_name,
+                            "weight_per_unit": db_item.weight_per_unit,
+                            "cbm_per_unit": db_item.cbm_per_unit,
+                        })
         
-        db.commit()
-        return {"message": f"Successfully processed Excel data for {len(created_pos)} Purchase Orders"}
+        # Learn dimensions from lines that carry them, then fill the ones that don't in one lookup
+        with phase("insert"):
+            upsert_item_master(db, master_records, "upload")
+            fill_missing_dimensions(db, new_items)
+            db.add_all(new_items)
+            db.commit()
+        if new_po_ids:
+            event_bus.publish(db, "po.created", ids=new_po_ids)
+        updated_ids = [po.id for po in created_pos.values() if po.id not in new_po_ids]
+        if updated_ids:
+            event_bus.publish(db, "po.updated", ids=updated_ids)
+        message = f"Successfully processed Excel data for {len(created_pos)} Purchase Orders"
+        if archived:
+            message += f"; skipped {len(archived)} already archived"
+        return {"message": message}
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/item-master", response_model=List[schemas.ItemMaster])
+def read_item_master(db: Session = Depends(get_db)):
+    return db.query(models.ItemMaster).order_by(models.ItemMaster.item_code).all()
+
+@router.post("/item-master")
+def save_item_master(records: List[schemas.ItemMasterBase], db: Session = Depends(get_db)):
+    count = upsert_item_master(db, [r.model_dump() for r in records], "manual")
+    db.commit()
+    return {"message": f"Saved {count} item master records"}
+
+@router.post("/item-master/upload")
+async def upload_item_master(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    content = await file.read()
+    if file.filename.endswith('.json'):
+        data = json.loads(content)
+    elif file.filename.endswith(('.xlsx', '.xls')):
+        data = pd.read_excel(io.BytesIO(content)).to_dict(orient='records')
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+
+    records = [
+        {
+            "item_code": row.get('item_code') or row.get('Item Code'),
+            "item_name": row.get('item_name') or row.get('Item Name'),
+            "weight_per_unit": row.get('weight_per_unit') or row.get('Weight/Unit'),
+            "cbm_per_unit": row.get('cbm_per_unit') or row.get('CBM/Unit'),
+            "stackable": row.get('stackable') if row.get('stackable') is not None else row.get('Stackable'),
+        }
+        for row in (data if isinstance(data, list) else [data])
+    ]
+    count = upsert_item_master(db, records, "upload")
+    db.commit()
+    return {"message": f"Saved {count} item master records"}
+
 @router.post("/optimize", response_model=List[schemas.ShipmentCreate])
-def get_optimization(db: Session = Depends(get_db)):
-    pending_pos = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.status == "Open").all()
+def get_optimization(mode: str = "lane", time_budget: Optional[float] = None, sharded: Optional[bool] = None,
+                     fleet: bool = False, db: Session = Depends(get_db)):
+    if mode not in ("lane", "milk_run"):
+        raise HTTPException(status_code=400, detail="mode must be 'lane' or 'milk_run'")
+
+    with phase("load"):
+        pending_pos = (
+            db.query(models.PurchaseOrder)
+            .options(selectinload(models.PurchaseOrder.items))
+            .filter(models.PurchaseOrder.status == "Open")
+            .all()
+        )
     if not pending_pos:
         return []
     
-    plans = optimize_shipments(pending_pos)
+    with phase("dimensions"):
+        dimensions = resolve_dimensions(db, (item.item_code for po in pending_pos for item in po.items))
+    catalog = load_fleet(db)
+    classes = vehicle_classes(catalog) or None
+    # Large backlogs are planned per origin region on the process pool
+    if sharded or (sharded is None and should_shard(len(pending_pos), mode)):
+        plans = optimize_sharded(pending_pos, dimensions, mode=mode, time_budget=time_budget, vehicle_classes=classes)
+    elif mode == "milk_run":
+        plans = plan_milk_runs(pending_pos, dimensions, time_budget=time_budget, vehicle_classes=classes)
+    else:
+        plans = optimize_shipments(pending_pos, dimensions, vehicle_classes=classes)
+    if fleet:
+        # Share the vehicles actually available on each dispatch date between all plans
+        with phase("fleet"):
+            committed = committed_vehicles(db, {plan["dispatch_date"] for plan in plans})
+            plans = assign_fleet(plans, catalog, committed=committed)
     return plans
 
+@router.get("/fleet", response_model=List[schemas.FleetVehicle])
+def read_fleet(db: Session = Depends(get_db)):
+    return db.query(models.FleetVehicle).order_by(models.FleetVehicle.max_cbm, models.FleetVehicle.max_weight).all()
+
+@router.put("/fleet", response_model=List[schemas.FleetVehicle])
+def replace_fleet(vehicles: List[schemas.FleetVehicleBase], db: Session = Depends(get_db)):
+    if not vehicles:
+        raise HTTPException(status_code=400, detail="The fleet needs at least one vehicle class")
+    names = [v.name.strip() for v in vehicles]
+    if len(set(names)) != len(names) or not all(names):
+        raise HTTPException(status_code=400, detail="Vehicle names must be unique and not empty")
+    for v in vehicles:
+        if v.max_weight <= 0 or v.max_cbm <= 0 or v.cost_per_km < 0 or (v.daily_available is not None and v.daily_available < 0):
+            raise HTTPException(status_code=400, detail=f"{v.name}: capacities must be positive, cost and availability not negative")
+
+    existing = {v.name: v for v in db.query(models.FleetVehicle).all()}
+    for name, v in zip(names, vehicles):
+        db_vehicle = existing.pop(name, None) or models.FleetVehicle(name=name)
+        db_vehicle.max_weight = v.max_weight
+        db_vehicle.max_cbm = v.max_cbm
+        db_vehicle.cost_per_km = v.cost_per_km
+        db_vehicle.daily_available = v.daily_available
+        db.add(db_vehicle)
+    for removed in existing.values():
+        db.delete(removed)
+    db.commit()
+    event_bus.publish(db, "fleet.updated", vehicles=len(names))
+    return read_fleet(db)
+
+@router.get("/dispatch/horizon")
+def get_dispatch_horizon(cycles: int = HORIZON_CYCLES, db: Session = Depends(get_db)):
+    if not 1 <= cycles <= MAX_HORIZON_CYCLES:
+        raise HTTPException(status_code=400, detail=f"cycles must be between 1 and {MAX_HORIZON_CYCLES}")
+    with phase("load"):
+        loads = load_open_po_loads(db)
+    return plan_horizon(loads, cycles, vehicle_classes=vehicle_classes(load_fleet(db)) or None)
+
+@router.post("/scenarios")
+def compare_scenarios(request: schemas.ScenarioRequest, db: Session = Depends(get_db)):
+    if not request.scenarios or len(request.scenarios) > MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_SCENARIOS} scenarios")
+    classes = vehicle_classes(load_fleet(db)) or VEHICLE_CLASSES
+    vehicle_names = {v[0] for v in classes}
+    for scenario in request.scenarios:
+        if scenario.mode not in ("lane", "milk_run"):
+            raise HTTPException(status_code=400, detail=f"{scenario.name}: mode must be 'lane' or 'milk_run'")
+        if scenario.dispatch_weekday and scenario.dispatch_weekday.lower() not in WEEKDAYS:
+            raise HTTPException(status_code=400, detail=f"{scenario.name}: unknown weekday {scenario.dispatch_weekday}")
+        unknown = set(scenario.allowed_vehicles or []) - vehicle_names
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"{scenario.name}: unknown vehicles {', '.join(sorted(unknown))}")
+    return run_scenarios(db, [s.model_dump() for s in request.scenarios], vehicle_classes=classes)
+
 @router.get("/shipments", response_model=List[schemas.Shipment])
-def read_shipments(db: Session = Depends(get_db)):
-    return db.query(models.Shipment).all()
+def read_shipments(request: Request, include_history: bool = False, db: Session = Depends(get_db)):
+    wire_format = wire.negotiate(request.headers.get("accept"))
+    if wire_format:
+        payload = wire.shipment_columns(db, include_history)
+        return wire.render(payload, wire_format, request.headers.get("accept-encoding"))
+    shipments = (
+        db.query(models.Shipment)
+        .options(selectinload(models.Shipment.purchase_orders).selectinload(models.PurchaseOrder.items))
+        .all()
+    )
+    if include_history:
+        shipments += (
+            db.query(models.ShipmentHistory)
+            .options(selectinload(models.ShipmentHistory.purchase_orders).selectinload(models.PurchaseOrderHistory.items))
+            .all()
+        )
+    return shipments
 
 @router.post("/shipments", response_model=schemas.Shipment)
 def create_shipment(shipment: schemas.ShipmentCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    if shipment.status == AWAITING_VEHICLE:
+        raise HTTPException(status_code=400, detail="No vehicle is available for this plan on its dispatch date; hold it for the next dispatch")
     db_shipment = models.Shipment(
         dispatch_date=shipment.dispatch_date,
         vehicle_type=shipment.vehicle_type,
@@ -206,7 +470,11 @@ def create_shipment(shipment: schemas.ShipmentCreate, background_tasks: Backgrou
         total_cbm=shipment.total_cbm,
         recommendation=shipment.recommendation or "Standard Optimization",
         location=shipment.location,
+        drop_location=shipment.drop_location,
         route=shipment.route,
+        stops=[stop.model_dump() for stop in shipment.stops] if shipment.stops else None,
+        vehicle_count=shipment.vehicle_count,
+        freight_cost=shipment.freight_cost,
         status=shipment.status
     )
     db.add(db_shipment)
@@ -224,4 +492,5 @@ def create_shipment(shipment: schemas.ShipmentCreate, background_tasks: Backgrou
             
     db.commit()
     db.refresh(db_shipment)
+    event_bus.publish(db, "shipment.created", ids=[db_shipment.id], po_ids=[po.id for po in db_shipment.purchase_orders])
     return db_shipment
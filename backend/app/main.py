@@ -4,11 +4,20 @@ from .database import engine, Base
 from .api.endpoints import router
 from . import models
 from .services.erpnext import erpnext_service
+from .services.erpnext_webhook import drain_webhook_queue, ERPNEXT_RECONCILE_MINUTES, ERPNEXT_WEBHOOK_DRAIN_SECONDS
+from .services.archive import archive_terminal_pos
+from .services.performance import refresh_supplier_rollups
+from .services.events import event_bus
+from .services.changes import prune_tombstones
+from .services.profiling import ProfilingMiddleware
+from .services.db_metrics import db_metrics
+from .services.fleet import seed_fleet
 from .database import SessionLocal
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+db_metrics.install(engine)
 
 def fix_database_schema():
     from sqlalchemy import text
@@ -18,7 +27,9 @@ def fix_database_schema():
             "expected_delivery_date DATE",
             "date_change_count INTEGER DEFAULT 0",
             "supplier_user_id INTEGER",
-            "drop_location VARCHAR(100)"
+            "drop_location VARCHAR(100)",
+            "updated_at TIMESTAMP NULL",
+            "erpnext_modified VARCHAR(40)"
         ]:
             col_name = col_def.split()[0]
             try:
@@ -35,7 +46,11 @@ def fix_database_schema():
             "location VARCHAR(100)",
             "route VARCHAR(255)",
             "recommendation TEXT",
-            "drop_location VARCHAR(100)"
+            "drop_location VARCHAR(100)",
+            "updated_at TIMESTAMP NULL",
+            "stops JSON",
+            "vehicle_count INTEGER",
+            "freight_cost FLOAT"
         ]:
             col_name = col_def.split()[0]
             try:
@@ -45,9 +60,43 @@ def fix_database_schema():
             except Exception:
                 pass
 
+        for col_def in ["stops JSON", "vehicle_count INTEGER", "freight_cost FLOAT"]:
+            try:
+                conn.execute(text(f"ALTER TABLE shipments_history ADD COLUMN {col_def}"))
+                conn.commit()
+                print(f"Verified column in shipments_history: {col_def.split()[0]}")
+            except Exception:
+                pass
+
+        try:
+            conn.execute(text("ALTER TABLE items ADD COLUMN updated_at TIMESTAMP NULL"))
+            conn.commit()
+            print("Verified column in items: updated_at")
+        except Exception:
+            pass
+
+        # Rows from before change tracking count as changed at creation (or now, for items)
+        for table, fallback in [("purchase_orders", "created_at"), ("shipments", "created_at"), ("items", "CURRENT_TIMESTAMP")]:
+            try:
+                conn.execute(text(f"UPDATE {table} SET updated_at = {fallback} WHERE updated_at IS NULL"))
+                conn.commit()
+            except Exception:
+                pass
+
 # Run schema fixing
 fix_database_schema()
 
+def seed_fleet_catalog():
+    db = SessionLocal()
+    try:
+        seed_fleet(db)
+    except Exception as e:
+        print(f"Fleet Seed Error: {e}")
+    finally:
+        db.close()
+
+seed_fleet_catalog()
+
 def auto_sync_job():
     db = SessionLocal()
     try:
@@ -59,9 +108,68 @@ def auto_sync_job():
     finally:
         db.close()
 
+def webhook_drain_job():
+    db = SessionLocal()
+    try:
+        result = drain_webhook_queue(db)
+        if result["processed"] or result["failed"]:
+            print(f"ERPNext webhook queue drained: {result}")
+    except Exception as e:
+        print(f"Webhook Drain Error: {e}")
+    finally:
+        db.close()
+
+def archive_job():
+    db = SessionLocal()
+    try:
+        result = archive_terminal_pos(db)
+        print(f"Archived to history: {result}")
+        if result["purchase_orders"]:
+            event_bus.publish(db, "po.archived", count=result["purchase_orders"])
+    except Exception as e:
+        print(f"Archive Job Error: {e}")
+    finally:
+        db.close()
+
+def supplier_rollup_job():
+    db = SessionLocal()
+    try:
+        result = refresh_supplier_rollups(db)
+        print(f"Supplier rollups refreshed: {result['rows']} rows")
+    except Exception as e:
+        print(f"Supplier Rollup Error: {e}")
+    finally:
+        db.close()
+
+def supplier_rollup_rebuild_job():
+    # A moved due date leaves the old day counted until that day is recomputed; rebuild nightly
+    db = SessionLocal()
+    try:
+        result = refresh_supplier_rollups(db, full=True)
+        print(f"Supplier rollups rebuilt: {result['rows']} rows")
+    except Exception as e:
+        print(f"Supplier Rollup Rebuild Error: {e}")
+    finally:
+        db.close()
+
+def prune_change_log_job():
+    db = SessionLocal()
+    try:
+        event_bus.prune(db)
+        prune_tombstones(db)
+    except Exception as e:
+        print(f"Event Prune Error: {e}")
+    finally:
+        db.close()
+
 # Start background scheduler
 scheduler = BackgroundScheduler()
-scheduler.add_job(auto_sync_job, 'interval', minutes=10)
+scheduler.add_job(auto_sync_job, 'interval', minutes=ERPNEXT_RECONCILE_MINUTES)
+scheduler.add_job(webhook_drain_job, 'interval', seconds=ERPNEXT_WEBHOOK_DRAIN_SECONDS)
+scheduler.add_job(archive_job, 'interval', hours=24)
+scheduler.add_job(supplier_rollup_job, 'interval', hours=1)
+scheduler.add_job(supplier_rollup_rebuild_job, 'interval', hours=24)
+scheduler.add_job(prune_change_log_job, 'interval', minutes=15)
 scheduler.start()
 
 app = FastAPI(title="Logistics AI Portal API")
@@ -73,7 +181,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-File"],
 )
+# Server-Timing on every response; sampled flame-graph profiles for opted-in requests
+app.add_middleware(ProfilingMiddleware)
 
 app.include_router(router, prefix="/api")
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Date, UniqueConstraint, Text, Boolean, JSON
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -13,6 +13,8 @@ shipment_po_association = Table(
 
 class Item(Base):
     __tablename__ = "items"
+    # Ids are never reused after deletes, since history rows keep the hot ids
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     item_code = Column(String(100))
@@ -25,6 +27,7 @@ class Item(Base):
     weight_per_unit = Column(Float, default=0.0)  # Single unit weight
     cbm_per_unit = Column(Float, default=0.0)    # Single unit CBM
     po_id = Column(Integer, ForeignKey("purchase_orders.id"))
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
 
     purchase_order = relationship("PurchaseOrder", back_populates="items")
 
@@ -37,6 +40,7 @@ class User(Base):
 
 class PurchaseOrder(Base):
     __tablename__ = "purchase_orders"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     po_number = Column(String(100), unique=True, index=True)
@@ -48,13 +52,16 @@ class PurchaseOrder(Base):
     location = Column(String(100))
     drop_location = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
     status = Column(String(50), default="Open") # Open, Confirmed, In Production, Completed, Dispatch, Cancelled
+    erpnext_modified = Column(String(40), nullable=True)  # ERPNext `modified` stamp at the last sync
     
     items = relationship("Item", back_populates="purchase_order", cascade="all, delete-orphan")
     shipments = relationship("Shipment", secondary=shipment_po_association, back_populates="purchase_orders")
 
 class Shipment(Base):
     __tablename__ = "shipments"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     dispatch_date = Column(Date)
@@ -64,8 +71,155 @@ class Shipment(Base):
     location = Column(String(100), nullable=True)
     drop_location = Column(String(100), nullable=True)
     route = Column(String(255), nullable=True)
+    stops = Column(JSON, nullable=True)  # Ordered drops of a milk run, as in the plan
+    vehicle_count = Column(Integer, nullable=True)  # Vehicles of vehicle_type it takes; NULL before fleet assignment
+    freight_cost = Column(Float, nullable=True)
     recommendation = Column(String(500), nullable=True)
     status = Column(String(50), default="Proposed") # Proposed, Dispatched
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
 
     purchase_orders = relationship("PurchaseOrder", secondary=shipment_po_association, back_populates="shipments")
+
+# History (cold) tables: terminal POs older than the archive age are moved here
+# by services/archive.py so the hot tables only hold the active workload.
+shipment_po_association_history = Table(
+    'shipment_po_association_history',
+    Base.metadata,
+    Column('shipment_id', Integer, ForeignKey('shipments_history.id'), index=True),
+    Column('po_id', Integer, ForeignKey('purchase_orders_history.id'), index=True)
+)
+
+class ItemHistory(Base):
+    __tablename__ = "items_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_code = Column(String(100))
+    item_name = Column(String(255))
+    item_group = Column(String(100), nullable=True)
+    hsn_code = Column(String(50))
+    uom = Column(String(50))
+    quantity = Column(Integer)
+    rate = Column(Float)
+    weight_per_unit = Column(Float, default=0.0)
+    cbm_per_unit = Column(Float, default=0.0)
+    po_id = Column(Integer, ForeignKey("purchase_orders_history.id"), index=True)
+
+    purchase_order = relationship("PurchaseOrderHistory", back_populates="items")
+
+class PurchaseOrderHistory(Base):
+    __tablename__ = "purchase_orders_history"
+
+    id = Column(Integer, primary_key=True, index=True)  # Same id as the original hot row
+    po_number = Column(String(100), index=True)
+    order_date = Column(Date)
+    expected_delivery_date = Column(Date, nullable=True)
+    date_change_count = Column(Integer, default=0)
+    supplier_name = Column(String(255))
+    supplier_user_id = Column(Integer, nullable=True)
+    location = Column(String(100))
+    drop_location = Column(String(100), nullable=True)
+    created_at = Column(DateTime)
+    status = Column(String(50))
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    items = relationship("ItemHistory", back_populates="purchase_order", cascade="all, delete-orphan")
+    shipments = relationship("ShipmentHistory", secondary=shipment_po_association_history, back_populates="purchase_orders")
+
+class ShipmentHistory(Base):
+    __tablename__ = "shipments_history"
+
+    id = Column(Integer, primary_key=True, index=True)  # Same id as the original hot row
+    dispatch_date = Column(Date)
+    vehicle_type = Column(String(100))
+    total_weight = Column(Float)
+    total_cbm = Column(Float)
+    location = Column(String(100), nullable=True)
+    drop_location = Column(String(100), nullable=True)
+    route = Column(String(255), nullable=True)
+    stops = Column(JSON, nullable=True)
+    vehicle_count = Column(Integer, nullable=True)
+    freight_cost = Column(Float, nullable=True)
+    recommendation = Column(String(500), nullable=True)
+    status = Column(String(50))
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    purchase_orders = relationship("PurchaseOrderHistory", secondary=shipment_po_association_history, back_populates="shipments")
+
+class SupplierDailyRollup(Base):
+    """Per-supplier, per-day counters maintained by services/performance.py for windowed scores."""
+    __tablename__ = "supplier_daily_rollups"
+    __table_args__ = (UniqueConstraint("supplier_name", "day", name="uq_supplier_rollup_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_name = Column(String(255), index=True)
+    day = Column(Date, index=True)
+    pos_created = Column(Integer, default=0)   # POs created on this day
+    date_changes = Column(Integer, default=0)  # Delivery date changes on POs created this day
+    cancelled = Column(Integer, default=0)     # POs created this day that ended up Cancelled
+    due = Column(Integer, default=0)           # POs whose expected_delivery_date is this day
+    on_time = Column(Integer, default=0)       # ...dispatched on or before that date
+    late = Column(Integer, default=0)          # ...dispatched after it, or still not dispatched once past it
+    refreshed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ChangeEvent(Base):
+    """Outbox of compact change events; polled by every worker to fan out over /api/events."""
+    __tablename__ = "change_events"
+    # Pollers track the highest id seen, so ids must never be reused after prune
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(50))
+    payload = Column(Text)  # JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class Tombstone(Base):
+    """Deleted (or archived) row ids, so /api/changes can report removals."""
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String(30))  # purchase_order, item, shipment
+    entity_id = Column(Integer)
+    reason = Column(String(30), default="deleted")  # deleted, archived
+    deleted_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class ItemMaster(Base):
+    """Per-SKU dimensions used when an Item row arrives without weight/CBM (PDFs, most ERPNext POs)."""
+    __tablename__ = "item_master"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_code = Column(String(100), unique=True, index=True)
+    item_name = Column(String(255), nullable=True)
+    weight_per_unit = Column(Float, default=0.0)
+    cbm_per_unit = Column(Float, default=0.0)
+    stackable = Column(Boolean, default=True)
+    source = Column(String(20), default="upload")  # erpnext, upload, manual
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class ERPNextWebhookQueue(Base):
+    """POs announced by ERPNext webhooks and waiting to be fetched; one row per PO, so bursts collapse."""
+    __tablename__ = "erpnext_webhook_queue"
+
+    id = Column(Integer, primary_key=True, index=True)
+    po_number = Column(String(100), unique=True, index=True)
+    event = Column(String(30))  # Latest Frappe doc event: on_update, on_submit, on_cancel, on_trash, ...
+    version = Column(Integer, default=1)  # Bumped by every event, so a worker knows if it missed one
+    received_at = Column(DateTime, default=datetime.datetime.utcnow)
+    available_at = Column(DateTime, index=True)  # Debounce window / retry backoff end
+    claimed_by = Column(String(64), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+
+class FleetVehicle(Base):
+    """Vehicle class in the fleet catalog, with how many of it can go out on one dispatch day."""
+    __tablename__ = "fleet_vehicles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, index=True)
+    max_weight = Column(Float)  # kg
+    max_cbm = Column(Float)
+    cost_per_km = Column(Float, default=0.0)
+    daily_available = Column(Integer, nullable=True)  # None means no limit
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
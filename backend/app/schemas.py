@@ -19,6 +19,7 @@ class ItemCreate(ItemBase):
 class Item(ItemBase):
     id: int
     po_id: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -39,11 +40,20 @@ class PurchaseOrder(PurchaseOrderBase):
     id: int
     status: str
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    archived_at: Optional[datetime] = None
     items: List[Item]
 
     class Config:
         from_attributes = True
 
+class ShipmentStop(BaseModel):
+    drop_location: str
+    po_ids: List[int]
+    weight: float
+    cbm: float
+    km_from_previous: int
+
 class ShipmentBase(BaseModel):
     dispatch_date: date
     expected_arrival_date: Optional[date] = None
@@ -56,6 +66,9 @@ class ShipmentBase(BaseModel):
     location: Optional[str] = None
     drop_location: Optional[str] = None
     route: Optional[str] = None
+    stops: Optional[List[ShipmentStop]] = None  # Ordered drops of a milk run
+    vehicle_count: Optional[int] = None  # Set by fleet assignment
+    freight_cost: Optional[float] = None
 
 class ShipmentCreate(ShipmentBase):
     po_ids: List[int]
@@ -64,10 +77,69 @@ class Shipment(ShipmentBase):
     id: int
     purchase_orders: List[PurchaseOrder]
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    archived_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ShipmentChange(ShipmentBase):
+    id: int
+    po_ids: List[int]
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class DeletedIds(BaseModel):
+    purchase_orders: List[int] = []
+    items: List[int] = []
+    shipments: List[int] = []
+
+class ChangeSet(BaseModel):
+    purchase_orders: List[PurchaseOrder]
+    shipments: List[ShipmentChange]
+    deleted: DeletedIds
+    next_token: str
+    full: bool = False
+
+class ItemMasterBase(BaseModel):
+    item_code: str
+    item_name: Optional[str] = None
+    weight_per_unit: Optional[float] = 0.0
+    cbm_per_unit: Optional[float] = 0.0
+    stackable: Optional[bool] = True
+
+class ItemMaster(ItemMasterBase):
+    source: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class FleetVehicleBase(BaseModel):
+    name: str
+    max_weight: float
+    max_cbm: float
+    cost_per_km: float = 0.0
+    daily_available: Optional[int] = None  # None means no limit
+
+class FleetVehicle(FleetVehicleBase):
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class ScenarioParams(BaseModel):
+    name: str
+    mode: str = "lane"  # lane or milk_run
+    dispatch_weekday: Optional[str] = None  # e.g. Tuesday, Friday
+    dispatch_date: Optional[date] = None
+    hold_below_weight: Optional[float] = None  # Hold lanes lighter than this (kg) for another cycle
+    allowed_vehicles: Optional[List[str]] = None
+    time_budget: Optional[float] = None
+
+class ScenarioRequest(BaseModel):
+    scenarios: List[ScenarioParams]
+
 class OptimizationResult(BaseModel):
     suggested_groupings: List[ShipmentCreate]
     total_pending_weight: float
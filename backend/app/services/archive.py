@@ -0,0 +1,205 @@
+import os
+import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import select, insert, update, delete, func, and_, not_
+from sqlalchemy.orm import Session
+from .. import models
+from .changes import record_tombstones
+
+# POs in these statuses will not change any more and can leave the hot tables
+TERMINAL_STATUSES = ["Consolidated", "Dispatch", "Cancelled"]
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+PO_COLUMNS = [
+    "id", "po_number", "order_date", "expected_delivery_date", "date_change_count", "supplier_name",
+    "supplier_user_id", "location", "drop_location", "created_at", "status"
+]
+ITEM_COLUMNS = [
+    "id", "item_code", "item_name", "item_group", "hsn_code", "uom", "quantity", "rate",
+    "weight_per_unit", "cbm_per_unit", "po_id"
+]
+SHIPMENT_COLUMNS = [
+    "id", "dispatch_date", "vehicle_type", "total_weight", "total_cbm", "location", "drop_location",
+    "route", "stops", "vehicle_count", "freight_cost", "recommendation", "status", "created_at"
+]
+
+def archived_po_numbers(db: Session, po_numbers: Iterable[str]) -> Set[str]:
+    """
+    The PO numbers among `po_numbers` that are already in history. Sources
+    keep listing POs the portal has finished with, and re-importing one
+    would plan it again as a new open PO.
+    """
+    numbers = sorted({str(n) for n in po_numbers if n})
+    archived = set()
+    for i in range(0, len(numbers), ARCHIVE_BATCH_SIZE):
+        archived.update(
+            r[0] for r in db.execute(
+                select(models.PurchaseOrderHistory.po_number)
+                .where(models.PurchaseOrderHistory.po_number.in_(numbers[i:i + ARCHIVE_BATCH_SIZE]))
+            ).all()
+        )
+    return archived
+
+def _copy_rows(db: Session, source, target, columns: List[str], id_column, ids: List[int]):
+    """INSERT ... SELECT the given rows from a hot table into its history twin."""
+    db.execute(
+        insert(target.__table__).from_select(
+            columns,
+            select(*[source.__table__.c[c] for c in columns]).where(id_column.in_(ids))
+        )
+    )
+
+def _eligible_po_ids(db: Session, cutoff: datetime.datetime, batch_size: int) -> List[int]:
+    po = models.PurchaseOrder
+    link = models.shipment_po_association
+    is_candidate = and_(po.status.in_(TERMINAL_STATUSES), po.created_at < cutoff)
+
+    # A shipment can only go to history together with all of its POs, so skip POs
+    # that share a shipment with a PO that is still active.
+    blocked_shipments = (
+        select(link.c.shipment_id)
+        .join(po, po.id == link.c.po_id)
+        .where(not_(is_candidate))
+    )
+    blocked_pos = select(link.c.po_id).where(
+        link.c.shipment_id.in_(blocked_shipments), link.c.po_id.is_not(None)
+    )
+
+    rows = db.execute(
+        select(po.id)
+        .where(is_candidate, po.id.not_in(blocked_pos))
+        .order_by(po.id)
+        .limit(batch_size)
+    ).all()
+    return [r[0] for r in rows]
+
+def _with_shipment_partners(db: Session, po_ids: List[int]) -> List[int]:
+    """
+    Adds every PO that shares a shipment with the batch (transitively), so a
+    shipment and all of its links always move in the same batch. Partners
+    are terminal too, since _eligible_po_ids skips shipments with active POs.
+    """
+    link = models.shipment_po_association
+    batch = set(po_ids)
+    while True:
+        shipments = select(link.c.shipment_id).where(link.c.po_id.in_(batch))
+        partners = {
+            r[0] for r in db.execute(
+                select(link.c.po_id).where(link.c.shipment_id.in_(shipments), link.c.po_id.is_not(None))
+            ).all()
+        } - batch
+        if not partners:
+            return sorted(batch)
+        batch |= partners
+
+def _rekey_collisions(db: Session, hot_model, history_model, ids: List[int]) -> Dict[int, int]:
+    """
+    Gives the hot rows of `ids` whose id is already taken in history a new
+    id above both tables, and returns old id -> new id. SQLite files from
+    before AUTOINCREMENT hand out freed ids again, so a hot row can share its
+    id with an archived one. Referencing columns are the caller's to update.
+    """
+    hot, history = hot_model.__table__, history_model.__table__
+    taken = sorted(r[0] for r in db.execute(select(history.c.id).where(history.c.id.in_(ids))).all())
+    if not taken:
+        return {}
+    top = max(db.execute(select(func.max(hot.c.id))).scalar() or 0, db.execute(select(func.max(history.c.id))).scalar() or 0)
+    new_ids = {old: top + n for n, old in enumerate(taken, 1)}
+    for old, new in new_ids.items():
+        db.execute(update(hot).where(hot.c.id == old).values(id=new))
+    print(f"Archive: re-keyed {len(new_ids)} {hot.name} rows whose ids were already in {history.name}")
+    return new_ids
+
+def _archive_batch(db: Session, po_ids: List[int]) -> Dict[str, int]:
+    link = models.shipment_po_association
+    po_ids = _with_shipment_partners(db, po_ids)
+
+    item_ids = [r[0] for r in db.execute(select(models.Item.id).where(models.Item.po_id.in_(po_ids))).all()]
+    links = db.execute(select(link.c.shipment_id, link.c.po_id).where(link.c.po_id.in_(po_ids))).all()
+    shipment_ids = sorted({r[0] for r in links})
+
+    # Shipments move once none of their POs are left in the hot tables (always the
+    # case after _with_shipment_partners, unless a partner changed meanwhile)
+    done_shipment_ids = []
+    if shipment_ids:
+        still_hot = {
+            r[0] for r in db.execute(
+                select(link.c.shipment_id)
+                .where(link.c.shipment_id.in_(shipment_ids), link.c.po_id.not_in(po_ids))
+            ).all()
+        }
+        done_shipment_ids = [s for s in shipment_ids if s not in still_hot]
+
+    # Archived rows leave the hot tables, so delta-sync clients must drop them too (by the ids they know)
+    record_tombstones(db, "purchase_order", select(models.PurchaseOrder.id).where(models.PurchaseOrder.id.in_(po_ids)), "archived")
+    if item_ids:
+        record_tombstones(db, "item", select(models.Item.id).where(models.Item.id.in_(item_ids)), "archived")
+    if done_shipment_ids:
+        record_tombstones(db, "shipment", select(models.Shipment.id).where(models.Shipment.id.in_(done_shipment_ids)), "archived")
+
+    po_map = _rekey_collisions(db, models.PurchaseOrder, models.PurchaseOrderHistory, po_ids)
+    for old, new in po_map.items():
+        db.execute(update(models.Item.__table__).where(models.Item.po_id == old).values(po_id=new))
+        db.execute(update(link).where(link.c.po_id == old).values(po_id=new))
+    item_map = _rekey_collisions(db, models.Item, models.ItemHistory, item_ids) if item_ids else {}
+    shipment_map = {}
+    if done_shipment_ids:
+        shipment_map = _rekey_collisions(db, models.Shipment, models.ShipmentHistory, done_shipment_ids)
+        for old, new in shipment_map.items():
+            db.execute(update(link).where(link.c.shipment_id == old).values(shipment_id=new))
+    po_ids = [po_map.get(i, i) for i in po_ids]
+    item_ids = [item_map.get(i, i) for i in item_ids]
+    done_shipment_ids = [shipment_map.get(i, i) for i in done_shipment_ids]
+    links = [(shipment_map.get(s, s), po_map.get(p, p)) for s, p in links]
+
+    _copy_rows(db, models.PurchaseOrder, models.PurchaseOrderHistory, PO_COLUMNS, models.PurchaseOrder.id, po_ids)
+    if item_ids:
+        _copy_rows(db, models.Item, models.ItemHistory, ITEM_COLUMNS, models.Item.id, item_ids)
+    if done_shipment_ids:
+        _copy_rows(db, models.Shipment, models.ShipmentHistory, SHIPMENT_COLUMNS, models.Shipment.id, done_shipment_ids)
+        # Only links whose shipment is now in history, or the history foreign key breaks
+        done = set(done_shipment_ids)
+        db.execute(
+            insert(models.shipment_po_association_history),
+            [{"shipment_id": s, "po_id": p} for s, p in links if s in done]
+        )
+
+    db.execute(delete(link).where(link.c.po_id.in_(po_ids)))
+    if done_shipment_ids:
+        db.execute(delete(models.Shipment.__table__).where(models.Shipment.id.in_(done_shipment_ids)))
+    if item_ids:
+        db.execute(delete(models.Item.__table__).where(models.Item.id.in_(item_ids)))
+    db.execute(delete(models.PurchaseOrder.__table__).where(models.PurchaseOrder.id.in_(po_ids)))
+    db.commit()
+
+    return {"purchase_orders": len(po_ids), "items": len(item_ids), "shipments": len(done_shipment_ids)}
+
+def archive_terminal_pos(db: Session, older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> Dict:
+    """
+    Moves terminal POs (with their items, shipment links and shipments) that are
+    older than the archive age from the hot tables into the history tables.
+    Each batch is its own transaction so long runs never hold a lock for long.
+    """
+    older_than_days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+
+    totals = {"purchase_orders": 0, "items": 0, "shipments": 0, "batches": 0}
+    while True:
+        po_ids = _eligible_po_ids(db, cutoff, batch_size)
+        if not po_ids:
+            break
+        try:
+            moved = _archive_batch(db, po_ids)
+        except Exception:
+            db.rollback()
+            raise
+        for key, count in moved.items():
+            totals[key] += count
+        totals["batches"] += 1
+        if len(po_ids) < batch_size:
+            break
+
+    return totals
@@ -0,0 +1,105 @@
+import os
+import base64
+import datetime
+from typing import Dict, Optional
+from sqlalchemy import select, insert, literal
+from sqlalchemy.orm import Session, selectinload
+from .. import models
+
+# Each token starts this far before the read that issued it, so rows committed
+# by a transaction that was still open during that read are not missed.
+# Clients may see a row twice and should upsert by id.
+CHANGES_SAFETY_SECONDS = int(os.getenv("CHANGES_SAFETY_SECONDS", "5"))
+# Tokens older than this predate the oldest kept tombstone and get a full snapshot
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+class InvalidToken(ValueError):
+    pass
+
+def encode_token(moment: datetime.datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode()
+
+def decode_token(token: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except Exception:
+        raise InvalidToken(f"Invalid change token: {token}")
+
+def record_tombstones(db: Session, entity: str, id_query, reason: str = "deleted"):
+    """
+    Logs a tombstone for every id returned by `id_query` (a one-column select).
+    Call before the delete, in the same transaction.
+    """
+    db.execute(
+        insert(models.Tombstone).from_select(
+            ["entity", "entity_id", "reason", "deleted_at"],
+            select(literal(entity), id_query.subquery().c[0], literal(reason), literal(datetime.datetime.utcnow()))
+        )
+    )
+
+def get_changes(db: Session, since: Optional[str] = None) -> Dict:
+    """
+    Rows changed since the token, plus tombstones for rows removed since then.
+    Without a token this is a full snapshot that also yields the first token.
+    """
+    started = datetime.datetime.utcnow()
+    since_at = decode_token(since) if since else None
+    if since_at and since_at < started - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        since_at = None
+    next_token = encode_token(started - datetime.timedelta(seconds=CHANGES_SAFETY_SECONDS))
+
+    po_query = db.query(models.PurchaseOrder).options(selectinload(models.PurchaseOrder.items))
+    shipment_query = db.query(models.Shipment).options(selectinload(models.Shipment.purchase_orders))
+    deleted = {"purchase_orders": [], "items": [], "shipments": []}
+
+    if since_at:
+        # A PO counts as changed when its header or any of its items changed
+        changed_po_ids = select(models.PurchaseOrder.id).where(models.PurchaseOrder.updated_at >= since_at).union(
+            select(models.Item.po_id).where(models.Item.updated_at >= since_at)
+        )
+        po_query = po_query.filter(models.PurchaseOrder.id.in_(changed_po_ids))
+        shipment_query = shipment_query.filter(models.Shipment.updated_at >= since_at)
+
+        keys = {"purchase_order": "purchase_orders", "item": "items", "shipment": "shipments"}
+        tombstones = db.query(models.Tombstone.entity, models.Tombstone.entity_id).filter(
+            models.Tombstone.deleted_at >= since_at
+        )
+        for entity, entity_id in tombstones:
+            if entity in keys:
+                deleted[keys[entity]].append(entity_id)
+
+    shipments = [
+        {
+            "id": s.id,
+            "dispatch_date": s.dispatch_date,
+            "vehicle_type": s.vehicle_type,
+            "total_weight": s.total_weight,
+            "total_cbm": s.total_cbm,
+            "recommendation": s.recommendation or "",
+            "status": s.status,
+            "location": s.location,
+            "drop_location": s.drop_location,
+            "route": s.route,
+            "stops": s.stops,
+            "vehicle_count": s.vehicle_count,
+            "freight_cost": s.freight_cost,
+            "po_ids": [po.id for po in s.purchase_orders],
+            "created_at": s.created_at,
+            "updated_at": s.updated_at,
+        }
+        for s in shipment_query.all()
+    ]
+
+    return {
+        "purchase_orders": po_query.all(),
+        "shipments": shipments,
+        "deleted": deleted,
+        "next_token": next_token,
+        "full": since_at is None,
+    }
+
+def prune_tombstones(db: Session) -> int:
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    deleted = db.query(models.Tombstone).filter(models.Tombstone.deleted_at < cutoff).delete()
+    db.commit()
+    return deleted
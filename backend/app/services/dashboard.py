@@ -0,0 +1,131 @@
+import datetime
+from typing import Dict, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from .. import models
+from .item_master import DEFAULT_WEIGHT_KG, DEFAULT_CBM, dimension_expression
+
+DASHBOARD_TOP_LANES = 10
+# POs still waiting on the supplier; their expected date counts as overdue once passed
+OUTSTANDING_STATUSES = ["Open", "Confirmed", "In Production"]
+READY_STATUSES = ["Completed", "Dispatch"]
+
+def get_dashboard_summary(db: Session, supplier_name: Optional[str] = None, top_lanes: int = DASHBOARD_TOP_LANES) -> Dict:
+    """
+    Headline numbers for the dashboard from a handful of aggregate queries.
+    The payload size does not grow with the number of POs: lanes beyond
+    `top_lanes` (by pending weight) are folded into one "other" row.
+    """
+    po = models.PurchaseOrder
+    today = datetime.date.today()
+    scoped = (lambda q: q.where(po.supplier_name == supplier_name)) if supplier_name else (lambda q: q)
+
+    status_counts = {
+        status or "Unknown": count
+        for status, count in db.execute(scoped(select(po.status, func.count()).group_by(po.status)))
+    }
+    active = sum(count for status, count in status_counts.items() if status != "Cancelled")
+    ready = sum(status_counts.get(status, 0) for status in READY_STATUSES)
+
+    # Pending load per lane, with dimensions resolved in SQL
+    item, master = models.Item, models.ItemMaster
+    quantity = func.coalesce(item.quantity, 0)
+    weight = func.sum(quantity * dimension_expression(item.weight_per_unit, master.weight_per_unit, DEFAULT_WEIGHT_KG))
+    cbm = func.sum(quantity * dimension_expression(item.cbm_per_unit, master.cbm_per_unit, DEFAULT_CBM))
+    origin = func.coalesce(po.location, "Unknown Origin")
+    drop = func.coalesce(po.drop_location, "Unknown Destination")
+    lane_query = scoped(
+        select(
+            origin.label("location"),
+            drop.label("drop_location"),
+            func.count(func.distinct(po.id)).label("pos"),
+            func.coalesce(weight, 0).label("weight"),
+            func.coalesce(cbm, 0).label("cbm"),
+        )
+        .select_from(po)
+        .outerjoin(item, item.po_id == po.id)
+        .outerjoin(master, master.item_code == item.item_code)
+        .where(po.status == "Open")
+        .group_by(origin, drop)
+        .order_by(func.coalesce(weight, 0).desc())
+    )
+    lanes = [
+        {
+            "location": row.location,
+            "drop_location": row.drop_location,
+            "pos": row.pos,
+            "weight": round(row.weight, 2),
+            "cbm": round(row.cbm, 3),
+        }
+        for row in db.execute(lane_query)
+    ]
+    rest = lanes[top_lanes:]
+    other = None
+    if rest:
+        other = {
+            "lanes": len(rest),
+            "pos": sum(lane["pos"] for lane in rest),
+            "weight": round(sum(lane["weight"] for lane in rest), 2),
+            "cbm": round(sum(lane["cbm"] for lane in rest), 3),
+        }
+
+    week_start = today - datetime.timedelta(days=today.weekday())
+    week_end = week_start + datetime.timedelta(days=6)
+    shipment = models.Shipment
+    shipment_query = (
+        select(shipment.status, func.count(), func.coalesce(func.sum(shipment.total_weight), 0))
+        .where(shipment.dispatch_date.between(week_start, week_end))
+        .group_by(shipment.status)
+    )
+    if supplier_name:
+        link = models.shipment_po_association
+        shipment_query = shipment_query.where(
+            shipment.id.in_(select(link.c.shipment_id).join(po, po.id == link.c.po_id).where(po.supplier_name == supplier_name))
+        )
+    shipments_by_status, shipments_weight = {}, 0.0
+    for status, count, total_weight in db.execute(shipment_query):
+        shipments_by_status[status or "Unknown"] = count
+        shipments_weight += total_weight
+
+    overdue_count, oldest_due = db.execute(
+        scoped(
+            select(func.count(), func.min(po.expected_delivery_date))
+            .where(po.status.in_(OUTSTANDING_STATUSES), po.expected_delivery_date < today)
+        )
+    ).one()
+
+    # Trailing on-time rate from the supplier rollups maintained by the scheduler
+    since = today - datetime.timedelta(days=30)
+    rollup = models.SupplierDailyRollup
+    rollup_query = (
+        select(func.coalesce(func.sum(rollup.due), 0), func.coalesce(func.sum(rollup.on_time), 0))
+        .where(rollup.day >= since)
+    )
+    if supplier_name:
+        rollup_query = rollup_query.where(rollup.supplier_name == supplier_name)
+    due, on_time = db.execute(rollup_query).one()
+
+    return {
+        "generated_at": datetime.datetime.utcnow(),
+        "status_counts": status_counts,
+        "active_pos": active,
+        "ready_pos": ready,
+        "ready_pct": round(ready / active * 100) if active else 0,
+        "pending": {
+            "lanes": len(lanes),
+            "pos": sum(lane["pos"] for lane in lanes),
+            "weight": round(sum(lane["weight"] for lane in lanes), 2),
+            "cbm": round(sum(lane["cbm"] for lane in lanes), 3),
+            "top_lanes": lanes[:top_lanes],
+            "other": other,
+        },
+        "shipments_this_week": {
+            "week_start": week_start,
+            "week_end": week_end,
+            "count": sum(shipments_by_status.values()),
+            "weight": round(shipments_weight, 2),
+            "by_status": shipments_by_status,
+        },
+        "overdue": {"count": overdue_count, "oldest_expected_date": oldest_due},
+        "on_time_pct_30d": round(on_time / due * 100, 1) if due else None,
+    }
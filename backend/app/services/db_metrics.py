@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# Write statements slower than this most likely waited on a lock (SQLite serialises writers)
+DB_LOCK_WAIT_MS = float(os.getenv("DB_LOCK_WAIT_MS", "100"))
+DB_METRICS_SAMPLES = int(os.getenv("DB_METRICS_SAMPLES", "5000"))
+LOCK_ERROR_MARKERS = ("database is locked", "lock wait timeout", "deadlock")
+WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+class DatabaseMetrics:
+    """
+    Per-process statement timings collected from engine events: counts,
+    latency percentiles for reads and writes, slow writes (likely lock
+    waits) and lock errors. Each gunicorn worker keeps its own counters.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.samples = {"read": deque(maxlen=DB_METRICS_SAMPLES), "write": deque(maxlen=DB_METRICS_SAMPLES)}
+        self.counts = {"read": 0, "write": 0}
+        self.total_ms = {"read": 0.0, "write": 0.0}
+        self.slow_writes = 0
+        self.slow_write_ms = 0.0
+        self.lock_errors = 0
+
+    def install(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started")
+        if not started:
+            return
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+        kind = "write" if statement.lstrip()[:7].upper().startswith(WRITE_VERBS) else "read"
+        with self._lock:
+            self.counts[kind] += 1
+            self.total_ms[kind] += elapsed_ms
+            self.samples[kind].append(elapsed_ms)
+            if kind == "write" and elapsed_ms >= DB_LOCK_WAIT_MS:
+                self.slow_writes += 1
+                self.slow_write_ms += elapsed_ms
+
+    def _error(self, context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+        message = str(context.original_exception).lower()
+        if any(marker in message for marker in LOCK_ERROR_MARKERS):
+            with self._lock:
+                self.lock_errors += 1
+
+    def snapshot(self) -> Dict:
+        statements = {}
+        with self._lock:
+            for kind, samples in self.samples.items():
+                ordered = sorted(samples)
+                pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else None
+                statements[kind] = {
+                    "count": self.counts[kind],
+                    "total_ms": round(self.total_ms[kind], 1),
+                    "p50_ms": pick(0.50),
+                    "p95_ms": pick(0.95),
+                    "p99_ms": pick(0.99),
+                    "max_ms": round(ordered[-1], 2) if ordered else None,
+                }
+            return {
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "statements": statements,
+                "slow_writes": self.slow_writes,
+                "slow_write_ms": round(self.slow_write_ms, 1),
+                "lock_wait_threshold_ms": DB_LOCK_WAIT_MS,
+                "lock_errors": self.lock_errors,
+            }
+
+def server_lock_stats(db: Session) -> Optional[Dict]:
+    """Lock counters kept by the database server itself (MySQL/InnoDB and PostgreSQL only)."""
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect == "mysql":
+            rows = db.execute(text(
+                "SHOW GLOBAL STATUS WHERE Variable_name IN "
+                "('Innodb_row_lock_waits', 'Innodb_row_lock_time', 'Innodb_row_lock_current_waits')"
+            ))
+            return {name: int(value) for name, value in rows}
+        if dialect == "postgresql":
+            waiting = db.execute(text("SELECT count(*) FROM pg_locks WHERE NOT granted")).scalar()
+            deadlocks = db.execute(text(
+                "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+            )).scalar()
+            return {"waiting_locks": waiting, "deadlocks": deadlocks}
+    except Exception as e:
+        return {"error": str(e)}
+    return None
+
+db_metrics = DatabaseMetrics()
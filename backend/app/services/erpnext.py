@@ -1,9 +1,33 @@
-import requests
 import os
+import datetime
+from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from .. import models
+from .events import event_bus
+from .changes import record_tombstones
+from .archive import archived_po_numbers
+from .erpnext_client import ERPNextClient
+from .profiling import phase
+from .item_master import resolve_dimensions, fill_missing_dimensions, upsert_item_master
 import json
 
+# Custom field holding per-unit CBM on ERPNext Item / PO Item (set empty if there is none)
+ITEM_CBM_FIELD = os.getenv("ERPNEXT_ITEM_CBM_FIELD", "custom_cbm_per_unit")
+# Purchase Order list page size for the reconciliation pass, which walks every page
+ERPNEXT_LIST_PAGE_SIZE = int(os.getenv("ERPNEXT_LIST_PAGE_SIZE", "500"))
+
+def _parse_date(value):
+    """ERPNext sends dates as 'YYYY-MM-DD' strings; Date columns need date objects on SQLite."""
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
 class ERPNextService:
     def __init__(self):
         # Clean credentials by stripping any accidental whitespace or newlines
@@ -15,6 +39,7 @@ class ERPNextService:
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        self.client = ERPNextClient()
 
     def fetch_purchase_orders(self, db: Session):
         if not self.url or not self.api_key or not self.api_secret:
@@ -24,88 +49,195 @@ class ERPNextService:
         # Filter for Status = drafted or submitted depending on your flow
         endpoint = f"{self.url}/api/resource/Purchase Order"
         params = {
-            "fields": '["name", "transaction_date", "supplier", "status"]',
+            "fields": '["name", "transaction_date", "supplier", "status", "modified"]',
             "filters": '[["status", "!=", "Closed"], ["status", "!=", "Cancelled"]]',
-            "limit_page_length": 50
+            # A fixed order keeps pages from overlapping or skipping POs
+            "order_by": "name asc",
+            "limit_page_length": ERPNEXT_LIST_PAGE_SIZE
         }
 
         try:
-            response = requests.get(endpoint, headers=self.headers, params=params, timeout=10)
-            response.raise_for_status()
-            pos_data = response.json().get("data", [])
+            pos_data = []
+            with phase("list"):
+                while True:
+                    response = self.client.get("list", endpoint, headers=self.headers,
+                                               params={**params, "limit_start": len(pos_data)})
+                    response.raise_for_status()
+                    page = response.json().get("data", [])
+                    pos_data.extend(page)
+                    if len(page) < ERPNEXT_LIST_PAGE_SIZE:
+                        break
 
-            synced_count = 0
-            for po in pos_data:
-                # Fetch detailed items for this PO
-                items_endpoint = f"{self.url}/api/resource/Purchase Order/{po['name']}"
-                item_res = requests.get(items_endpoint, headers=self.headers, timeout=10)
-                item_res.raise_for_status()
-                po_detail = item_res.json().get("data", {})
-
-                # Check if PO already exists in our database
-                db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == po['name']).first()
-                
-                if db_po:
-                    # Update existing PO header
-                    db_po.order_date = po_detail.get('transaction_date')
-                    db_po.supplier_name = po_detail.get('supplier')
-                    db_po.drop_location = po_detail.get('shipping_address_name', '').split('-')[-1].strip() or po_detail.get('ship_to_name', '').split('-')[-1].strip() or po_detail.get('custom_region') or "Destination Warehouse"
-                    db_po.location = po_detail.get('supplier_address_name', '').split('-')[-1].strip() or po_detail.get('supplier_address', '').split('-')[0].strip() or po_detail.get('place_of_supply', '').split('-')[-1].strip() or "Origin Facility"
-                    # Clear existing items to re-sync fresh ones
-                    db.query(models.Item).filter(models.Item.po_id == db_po.id).delete()
-                else:
-                    db_po = models.PurchaseOrder(
-                        po_number=po['name'],
-                        order_date=po_detail.get('transaction_date'),
-                        supplier_name=po_detail.get('supplier'),
-                        drop_location=(
-                            po_detail.get('shipping_address_name', '').split('-')[-1].strip() or 
-                            po_detail.get('ship_to_name', '').split('-')[-1].strip() or
-                            po_detail.get('custom_region') or
-                            "Destination Warehouse"
-                        ),
-                        location=(
-                            po_detail.get('supplier_address_name', '').split('-')[-1].strip() or 
-                            po_detail.get('supplier_address', '').split('-')[0].strip() or
-                            po_detail.get('place_of_supply', '').split('-')[-1].strip() or
-                            "Origin Facility"
-                        )
-                    )
-                    db.add(db_po)
-                
-                db.flush()
-
-                # Add Items
-                for item in po_detail.get('items', []):
-                    # Use Pending Qty if available (typical for Genesis), otherwise fallback to Qty
-                    item_qty = item.get('pending_qty') or item.get('qty') or 0
-                    
-                    # Skip if nothing is pending
-                    if item_qty <= 0:
-                        continue
+            # Archived POs are finished in the portal, whatever ERPNext still lists
+            archived = archived_po_numbers(db, [po['name'] for po in pos_data])
+            pos_data = [po for po in pos_data if po['name'] not in archived]
+
+            # Only POs whose ERPNext `modified` stamp moved since we stored them need their details
+            names = [po['name'] for po in pos_data]
+            known = {}
+            for i in range(0, len(names), ERPNEXT_LIST_PAGE_SIZE):
+                known.update(
+                    db.query(models.PurchaseOrder.po_number, models.PurchaseOrder.erpnext_modified)
+                    .filter(models.PurchaseOrder.po_number.in_(names[i:i + ERPNEXT_LIST_PAGE_SIZE]))
+                )
+            changed = [po for po in pos_data if not po.get('modified') or known.get(po['name']) != po['modified']]
+
+            # Fetch detailed items for every PO first, so item dimensions resolve in one batch
+            details = []
+            with phase("details"):
+                for po in changed:
+                    details.append(self.fetch_purchase_order(po['name']))
 
-                    db_item = models.Item(
-                        item_code=item.get('item_code'),
-                        item_name=item.get('item_name'),
-                        item_group=item.get('item_group'),
-                        hsn_code=item.get('gst_hsn_code'),
-                        uom=item.get('uom'),
-                        quantity=item_qty,
-                        rate=item.get('rate'),
-                        weight_per_unit=item.get('weight_per_unit', 0),
-                        cbm_per_unit=item.get('cbm_per_unit', 0),
-                        po_id=db_po.id
-                    )
-                    db.add(db_item)
-                
+            with phase("item-master"):
+                self.sync_item_master(db, details)
                 db.commit()
-                synced_count += 1
 
-            return {"message": f"Successfully synced {synced_count} new Purchase Orders"}
+            synced_count = 0
+            with phase("writes"):
+                for po_detail in details:
+                    if self.upsert_purchase_order(db, po_detail) is None:
+                        continue
+                    db.commit()
+                    synced_count += 1
+
+            event_bus.publish(db, "sync.finished", synced=synced_count)
+            return {
+                "message": f"Successfully synced {synced_count} new Purchase Orders",
+                "unchanged": len(pos_data) - len(changed),
+                "archived": len(archived),
+            }
 
         except Exception as e:
             return {"error": str(e)}
 
+    def fetch_purchase_order(self, po_number: str) -> dict:
+        """The full Purchase Order document with its items. Raises on HTTP errors (404 for deleted POs)."""
+        response = self.client.get("detail", f"{self.url}/api/resource/Purchase Order/{po_number}", headers=self.headers)
+        response.raise_for_status()
+        return response.json().get("data", {})
+
+    def upsert_purchase_order(self, db: Session, po_detail: dict) -> Optional[models.PurchaseOrder]:
+        """
+        Creates or refreshes the local PO (header and items) from an ERPNext
+        document. Returns None, and changes nothing, for a PO already archived.
+        Does not commit.
+        """
+        # Check if PO already exists in our database
+        db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == po_detail['name']).first()
+        if db_po is None and archived_po_numbers(db, [po_detail['name']]):
+            return None
+
+        if db_po:
+            # Update existing PO header
+            db_po.order_date = _parse_date(po_detail.get('transaction_date'))
+            db_po.supplier_name = po_detail.get('supplier')
+            db_po.drop_location = po_detail.get('shipping_address_name', '').split('-')[-1].strip() or po_detail.get('ship_to_name', '').split('-')[-1].strip() or po_detail.get('custom_region') or "Destination Warehouse"
+            db_po.location = po_detail.get('supplier_address_name', '').split('-')[-1].strip() or po_detail.get('supplier_address', '').split('-')[0].strip() or po_detail.get('place_of_supply', '').split('-')[-1].strip() or "Origin Facility"
+            db_po.updated_at = datetime.datetime.utcnow()
+            # Clear existing items to re-sync fresh ones
+            record_tombstones(db, "item", select(models.Item.id).where(models.Item.po_id == db_po.id))
+            db.query(models.Item).filter(models.Item.po_id == db_po.id).delete()
+        else:
+            db_po = models.PurchaseOrder(
+                po_number=po_detail['name'],
+                order_date=_parse_date(po_detail.get('transaction_date')),
+                supplier_name=po_detail.get('supplier'),
+                drop_location=(
+                    po_detail.get('shipping_address_name', '').split('-')[-1].strip() or 
+                    po_detail.get('ship_to_name', '').split('-')[-1].strip() or
+                    po_detail.get('custom_region') or
+                    "Destination Warehouse"
+                ),
+                location=(
+                    po_detail.get('supplier_address_name', '').split('-')[-1].strip() or 
+                    po_detail.get('supplier_address', '').split('-')[0].strip() or
+                    po_detail.get('place_of_supply', '').split('-')[-1].strip() or
+                    "Origin Facility"
+                )
+            )
+            db.add(db_po)
+        # ERPNext's "Required By" seeds the due date; later changes go through the
+        # portal's counted date-change flow, so a set date is not overwritten
+        if db_po.expected_delivery_date is None:
+            db_po.expected_delivery_date = _parse_date(po_detail.get('schedule_date'))
+        db_po.erpnext_modified = po_detail.get('modified')
+
+        db.flush()
+
+        # Add Items
+        new_items = []
+        for item in po_detail.get('items', []):
+            # Use Pending Qty if available (typical for Genesis), otherwise fallback to Qty
+            item_qty = item.get('pending_qty') or item.get('qty') or 0
+
+            # Skip if nothing is pending
+            if item_qty <= 0:
+                continue
+
+            db_item = models.Item(
+                item_code=item.get('item_code'),
+                item_name=item.get('item_name'),
+                item_group=item.get('item_group'),
+                hsn_code=item.get('gst_hsn_code'),
+                uom=item.get('uom'),
+                quantity=item_qty,
+                rate=item.get('rate'),
+                weight_per_unit=item.get('weight_per_unit') or 0,
+                cbm_per_unit=item.get('cbm_per_unit') or item.get(ITEM_CBM_FIELD) or 0,
+                po_id=db_po.id
+            )
+            new_items.append(db_item)
+
+        fill_missing_dimensions(db, new_items)
+        db.add_all(new_items)
+        return db_po
+
+    def sync_item_master(self, db: Session, po_details: list):
+        """
+        Updates the item master for every SKU on the fetched POs: from the PO
+        lines where they carry dimensions, and from one batched Item query for
+        SKUs we still know nothing about. Does not commit.
+        """
+        records = []
+        codes = set()
+        for po_detail in po_details:
+            for item in po_detail.get('items', []):
+                if not item.get('item_code'):
+                    continue
+                codes.add(item['item_code'])
+                if item.get('weight_per_unit') or item.get(ITEM_CBM_FIELD):
+                    records.append({
+                        "item_code": item['item_code'],
+                        "item_name": item.get('item_name'),
+                        "weight_per_unit": item.get('weight_per_unit'),
+                        "cbm_per_unit": item.get(ITEM_CBM_FIELD),
+                    })
+        upsert_item_master(db, records, "erpnext")
+
+        unknown = sorted(codes - set(resolve_dimensions(db, codes)))
+        fields = ["item_code", "item_name", "weight_per_unit"] + ([ITEM_CBM_FIELD] if ITEM_CBM_FIELD else [])
+        for i in range(0, len(unknown), 100):
+            chunk = unknown[i:i + 100]
+            try:
+                response = self.client.get("list", f"{self.url}/api/resource/Item", headers=self.headers, params={
+                    "fields": json.dumps(fields),
+                    "filters": json.dumps([["item_code", "in", chunk]]),
+                    "limit_page_length": len(chunk)
+                })
+                response.raise_for_status()
+            except Exception as e:
+                print(f"ERPNext Item Master Fetch Error: {e}")
+                break
+            upsert_item_master(db, [
+                {
+                    "item_code": row.get('item_code'),
+                    "item_name": row.get('item_name'),
+                    "weight_per_unit": row.get('weight_per_unit'),
+                    "cbm_per_unit": row.get(ITEM_CBM_FIELD),
+                }
+                for row in response.json().get("data", [])
+            ], "erpnext")
+
     def update_purchase_order_status(self, po_number: str, status: str):
         if not self.url or not self.api_key or not self.api_secret:
             return {"error": "ERPNext credentials not configured"}
@@ -127,7 +259,7 @@ class ERPNextService:
                     "fieldname": fieldname,
                     "value": status
                 }
-                response = requests.post(set_val_endpoint, headers=self.headers, json=payload, timeout=5)
+                response = self.client.post("method", set_val_endpoint, headers=self.headers, json=payload)
                 if response.status_code == 200:
                     break  # Success, stop trying other field names
             else:
@@ -140,7 +272,7 @@ class ERPNextService:
                 "dn": po_number,
                 "tag": f"Portal-{status.replace(' ', '-')}"
             }
-            requests.post(tag_endpoint, headers=self.headers, json=tag_payload, timeout=5)
+            self.client.post("method", tag_endpoint, headers=self.headers, json=tag_payload)
 
             # 3. Add a comment for the history timeline
             comment_endpoint = f"{self.url}/api/method/frappe.desk.form.utils.add_comment"
@@ -151,7 +283,7 @@ class ERPNextService:
                 "comment_email": "sync-service@prior1ty.com",
                 "comment_by": "Prior1ty Sync"
             }
-            requests.post(comment_endpoint, headers=self.headers, json=comment_payload, timeout=5)
+            self.client.post("method", comment_endpoint, headers=self.headers, json=comment_payload)
             
             return {"message": f"Successfully updated ERPNext for {po_number}"}
         except Exception as e:
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import deque
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl  # Shares the rate limit between gunicorn workers on the same host
+except ImportError:  # Windows development: the limit is per process
+    fcntl = None
+
+# Read timeout (seconds) per kind of ERPNext call
+DEFAULT_TIMEOUTS = {"list": 10, "detail": 10, "method": 5}
+CONNECT_TIMEOUT = float(os.getenv("ERPNEXT_CONNECT_TIMEOUT", "3"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling ERPNext while the breaker is open."""
+
+class RateLimitTimeout(Exception):
+    """Raised when no rate-limit token frees up within the allowed wait."""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `recovery_seconds`; then lets a single probe through (half-open) and closes
+    again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_seconds:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Gives back a half-open probe slot that ended without reaching ERPNext."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = max(0.0, round(self.recovery_seconds - (time.monotonic() - self.opened_at), 1))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+                "retry_in_seconds": retry_in,
+            }
+
+class TokenBucket:
+    """
+    Token bucket whose state lives in a small file guarded by flock, so all
+    workers on the host draw from the same budget.
+    """
+
+    def __init__(self, rate: float, capacity: float, path: str):
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Takes a token if one is available; otherwise returns seconds until the next one."""
+        with self._lock, open(self.path, "a+") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                tokens = state.get("tokens", self.capacity)
+                tokens = min(self.capacity, tokens + (now - state.get("updated", now)) * self.rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now}))
+                return wait
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, max_wait: float):
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"ERPNext rate limit: no token within {max_wait}s")
+            time.sleep(wait)
+
+    def available(self) -> Optional[float]:
+        try:
+            with open(self.path) as f:
+                state = json.loads(f.read() or "{}")
+        except (OSError, ValueError):
+            return self.capacity
+        tokens = state.get("tokens", self.capacity) + (time.time() - state.get("updated", time.time())) * self.rate
+        return round(min(self.capacity, tokens), 2)
+
+class ERPNextClient:
+    """Single entry point for HTTP calls to ERPNext: pooled, rate limited and circuit broken."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(os.getenv("ERPNEXT_POOL_SIZE", "10")), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.timeouts = {
+            kind: float(os.getenv(f"ERPNEXT_TIMEOUT_{kind.upper()}", default))
+            for kind, default in DEFAULT_TIMEOUTS.items()
+        }
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("ERPNEXT_BREAKER_FAILURES", "5")),
+            recovery_seconds=float(os.getenv("ERPNEXT_BREAKER_RECOVERY_SECONDS", "30")),
+        )
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv("ERPNEXT_RATE_LIMIT", "5")),
+            capacity=float(os.getenv("ERPNEXT_RATE_BURST", "10")),
+            path=os.getenv("ERPNEXT_RATE_LIMIT_FILE") or os.path.join(tempfile.gettempdir(), "erpnext_rate_limit.json"),
+        )
+        self.max_queue_wait = float(os.getenv("ERPNEXT_RATE_MAX_WAIT", "5"))
+        self._latencies = {kind: deque(maxlen=200) for kind in self.timeouts}
+        self._counts = {kind: {"ok": 0, "failed": 0} for kind in self.timeouts}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, kind: str, url: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError("ERPNext circuit breaker is open; skipping call")
+        try:
+            self.rate_limiter.acquire(self.max_queue_wait)
+        except RateLimitTimeout:
+            self.breaker.release()
+            raise
+
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=(CONNECT_TIMEOUT, self.timeouts[kind]), **kwargs)
+        except requests.RequestException:
+            self._record(kind, started, ok=False)
+            raise
+        # 4xx means ERPNext is up and answered; only server errors trip the breaker
+        self._record(kind, started, ok=response.status_code < 500)
+        return response
+
+    def get(self, kind: str, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", kind, url, **kwargs)
+
+    def post(self, kind: str, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", kind, url, **kwargs)
+
+    def _record(self, kind: str, started: float, ok: bool):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._latencies[kind].append(elapsed_ms)
+            self._counts[kind]["ok" if ok else "failed"] += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def stats(self) -> Dict:
+        endpoints = {}
+        with self._lock:
+            for kind, samples in self._latencies.items():
+                ordered = sorted(samples)
+                pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+                endpoints[kind] = {
+                    **self._counts[kind],
+                    "timeout_seconds": self.timeouts[kind],
+                    "p50_ms": pick(0.50),
+                    "p95_ms": pick(0.95),
+                    "max_ms": round(ordered[-1], 1) if ordered else None,
+                }
+        return {
+            "breaker": self.breaker.snapshot(),
+            "rate_limit": {
+                "per_second": self.rate_limiter.rate,
+                "burst": self.rate_limiter.capacity,
+                "tokens_available": self.rate_limiter.available(),
+                "shared_across_workers": fcntl is not None,
+            },
+            "endpoints": endpoints,
+        }
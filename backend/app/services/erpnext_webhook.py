@@ -0,0 +1,204 @@
+import os
+import hmac
+import json
+import uuid
+import base64
+import hashlib
+import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+import requests
+from sqlalchemy import or_, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+from .events import event_bus
+from .erpnext import erpnext_service
+
+# "Webhook Secret" of the Frappe Webhook documents; webhooks are refused while unset
+ERPNEXT_WEBHOOK_SECRET = (os.getenv("ERPNEXT_WEBHOOK_SECRET") or "").strip()
+# Polling becomes a reconciliation pass for missed webhooks once they are configured
+ERPNEXT_RECONCILE_MINUTES = int(os.getenv("ERPNEXT_RECONCILE_MINUTES", "60" if ERPNEXT_WEBHOOK_SECRET else "10"))
+# Events for one PO within this window are fetched once
+ERPNEXT_WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("ERPNEXT_WEBHOOK_DEBOUNCE_SECONDS", "3"))
+ERPNEXT_WEBHOOK_DRAIN_SECONDS = int(os.getenv("ERPNEXT_WEBHOOK_DRAIN_SECONDS", "5"))
+ERPNEXT_WEBHOOK_BATCH_SIZE = int(os.getenv("ERPNEXT_WEBHOOK_BATCH_SIZE", "50"))
+ERPNEXT_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("ERPNEXT_WEBHOOK_MAX_ATTEMPTS", "5"))
+# A claim older than this belongs to a worker that died mid-batch
+CLAIM_TIMEOUT_SECONDS = 300
+
+# Frappe doc events that take the PO out of the portal's open set
+REMOVAL_EVENTS = {"on_cancel", "on_trash", "cancel", "delete"}
+CLOSED_STATUSES = {"Closed", "Cancelled"}
+
+# Identifies this process's claims in the shared queue table
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+def verify_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Frappe signs the raw request body: base64(HMAC-SHA256(webhook secret, body))."""
+    if not ERPNEXT_WEBHOOK_SECRET or not signature:
+        return False
+    expected = base64.b64encode(hmac.new(ERPNEXT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).digest()).decode()
+    return hmac.compare_digest(expected, signature.strip())
+
+def parse_payload(body: bytes, event: Optional[str] = None) -> Optional[Dict]:
+    """
+    Reads the PO name and event from a webhook body, sent either as JSON or
+    form-encoded (both Frappe request structures), with the document fields at
+    the top level or under "doc". `event` (a query parameter on the webhook
+    URL) wins over the body; a submitted-then-cancelled docstatus counts as a
+    cancel. Returns None when there is no document name.
+    """
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = {k: v[-1] for k, v in parse_qs(body.decode("utf-8", "replace")).items()}
+    if not isinstance(data, dict):
+        return None
+    doc = data.get("doc") if isinstance(data.get("doc"), dict) else data
+    name = doc.get("name")
+    if not name:
+        return None
+    event = event or data.get("event") or data.get("doc_event")
+    if not event:
+        event = "on_cancel" if str(doc.get("docstatus")) == "2" else "on_update"
+    return {"doctype": doc.get("doctype") or data.get("doctype") or "Purchase Order", "name": str(name), "event": event}
+
+def enqueue_po(db: Session, po_number: str, event: str) -> models.ERPNextWebhookQueue:
+    """
+    Queues one PO for fetching. Further events for the same PO update the
+    existing row and push its debounce window back, so a burst of saves costs
+    one ERPNext request.
+    """
+    now = datetime.datetime.utcnow()
+    available_at = now + datetime.timedelta(seconds=ERPNEXT_WEBHOOK_DEBOUNCE_SECONDS)
+    queue = models.ERPNextWebhookQueue
+    for _ in range(2):
+        row = db.query(queue).filter(queue.po_number == po_number).first()
+        if row:
+            row.event = event
+            # In SQL, so two workers recording events at once both count
+            row.version = queue.version + 1
+            row.available_at = available_at
+            row.attempts = 0
+            db.commit()
+            return row
+        row = queue(po_number=po_number, event=event, received_at=now, available_at=available_at)
+        db.add(row)
+        try:
+            db.commit()
+            return row
+        except IntegrityError:
+            # Another worker queued the same PO a moment ago; update that row instead
+            db.rollback()
+    raise RuntimeError(f"Could not queue {po_number}")
+
+def claim_due(db: Session, limit: int = ERPNEXT_WEBHOOK_BATCH_SIZE) -> List[models.ERPNextWebhookQueue]:
+    """
+    Claims up to `limit` rows whose debounce window has passed. Each claim is
+    a conditional UPDATE, so when every gunicorn worker's scheduler drains at
+    once, a row still goes to exactly one of them.
+    """
+    queue = models.ERPNextWebhookQueue
+    now = datetime.datetime.utcnow()
+    claimable = or_(queue.claimed_at.is_(None), queue.claimed_at < now - datetime.timedelta(seconds=CLAIM_TIMEOUT_SECONDS))
+    candidates = [
+        row[0] for row in
+        db.query(queue.id).filter(queue.available_at <= now, claimable).order_by(queue.available_at).limit(limit)
+    ]
+    claimed = []
+    for row_id in candidates:
+        result = db.execute(
+            update(queue)
+            .where(queue.id == row_id, claimable)
+            .values(claimed_by=_worker_id, claimed_at=now)
+        )
+        if result.rowcount:
+            claimed.append(row_id)
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(queue).filter(queue.id.in_(claimed), queue.claimed_by == _worker_id).order_by(queue.id).all()
+
+def _cancel_local(db: Session, po_number: str) -> Optional[int]:
+    db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == po_number).first()
+    if not db_po or db_po.status == "Cancelled":
+        return None
+    db_po.status = "Cancelled"
+    db_po.updated_at = datetime.datetime.utcnow()
+    return db_po.id
+
+def process_entry(db: Session, entry: models.ERPNextWebhookQueue) -> Dict:
+    """Fetches and upserts the one PO behind a queue row. Does not commit."""
+    if entry.event in REMOVAL_EVENTS:
+        return {"cancelled": _cancel_local(db, entry.po_number)}
+    try:
+        po_detail = erpnext_service.fetch_purchase_order(entry.po_number)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return {"cancelled": _cancel_local(db, entry.po_number)}
+        raise
+    if po_detail.get("docstatus") == 2 or po_detail.get("status") in CLOSED_STATUSES:
+        return {"cancelled": _cancel_local(db, entry.po_number)}
+
+    db_po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == entry.po_number).first()
+    if db_po and po_detail.get("modified") and db_po.erpnext_modified == po_detail["modified"]:
+        return {"unchanged": db_po.id}
+    created = db_po is None
+    erpnext_service.sync_item_master(db, [po_detail])
+    db_po = erpnext_service.upsert_purchase_order(db, po_detail)
+    if db_po is None:
+        return {"archived": None}
+    return {"created" if created else "updated": db_po.id}
+
+def drain_webhook_queue(db: Session) -> Dict[str, int]:
+    """Processes the due queue rows this worker manages to claim and publishes one event per kind."""
+    if not erpnext_service.url or not erpnext_service.api_key or not erpnext_service.api_secret:
+        return {"processed": 0, "failed": 0}
+    queue = models.ERPNextWebhookQueue
+    changed = {"created": [], "updated": [], "cancelled": []}
+    processed = failed = 0
+    for entry in claim_due(db):
+        row_id, version = entry.id, entry.version
+        try:
+            outcome = process_entry(db, entry)
+            # Delete only if no new event arrived while we were fetching; otherwise it runs again
+            db.execute(delete(queue).where(queue.id == row_id, queue.version == version))
+            db.execute(update(queue).where(queue.id == row_id).values(claimed_by=None, claimed_at=None))
+            db.commit()
+            processed += 1
+            for kind, po_id in outcome.items():
+                if kind in changed and po_id:
+                    changed[kind].append(po_id)
+        except Exception as e:
+            db.rollback()
+            failed += 1
+            entry = db.get(queue, row_id)
+            if entry is None:
+                continue
+            entry.attempts = (entry.attempts or 0) + 1
+            entry.last_error = str(e)[:1000]
+            entry.claimed_by = entry.claimed_at = None
+            if entry.attempts >= ERPNEXT_WEBHOOK_MAX_ATTEMPTS:
+                # The reconciliation pass picks the PO up later
+                print(f"ERPNext Webhook: giving up on {entry.po_number}: {e}")
+                db.delete(entry)
+            else:
+                entry.available_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=30 * 2 ** entry.attempts)
+            db.commit()
+
+    if changed["created"]:
+        event_bus.publish(db, "po.created", ids=changed["created"])
+    if changed["updated"] or changed["cancelled"]:
+        event_bus.publish(db, "po.updated", ids=changed["updated"] + changed["cancelled"])
+    return {"processed": processed, "failed": failed}
+
+def queue_stats(db: Session) -> Dict:
+    queue = models.ERPNextWebhookQueue
+    now = datetime.datetime.utcnow()
+    return {
+        "queued": db.query(queue).count(),
+        "due": db.query(queue).filter(queue.available_at <= now).count(),
+        "claimed": db.query(queue).filter(queue.claimed_at.is_not(None)).count(),
+        "retrying": db.query(queue).filter(queue.attempts > 0).count(),
+    }
@@ -0,0 +1,211 @@
+import os
+import json
+import asyncio
+import datetime
+import threading
+import itertools
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .. import models
+from ..database import SessionLocal
+
+# "db" fans out across gunicorn workers by polling the change_events table.
+# "local" is an in-process broker stand-in (single worker / development).
+EVENT_BROKER = os.getenv("EVENT_BROKER", "db")
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "1"))
+EVENT_RETENTION_MINUTES = int(os.getenv("EVENT_RETENTION_MINUTES", "60"))
+EVENT_HEARTBEAT_SECONDS = 15
+# Postgres/MySQL hand out ids before commit, so a lower id can commit after a higher one
+# has been seen; skipped ids are re-checked for this long
+EVENT_LATE_COMMIT_SECONDS = float(os.getenv("EVENT_LATE_COMMIT_SECONDS", "30"))
+MAX_TRACKED_GAPS = 1000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Any of these can change the open-PO set, so they also invalidate the optimization plan
+OPTIMIZATION_INPUTS = {"po.created", "po.updated", "po.deleted", "shipment.created", "sync.finished", "fleet.updated"}
+
+class DatabaseBroker:
+    """Events are rows in change_events; each worker polls for ids above the last one it saw."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, db: Session, events: List[Dict]) -> List[Dict]:
+        rows = [models.ChangeEvent(event_type=e["type"], payload=json.dumps(e["data"])) for e in events]
+        db.add_all(rows)
+        db.commit()
+        # Delivered by the poller, in every worker including this one
+        return []
+
+    @staticmethod
+    def _read(*criteria, limit: int = 500) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.ChangeEvent)
+                .filter(*criteria)
+                .order_by(models.ChangeEvent.id)
+                .limit(limit)
+                .all()
+            )
+            return [{"id": r.id, "type": r.event_type, "data": json.loads(r.payload or "{}")} for r in rows]
+        finally:
+            db.close()
+
+    def backlog(self, after_id: int, limit: int = 500) -> List[Dict]:
+        return self._read(models.ChangeEvent.id > after_id, limit=limit)
+
+    def last_id(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.max(models.ChangeEvent.id)).scalar() or 0
+        finally:
+            db.close()
+
+    def start(self, deliver):
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._poll, args=(deliver,), daemon=True)
+            self._thread.start()
+
+    def _poll(self, deliver):
+        last_seen = self.last_id()
+        gaps = {}  # Skipped id -> when it was skipped
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                now = time.monotonic()
+                if gaps:
+                    for event in self._read(models.ChangeEvent.id.in_(list(gaps)), limit=len(gaps)):
+                        del gaps[event["id"]]
+                        deliver({**event, "late": True})
+                    for gap_id, skipped_at in list(gaps.items()):
+                        # Rolled back, or committed too late to matter
+                        if now - skipped_at > EVENT_LATE_COMMIT_SECONDS:
+                            del gaps[gap_id]
+                for event in self.backlog(last_seen):
+                    for gap_id in range(max(last_seen + 1, event["id"] - MAX_TRACKED_GAPS), event["id"]):
+                        gaps[gap_id] = now
+                    last_seen = event["id"]
+                    deliver(event)
+            except Exception as e:
+                print(f"Event Poll Error: {e}")
+
+class LocalBroker:
+    """In-process stand-in for an external pub/sub broker: delivers synchronously on publish."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def publish(self, db: Session, events: List[Dict]) -> List[Dict]:
+        with self._lock:
+            published = [{"id": next(self._ids), **e} for e in events]
+            self._recent = (self._recent + published)[-SUBSCRIBER_QUEUE_SIZE:]
+        return published
+
+    def backlog(self, after_id: int, limit: int = 500) -> List[Dict]:
+        with self._lock:
+            return [e for e in self._recent if e["id"] > after_id][:limit]
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._recent[-1]["id"] if self._recent else 0
+
+    def start(self, deliver):
+        pass  # publish() hands events straight to the bus
+
+class EventBus:
+    def __init__(self, broker):
+        self.broker = broker
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, db: Session, event_type: str, **data):
+        """Records a compact change event, e.g. publish(db, "po.updated", ids=[1, 2])."""
+        events = [{"type": event_type, "data": data}]
+        if event_type in OPTIMIZATION_INPUTS:
+            events.append({"type": "optimization.changed", "data": {}})
+        try:
+            for event in self.broker.publish(db, events):
+                self._deliver(event)
+        except Exception as e:
+            # Events are a refresh hint; never fail the write that triggered them
+            db.rollback()
+            print(f"Event Publish Error: {e}")
+
+    def _deliver(self, event: Dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Dict):
+        if queue.full():
+            # Slow client: drop what it has not read and tell it to refetch everything
+            while not queue.empty():
+                queue.get_nowait()
+            event = {"id": event["id"], "type": "resync", "data": {}}
+        queue.put_nowait(event)
+
+    def prune(self, db: Session) -> int:
+        if not isinstance(self.broker, DatabaseBroker):
+            return 0
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(minutes=EVENT_RETENTION_MINUTES)
+        # The newest row always stays, so ids keep climbing even on tables created before AUTOINCREMENT
+        newest = db.query(func.max(models.ChangeEvent.id)).scalar() or 0
+        deleted = (
+            db.query(models.ChangeEvent)
+            .filter(models.ChangeEvent.created_at < cutoff, models.ChangeEvent.id < newest)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+
+    async def stream(self, request, last_event_id: Optional[int] = None):
+        """Server-sent events for one client; resumes after Last-Event-ID when given."""
+        self.broker.start(self._deliver)
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield f"retry: {int(EVENT_POLL_SECONDS * 1000) + 2000}\n\n"
+            replayed = set()
+            if last_event_id is None:
+                sent = await run_in_threadpool(self.broker.last_id)
+            else:
+                sent = last_event_id
+                for event in await run_in_threadpool(self.broker.backlog, last_event_id):
+                    sent = event["id"]
+                    replayed.add(sent)
+                    yield self._format(event)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                # Late commits arrive below ids already sent and still go out once
+                if event["id"] in replayed or (event["id"] <= sent and event["type"] != "resync" and not event.get("late")):
+                    continue
+                sent = max(sent, event["id"])
+                yield self._format(event)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    @staticmethod
+    def _format(event: Dict) -> str:
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+event_bus = EventBus(LocalBroker() if EVENT_BROKER == "local" else DatabaseBroker(EVENT_POLL_SECONDS))
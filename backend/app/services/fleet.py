@@ -0,0 +1,262 @@
+import os
+import math
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+from .optimization import VEHICLE_CLASSES
+
+# Rough INR per km for the seeded catalog; edit through PUT /api/fleet
+DEFAULT_COST_PER_KM = {
+    "Tata Ace (1.5T)": 14,
+    "Pickup / Bolero": 18,
+    "17ft HB Truck": 32,
+    "19ft Container": 42,
+    "Tauras 22ft": 55,
+    "Multi-Axle / 32ft MX": 70,
+}
+FLEET_ASSIGN_TIME_BUDGET = float(os.getenv("FLEET_ASSIGN_TIME_BUDGET", "0.5"))
+# A lane is never split over more vehicles than this
+MAX_VEHICLES_PER_LANE = 20
+# Status of a plan that got no vehicle; such plans cannot become shipments
+AWAITING_VEHICLE = "Awaiting Vehicle"
+
+FleetClass = namedtuple("FleetClass", ["name", "max_weight", "max_cbm", "cost_per_km", "available"])
+# One way to carry a lane: `count` vehicles of class `vehicle` (an index into the catalog)
+Option = namedtuple("Option", ["cost", "count", "vehicle"])
+
+def seed_fleet(db: Session):
+    """Creates the catalog from VEHICLE_CLASSES with no availability limit, if it is empty."""
+    if db.query(models.FleetVehicle).count():
+        return
+    db.add_all([
+        models.FleetVehicle(name=name, max_weight=max_weight, max_cbm=max_cbm,
+                            cost_per_km=DEFAULT_COST_PER_KM.get(name, 0.0), daily_available=None)
+        for name, max_weight, max_cbm in VEHICLE_CLASSES
+    ])
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker seeded it first
+        db.rollback()
+
+def load_fleet(db: Session) -> List[FleetClass]:
+    return [
+        FleetClass(v.name, v.max_weight, v.max_cbm, v.cost_per_km or 0.0, v.daily_available)
+        for v in db.query(models.FleetVehicle).order_by(models.FleetVehicle.max_cbm, models.FleetVehicle.max_weight)
+    ]
+
+def vehicle_classes(fleet: List[FleetClass]) -> List[tuple]:
+    """The catalog in the (name, max weight, max CBM) form the planners take, smallest first."""
+    return [(v.name, v.max_weight, v.max_cbm) for v in sorted(fleet, key=lambda v: (v.max_cbm, v.max_weight, v.name))]
+
+def committed_vehicles(db: Session, dispatch_dates: Iterable[date]) -> Dict[Tuple[date, str], int]:
+    """Vehicles per (dispatch date, class name) already taken by created shipments."""
+    dates = list(dispatch_dates)
+    if not dates:
+        return {}
+    # Shipments from before fleet assignment did not record a count; they took at least one
+    count = func.sum(func.coalesce(models.Shipment.vehicle_count, 1))
+    rows = (
+        db.query(models.Shipment.dispatch_date, models.Shipment.vehicle_type, count)
+        .filter(models.Shipment.dispatch_date.in_(dates))
+        .group_by(models.Shipment.dispatch_date, models.Shipment.vehicle_type)
+    )
+    return {(dispatch_date, name): int(total or 0) for dispatch_date, name, total in rows}
+
+class CapacityIndex:
+    """
+    The catalog sorted by CBM (luggage cubes out first), so the classes that
+    can take a load are found by binary search instead of walking a ladder.
+    """
+
+    def __init__(self, fleet: List[FleetClass]):
+        self.classes = sorted(fleet, key=lambda v: (v.max_cbm, v.max_weight, v.name))
+        self._cbm = [v.max_cbm for v in self.classes]
+
+    def options(self, weight: float, cbm: float, distance_km: float) -> List[Option]:
+        """Every class that can carry the load in at most MAX_VEHICLES_PER_LANE vehicles, cheapest first."""
+        options = []
+        # Classes below this one would need more than MAX_VEHICLES_PER_LANE vehicles for the volume alone
+        for i in range(bisect_left(self._cbm, cbm / MAX_VEHICLES_PER_LANE), len(self.classes)):
+            v = self.classes[i]
+            count = max(1, math.ceil(max(weight / v.max_weight, cbm / v.max_cbm)))
+            if count <= MAX_VEHICLES_PER_LANE:
+                options.append(Option(count * v.cost_per_km * max(distance_km, 1), count, i))
+        options.sort()
+        return options
+
+class _Assignment:
+    """Current choice of option per lane and the vehicles left of every class."""
+
+    def __init__(self, index: CapacityIndex, lane_options: List[List[Option]], taken: Optional[Dict[str, int]] = None):
+        self.options = lane_options
+        taken = taken or {}
+        self.left = [
+            math.inf if v.available is None else max(0, v.available - taken.get(v.name, 0))
+            for v in index.classes
+        ]
+        self.chosen: List[Optional[Option]] = [None] * len(lane_options)
+        self.version = 0  # Bumped on every change, to remember searches that found nothing
+
+    def fits(self, option: Option, freed: Optional[Option] = None) -> bool:
+        spare = self.left[option.vehicle] + (freed.count if freed and freed.vehicle == option.vehicle else 0)
+        return spare >= option.count
+
+    def set(self, lane: int, option: Optional[Option]):
+        old = self.chosen[lane]
+        if old:
+            self.left[old.vehicle] += old.count
+        if option:
+            self.left[option.vehicle] -= option.count
+        self.chosen[lane] = option
+        self.version += 1
+
+    def option_for(self, lane: int, vehicle: int) -> Optional[Option]:
+        return next((o for o in self.options[lane] if o.vehicle == vehicle), None)
+
+def _greedy(assignment: _Assignment, loads: List[float]):
+    # Lanes one vehicle can carry go first, so scarce vehicles are not spent splitting a big
+    # load while whole lanes wait; within that, heaviest first (fewest classes to choose from)
+    fewest = [min((o.count for o in options), default=math.inf) for options in assignment.options]
+    for lane in sorted(range(len(loads)), key=lambda n: (fewest[n], -loads[n], n)):
+        option = next((o for o in assignment.options[lane] if assignment.fits(o)), None)
+        assignment.set(lane, option)
+
+def _by_vehicle(assignment: _Assignment) -> Dict[int, List[int]]:
+    lanes = {}
+    for lane, option in enumerate(assignment.chosen):
+        if option:
+            lanes.setdefault(option.vehicle, []).append(lane)
+    return lanes
+
+def _improve(assignment: _Assignment, deadline: float) -> bool:
+    """One pass of improving moves; True if anything changed."""
+    changed = False
+    lanes = range(len(assignment.chosen))
+
+    # Serve waiting lanes, if need be by moving an assigned lane to a class with vehicles to spare
+    if any(left > 0 for left in assignment.left):
+        by_vehicle = _by_vehicle(assignment)
+        no_alternative = {}
+        for u in lanes:
+            if assignment.chosen[u] is not None:
+                continue
+            for want in assignment.options[u]:
+                if assignment.fits(want):
+                    assignment.set(u, want)
+                    changed = True
+                    break
+                for a in by_vehicle.get(want.vehicle, []):
+                    current = assignment.chosen[a]
+                    if not current or current.vehicle != want.vehicle or not assignment.fits(want, current):
+                        continue
+                    if no_alternative.get(a) == assignment.version:
+                        continue
+                    alternative = next((o for o in assignment.options[a] if o.vehicle != want.vehicle and assignment.fits(o)), None)
+                    if not alternative:
+                        no_alternative[a] = assignment.version
+                    else:
+                        assignment.set(a, alternative)
+                        assignment.set(u, want)
+                        by_vehicle.setdefault(alternative.vehicle, []).append(a)
+                        changed = True
+                        break
+                if assignment.chosen[u] is not None or time.perf_counter() > deadline:
+                    break
+
+    # Cheaper class with vehicles to spare
+    for a in lanes:
+        current = assignment.chosen[a]
+        if not current:
+            continue
+        better = next((o for o in assignment.options[a] if o.cost < current.cost - 1e-6 and assignment.fits(o, current)), None)
+        if better:
+            assignment.set(a, better)
+            changed = True
+
+    # Pairwise swaps of classes between two lanes. A swap that lowers the total makes at
+    # least one of the two lanes cheaper, so only classes cheaper for `a` are searched.
+    by_vehicle = _by_vehicle(assignment)
+    for a in lanes:
+        if time.perf_counter() > deadline:
+            break
+        for na in assignment.options[a]:
+            oa = assignment.chosen[a]
+            if not oa or na.cost >= oa.cost - 1e-6:
+                break
+            for b in by_vehicle.get(na.vehicle, []):
+                ob = assignment.chosen[b]
+                if b == a or not ob or ob.vehicle != na.vehicle:
+                    continue
+                nb = assignment.option_for(b, oa.vehicle)
+                if not nb or na.cost + nb.cost >= oa.cost + ob.cost - 1e-6:
+                    continue
+                # Vehicle counts can differ between the two lanes, so check the pool after the exchange
+                if (assignment.left[oa.vehicle] + oa.count - nb.count >= 0
+                        and assignment.left[ob.vehicle] + ob.count - na.count >= 0):
+                    assignment.set(a, None)
+                    assignment.set(b, nb)
+                    assignment.set(a, na)
+                    by_vehicle[na.vehicle].remove(b)
+                    by_vehicle.setdefault(nb.vehicle, []).append(b)
+                    by_vehicle[na.vehicle].append(a)
+                    by_vehicle[oa.vehicle].remove(a)
+                    changed = True
+                    break
+    return changed
+
+def assign_fleet(plans: List[Dict], fleet: List[FleetClass], time_budget: Optional[float] = None,
+                 committed: Optional[Dict[Tuple[date, str], int]] = None) -> List[Dict]:
+    """
+    Allocates the vehicles of each dispatch date that `committed` shipments
+    (see committed_vehicles) have not taken yet across all its plans: a
+    greedy pass (heaviest lanes take their cheapest class still available),
+    then moves and pairwise swaps that serve waiting lanes or lower the total
+    freight cost, until nothing improves or the time budget runs out. Plans
+    that get no vehicle stay in the list as "Awaiting Vehicle".
+    """
+    if not plans or not fleet:
+        return plans
+    index = CapacityIndex(fleet)
+    deadline = time.perf_counter() + (FLEET_ASSIGN_TIME_BUDGET if time_budget is None else time_budget)
+    largest = index.classes[-1]
+
+    by_date = {}
+    for n, plan in enumerate(plans):
+        by_date.setdefault(plan["dispatch_date"], []).append(n)
+
+    result = [dict(plan) for plan in plans]
+    for dispatch_date in sorted(by_date):
+        members = by_date[dispatch_date]
+        lane_options = [
+            index.options(plans[n]["total_weight"], plans[n]["total_cbm"], plans[n].get("distance_km") or 0)
+            for n in members
+        ]
+        loads = [max(plans[n]["total_weight"] / largest.max_weight, plans[n]["total_cbm"] / largest.max_cbm) for n in members]
+        taken = {name: n for (day, name), n in (committed or {}).items() if day == dispatch_date}
+        assignment = _Assignment(index, lane_options, taken)
+        _greedy(assignment, loads)
+        while time.perf_counter() < deadline and _improve(assignment, deadline):
+            pass
+
+        for lane, n in enumerate(members):
+            plan, option = result[n], assignment.chosen[lane]
+            if option:
+                plan["vehicle_type"] = index.classes[option.vehicle].name
+                plan["vehicle_count"] = option.count
+                plan["freight_cost"] = round(option.cost, 2)
+                continue
+            wanted = lane_options[lane][0] if lane_options[lane] else None
+            if wanted:
+                plan["vehicle_type"] = index.classes[wanted.vehicle].name
+                plan["vehicle_count"] = wanted.count
+            plan["freight_cost"] = None
+            plan["status"] = AWAITING_VEHICLE
+            plan["recommendation"] = f"No vehicle left on {dispatch_date} for this load; hold for the next dispatch. " + plan["recommendation"]
+    return result
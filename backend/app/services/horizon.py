@@ -0,0 +1,203 @@
+import os
+import math
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from .. import models
+from .item_master import DEFAULT_WEIGHT_KG, DEFAULT_CBM, dimension_expression
+from .profiling import phase
+from .optimization import (
+    VEHICLE_CLASSES, KM_PER_DAY, get_next_dispatch_dates, estimate_lane_distance, suggest_vehicle, vehicles_needed
+)
+
+HORIZON_CYCLES = int(os.getenv("HORIZON_CYCLES", "8"))
+MAX_HORIZON_CYCLES = 26
+
+# One open PO reduced to what the planner needs; loaded with a single aggregate query
+PoLoad = namedtuple("PoLoad", ["id", "location", "drop_location", "expected_delivery_date", "weight", "cbm"])
+
+def load_open_po_loads(db: Session) -> List[PoLoad]:
+    """Weight and CBM of every open PO, summed in SQL (line -> item master -> default dimensions)."""
+    po, item, master = models.PurchaseOrder, models.Item, models.ItemMaster
+    quantity = func.coalesce(item.quantity, 0)
+    query = (
+        select(
+            po.id,
+            func.coalesce(po.location, "Unknown Origin"),
+            func.coalesce(po.drop_location, "Unknown Destination"),
+            po.expected_delivery_date,
+            func.coalesce(func.sum(quantity * dimension_expression(item.weight_per_unit, master.weight_per_unit, DEFAULT_WEIGHT_KG)), 0),
+            func.coalesce(func.sum(quantity * dimension_expression(item.cbm_per_unit, master.cbm_per_unit, DEFAULT_CBM)), 0),
+        )
+        .select_from(po)
+        .outerjoin(item, item.po_id == po.id)
+        .outerjoin(master, master.item_code == item.item_code)
+        .where(po.status == "Open")
+        .group_by(po.id, po.location, po.drop_location, po.expected_delivery_date)
+    )
+    return [PoLoad(*row) for row in db.execute(query)]
+
+def _latest_cycle(dispatch_dates: List[date], transit_days: int, deadline: Optional[date]) -> int:
+    """
+    Index of the last dispatch date that still arrives by `deadline`, or -1
+    when even the first one is late. `dispatch_dates` holds one date past the
+    horizon, so an index equal to the horizon length means "can wait". A PO
+    without a due date is due by the last cycle of the horizon, so it is
+    planned, but as late as it can go.
+    """
+    if deadline is None:
+        return len(dispatch_dates) - 2
+    return bisect_right(dispatch_dates, deadline - timedelta(days=transit_days)) - 1
+
+class _Cycle:
+    __slots__ = ("pos", "weight", "cbm", "mandatory")
+
+    def __init__(self):
+        self.pos, self.weight, self.cbm, self.mandatory = [], 0.0, 0.0, 0
+
+    def add(self, load: PoLoad, mandatory: bool):
+        self.pos.append(load)
+        self.weight += load.weight
+        self.cbm += load.cbm
+        self.mandatory += mandatory
+
+def _capacity(weight: float, cbm: float, classes: List[tuple]):
+    """Total capacity of the vehicles a load already needs: the room that can be filled for free."""
+    name = suggest_vehicle(weight, cbm, classes)
+    _, max_weight, max_cbm = next(v for v in classes if v[0] == name)
+    count = vehicles_needed(weight, cbm, classes)
+    return max_weight * count, max_cbm * count
+
+def _plan_lane(loads: List[PoLoad], latest: Dict[int, int], n: int, classes: List[tuple]):
+    """
+    Greedy with repair for one lane. Cycle k must carry every PO whose latest
+    feasible cycle is k (at-risk POs go to cycle 0); the spare room of the
+    vehicles that load needs is filled with the POs due soonest, which are
+    pulled forward. Cycles with nothing due dispatch nothing, so held POs
+    consolidate into fuller loads later. The repair pass then merges a cycle
+    into an earlier one whenever that saves a vehicle. Returns the cycles by
+    index and the POs left for after the horizon.
+    """
+    # Earliest deadline first; POs due beyond the horizon only ever ride as fill
+    remaining = sorted(loads, key=lambda l: (latest[l.id], -l.weight, l.id))
+    cycles = {}
+    for k in range(n):
+        mandatory = [l for l in remaining if latest[l.id] <= k]
+        if not mandatory:
+            continue
+        cycle = _Cycle()
+        for load in mandatory:
+            cycle.add(load, True)
+        cap_weight, cap_cbm = _capacity(cycle.weight, cycle.cbm, classes)
+        left = []
+        for load in remaining:
+            if latest[load.id] <= k:
+                continue
+            if cycle.weight + load.weight <= cap_weight and cycle.cbm + load.cbm <= cap_cbm:
+                cycle.add(load, False)
+            else:
+                left.append(load)
+        remaining = left
+        cycles[k] = cycle
+
+    # Repair: shipping a later cycle's POs earlier never misses a deadline
+    used = sorted(cycles)
+    merged = True
+    while merged and len(used) > 1:
+        merged = False
+        for a, b in zip(used, used[1:]):
+            first, second = cycles[a], cycles[b]
+            separate = vehicles_needed(first.weight, first.cbm, classes) + vehicles_needed(second.weight, second.cbm, classes)
+            if vehicles_needed(first.weight + second.weight, first.cbm + second.cbm, classes) < separate:
+                for load in second.pos:
+                    first.add(load, False)
+                del cycles[b]
+                used.remove(b)
+                merged = True
+                break
+
+    return cycles, remaining
+
+def plan_horizon(loads: List[PoLoad], cycles: int = HORIZON_CYCLES, today: Optional[date] = None,
+                 vehicle_classes: Optional[List[tuple]] = None) -> Dict:
+    """
+    Assigns open POs to the next `cycles` Tuesday/Friday dispatch days using
+    their expected delivery dates and each lane's transit time. POs that
+    cannot arrive on time even from the first cycle are flagged at risk;
+    POs due after the horizon stay deferred unless they fill spare room.
+    """
+    today = today or date.today()
+    classes = vehicle_classes or VEHICLE_CLASSES
+    dispatch_dates = get_next_dispatch_dates(today, cycles + 1)
+    cycle_dates = dispatch_dates[:cycles]
+
+    with phase("lanes"):
+        lanes = {}
+        for load in loads:
+            lanes.setdefault((load.location, load.drop_location), []).append(load)
+
+    plans, at_risk, deferred = [], [], 0
+    per_cycle = [{"dispatch_date": d, "shipments": 0, "vehicles": 0, "pos": 0, "weight": 0.0, "cbm": 0.0} for d in cycle_dates]
+    with phase("assign"):
+        for (loc, drop) in sorted(lanes):
+            lane_loads = lanes[(loc, drop)]
+            distance_km = estimate_lane_distance(loc, drop)
+            transit_days = max(1, math.ceil(distance_km / KM_PER_DAY))
+
+            latest, lane_at_risk = {}, set()
+            for load in lane_loads:
+                k = _latest_cycle(dispatch_dates, transit_days, load.expected_delivery_date)
+                if k < 0:
+                    lane_at_risk.add(load.id)
+                latest[load.id] = max(k, 0)
+            at_risk.extend(lane_at_risk)
+
+            lane_cycles, held = _plan_lane(lane_loads, latest, cycles, classes)
+            deferred += len(held)
+            route = f"LOCAL {loc.upper()} → {drop.upper()}" if loc.upper() == drop.upper() else f"{loc.upper()} → {drop.upper()}"
+
+            for k in sorted(lane_cycles):
+                cycle = lane_cycles[k]
+                dispatch_date = cycle_dates[k]
+                count = vehicles_needed(cycle.weight, cycle.cbm, classes)
+                pulled = len(cycle.pos) - cycle.mandatory
+                recommendation = f"Cycle {k + 1}: {cycle.mandatory} PO(s) due"
+                recommendation += f", {pulled} pulled forward to fill the vehicle." if pulled else "."
+                plans.append({
+                    "cycle": k,
+                    "dispatch_date": dispatch_date,
+                    "expected_arrival_date": dispatch_date + timedelta(days=transit_days),
+                    "distance_km": distance_km,
+                    "vehicle_type": suggest_vehicle(cycle.weight, cycle.cbm, classes),
+                    "vehicles": count,
+                    "total_weight": round(cycle.weight, 2),
+                    "total_cbm": round(cycle.cbm, 3),
+                    "recommendation": recommendation,
+                    "location": loc,
+                    "drop_location": drop,
+                    "route": route,
+                    "po_ids": sorted(load.id for load in cycle.pos),
+                    "at_risk_po_ids": sorted(load.id for load in cycle.pos if load.id in lane_at_risk),
+                    "status": "Proposed",
+                })
+                totals = per_cycle[k]
+                totals["shipments"] += 1
+                totals["vehicles"] += count
+                totals["pos"] += len(cycle.pos)
+                totals["weight"] += cycle.weight
+                totals["cbm"] += cycle.cbm
+
+    for totals in per_cycle:
+        totals["weight"] = round(totals["weight"], 2)
+        totals["cbm"] = round(totals["cbm"], 3)
+
+    return {
+        "cycles": per_cycle,
+        "plans": plans,
+        "at_risk_po_ids": sorted(at_risk),
+        "deferred_pos": deferred,
+        "planned_pos": sum(t["pos"] for t in per_cycle),
+    }
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import case, event
+from sqlalchemy.orm import Session
+from .. import models
+
+# Planning fallback when neither the PO line nor the item master knows the SKU
+DEFAULT_WEIGHT_KG = 2.0
+DEFAULT_CBM = 0.01
+
+ITEM_MASTER_CACHE_SIZE = int(os.getenv("ITEM_MASTER_CACHE_SIZE", "5000"))
+# Other workers may update the master, so cached entries (including misses) expire
+ITEM_MASTER_CACHE_TTL = float(os.getenv("ITEM_MASTER_CACHE_TTL", "300"))
+QUERY_CHUNK = 500
+
+# A dimension of 0.0 is unknown and falls back to the planning default
+ItemDimensions = namedtuple("ItemDimensions", ["weight_per_unit", "cbm_per_unit", "stackable"])
+
+class _DimensionCache:
+    """Thread-safe LRU of item_code -> ItemDimensions (or None for a known miss)."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, codes: Iterable[str]):
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for code in codes:
+                entry = self._entries.get(code)
+                if entry is None or now - entry[1] > self.ttl:
+                    missing.append(code)
+                    continue
+                self._entries.move_to_end(code)
+                if entry[0] is not None:
+                    found[code] = entry[0]
+        return found, missing
+
+    def put_many(self, values: Dict[str, Optional[ItemDimensions]]):
+        now = time.monotonic()
+        with self._lock:
+            for code, dims in values.items():
+                self._entries[code] = (dims, now)
+                self._entries.move_to_end(code)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, codes: Iterable[str]):
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+
+_cache = _DimensionCache(ITEM_MASTER_CACHE_SIZE, ITEM_MASTER_CACHE_TTL)
+
+# Codes a session has written but not committed yet; they stay out of the cache until it ends
+_PENDING_KEY = "item_master_pending"
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _release_pending(session):
+    _cache.invalidate(session.info.pop(_PENDING_KEY, ()))
+
+def resolve_dimensions(db: Session, item_codes: Iterable[str]) -> Dict[str, ItemDimensions]:
+    """
+    Master dimensions for a whole batch of SKUs: LRU hits first, then one IN
+    query per chunk. Zero, negative or NULL master values count as unknown,
+    and a SKU with neither dimension known is left out like a missing one.
+    """
+    codes = {str(code) for code in item_codes if code}
+    found, missing = _cache.get_many(codes)
+    loaded = {code: None for code in missing}
+    for i in range(0, len(missing), QUERY_CHUNK):
+        chunk = missing[i:i + QUERY_CHUNK]
+        rows = db.query(
+            models.ItemMaster.item_code,
+            models.ItemMaster.weight_per_unit,
+            models.ItemMaster.cbm_per_unit,
+            models.ItemMaster.stackable,
+        ).filter(models.ItemMaster.item_code.in_(chunk))
+        for code, weight, cbm, stackable in rows:
+            weight = weight if weight and weight > 0 else 0.0
+            cbm = cbm if cbm and cbm > 0 else 0.0
+            if weight or cbm:
+                loaded[code] = ItemDimensions(weight, cbm, True if stackable is None else stackable)
+    pending = db.info.get(_PENDING_KEY, ())
+    _cache.put_many({code: dims for code, dims in loaded.items() if code not in pending})
+    found.update({code: dims for code, dims in loaded.items() if dims is not None})
+    return found
+
+def effective_dimensions(item, dimensions: Optional[Dict[str, ItemDimensions]] = None):
+    """(weight, cbm) per unit: the PO line's own value, then the item master, then the planning default."""
+    master = dimensions.get(item.item_code) if dimensions and item.item_code else None
+    w = item.weight_per_unit if item.weight_per_unit and item.weight_per_unit > 0 else None
+    c = item.cbm_per_unit if item.cbm_per_unit and item.cbm_per_unit > 0 else None
+    if w is None:
+        w = master.weight_per_unit if master and master.weight_per_unit > 0 else DEFAULT_WEIGHT_KG
+    if c is None:
+        c = master.cbm_per_unit if master and master.cbm_per_unit > 0 else DEFAULT_CBM
+    return w, c
+
+def dimension_expression(line_value, master_value, default):
+    """SQL form of effective_dimensions for aggregate queries that outer join item_master."""
+    return case(
+        (line_value > 0, line_value),
+        (master_value > 0, master_value),
+        else_=default,
+    )
+
+def fill_missing_dimensions(db: Session, items: List[models.Item]) -> int:
+    """Copies master dimensions onto new Item rows that arrived with 0 weight/CBM. Returns rows filled."""
+    pending = [i for i in items if i.item_code and not (i.weight_per_unit and i.cbm_per_unit)]
+    if not pending:
+        return 0
+    dimensions = resolve_dimensions(db, [i.item_code for i in pending])
+    filled = 0
+    for item in pending:
+        master = dimensions.get(item.item_code)
+        if not master:
+            continue
+        if not item.weight_per_unit and master.weight_per_unit > 0:
+            item.weight_per_unit = master.weight_per_unit
+        if not item.cbm_per_unit and master.cbm_per_unit > 0:
+            item.cbm_per_unit = master.cbm_per_unit
+        filled += 1
+    return filled
+
+def upsert_item_master(db: Session, records: List[Dict], source: str) -> int:
+    """
+    Inserts or updates master rows from dicts with item_code and any of
+    item_name / weight_per_unit / cbm_per_unit / stackable. Zero or missing
+    dimensions never overwrite known ones. Does not commit.
+    """
+    by_code = {}
+    for record in records:
+        code = record.get("item_code")
+        if code:
+            by_code[str(code)] = record
+    if not by_code:
+        return 0
+
+    codes = list(by_code)
+    existing = {}
+    for i in range(0, len(codes), QUERY_CHUNK):
+        for row in db.query(models.ItemMaster).filter(models.ItemMaster.item_code.in_(codes[i:i + QUERY_CHUNK])):
+            existing[row.item_code] = row
+
+    changed = 0
+    for code, record in by_code.items():
+        weight = float(record.get("weight_per_unit") or 0)
+        cbm = float(record.get("cbm_per_unit") or 0)
+        row = existing.get(code)
+        if row is None:
+            row = models.ItemMaster(item_code=code, weight_per_unit=0.0, cbm_per_unit=0.0, stackable=True)
+            db.add(row)
+        if record.get("item_name"):
+            row.item_name = record["item_name"]
+        if weight > 0:
+            row.weight_per_unit = weight
+        if cbm > 0:
+            row.cbm_per_unit = cbm
+        if record.get("stackable") is not None:
+            row.stackable = str(record["stackable"]).strip().lower() not in ("0", "false", "no", "n")
+        row.source = source
+        changed += 1
+
+    db.flush()
+    db.info.setdefault(_PENDING_KEY, set()).update(codes)
+    _cache.invalidate(codes)
+    return changed
@@ -1,54 +1,89 @@
 from datetime import date, timedelta
-from typing import List, Dict
-import random
+from typing import List, Dict, Optional
 import math
+import zlib
 from ..models import PurchaseOrder, Item
 from ..schemas import ShipmentCreate
+from .item_master import ItemDimensions, effective_dimensions
+from .profiling import phase
 
-def get_next_dispatch_dates(current_date: date) -> List[date]:
-    """Returns the next Tuesday and Friday."""
+DISPATCH_WEEKDAYS = [1, 4]  # 1 is Tuesday, 4 is Friday
+
+def get_next_dispatch_dates(current_date: date, count: int = 2) -> List[date]:
+    """Returns the next `count` dispatch days (Tuesdays and Fridays) after current_date."""
     dates = []
-    for i in range(1, 8):
-        future_date = current_date + timedelta(days=i)
-        if future_date.weekday() in [1, 4]:  # 1 is Tuesday, 4 is Friday
+    future_date = current_date
+    while len(dates) < count:
+        future_date += timedelta(days=1)
+        if future_date.weekday() in DISPATCH_WEEKDAYS:
             dates.append(future_date)
-            if len(dates) == 2:
-                break
-    return sorted(dates)
+    return dates
 
-def calculate_totals(pos: List[PurchaseOrder]) -> Dict[str, float]:
+def calculate_totals(pos: List[PurchaseOrder], dimensions: Optional[Dict[str, ItemDimensions]] = None) -> Dict[str, float]:
     total_weight = 0.0
     total_cbm = 0.0
     for po in pos:
         for item in po.items:
-            # Fallback: If weight or cbm is 0, use a reasonable default for logistics planning
-            w = item.weight_per_unit if item.weight_per_unit > 0 else 2.0  # Default 2kg
-            c = item.cbm_per_unit if item.cbm_per_unit > 0 else 0.01     # Default 0.01 CBM
+            # Line value, then item master, then a reasonable default for logistics planning
+            w, c = effective_dimensions(item, dimensions)
             
             total_weight += w * item.quantity
             total_cbm += c * item.quantity
     return {"weight": total_weight, "cbm": total_cbm}
 
-def suggest_vehicle(weight: float, cbm: float) -> str:
-    # Luggage is high volume, low weight. Vehicles usually cube out before they weight out.
-    if weight <= 750 and cbm <= 6:
-        return "Tata Ace (1.5T)"
-    elif weight <= 1500 and cbm <= 10:
-        return "Pickup / Bolero"
-    elif weight <= 4500 and cbm <= 28:
-        return "17ft HB Truck"
-    elif weight <= 9000 and cbm <= 42:
-        return "19ft Container"
-    elif weight <= 15000 and cbm <= 60:
-        return "Tauras 22ft"
-    else:
-        return "Multi-Axle / 32ft MX"
+# (name, max weight kg, max CBM), smallest first. Luggage is high volume, low weight,
+# so vehicles usually cube out before they weight out.
+VEHICLE_CLASSES = [
+    ("Tata Ace (1.5T)", 750, 6),
+    ("Pickup / Bolero", 1500, 10),
+    ("17ft HB Truck", 4500, 28),
+    ("19ft Container", 9000, 42),
+    ("Tauras 22ft", 15000, 60),
+    ("Multi-Axle / 32ft MX", 25000, 90),
+]
 
-def optimize_shipments(pending_pos: List[PurchaseOrder]) -> List[Dict]:
-    if not pending_pos:
-        return []
+def suggest_vehicle(weight: float, cbm: float, vehicle_classes: Optional[List[tuple]] = None) -> str:
+    classes = vehicle_classes or VEHICLE_CLASSES
+    for name, max_weight, max_cbm in classes:
+        if weight <= max_weight and cbm <= max_cbm:
+            return name
+    # Anything bigger still goes as the largest class (split across trucks on the day)
+    return classes[-1][0]
+
+def vehicles_needed(weight: float, cbm: float, vehicle_classes: Optional[List[tuple]] = None) -> int:
+    """How many vehicles of the suggested class the load takes (more than one only beyond the largest class)."""
+    classes = vehicle_classes or VEHICLE_CLASSES
+    _, max_weight, max_cbm = next(v for v in classes if v[0] == suggest_vehicle(weight, cbm, classes))
+    return max(1, math.ceil(max(weight / max_weight, cbm / max_cbm)))
 
-    # Group POs by location (State/City) and Destination (Drop Location)
+# Standardize distances to common supply hubs for consistent data
+DISTANCE_MAP = {
+    "MUMBAI": 1850,
+    "DELHI": 1050,
+    "PUNE": 1780,
+    "AHMEDABAD": 1500,
+    "CHENNAI": 2300,
+    "BANGALORE": 2100,
+    "KOLKATA": 550,
+    "SURAT": 1450,
+}
+LOCAL_ORIGINS = ["BIHAR", "PATNA", "MUZAFFARPUR"]
+KM_PER_DAY = 600.0
+
+def _stable_km(key: str, low: int, high: int) -> int:
+    """Deterministic stand-in distance in [low, high] so repeated runs plan the same lane alike."""
+    return low + zlib.crc32(key.upper().encode()) % (high - low + 1)
+
+def estimate_lane_distance(loc: str, drop: str) -> int:
+    loc_upper = loc.upper()
+    if loc_upper in LOCAL_ORIGINS:
+        return _stable_km(f"{loc}|{drop}", 50, 250)
+    # Try to match the location name to our map, or generate a realistic far distance
+    found_dist = next((v for k, v in DISTANCE_MAP.items() if k in loc_upper), None)
+    return found_dist if found_dist else _stable_km(f"{loc}|{drop}", 800, 2500)
+
+def group_by_lane(pending_pos: List[PurchaseOrder]) -> Dict[tuple, List[PurchaseOrder]]:
+    """Group POs by location (State/City) and Destination (Drop Location)."""
     grouped_pos = {}
     for po in pending_pos:
         loc = po.location or "Unknown Origin"
@@ -57,19 +92,33 @@ def optimize_shipments(pending_pos: List[PurchaseOrder]) -> List[Dict]:
         if key not in grouped_pos:
             grouped_pos[key] = []
         grouped_pos[key].append(po)
+    return grouped_pos
+
+def optimize_shipments(pending_pos: List[PurchaseOrder], dimensions: Optional[Dict[str, ItemDimensions]] = None,
+                       dispatch_date: Optional[date] = None, vehicle_classes: Optional[List[tuple]] = None) -> List[Dict]:
+    if not pending_pos:
+        return []
+
+    with phase("grouping"):
+        grouped_pos = group_by_lane(pending_pos)
 
     all_plans = []
     today = date.today()
-    dispatch_dates = get_next_dispatch_dates(today)
-    primary_date = dispatch_dates[0] if dispatch_dates else today
+    if dispatch_date:
+        primary_date = dispatch_date
+    else:
+        dispatch_dates = get_next_dispatch_dates(today)
+        primary_date = dispatch_dates[0] if dispatch_dates else today
 
     for (loc, drop), pos in grouped_pos.items():
-        totals = calculate_totals(pos)
+        with phase("totals"):
+            totals = calculate_totals(pos, dimensions)
         total_weight = totals["weight"]
         total_cbm = totals["cbm"]
         
         days_to_dispatch = (primary_date - today).days
-        vehicle = suggest_vehicle(total_weight, total_cbm)
+        with phase("vehicle"):
+            vehicle = suggest_vehicle(total_weight, total_cbm, vehicle_classes)
         
         recommendation = f"Optimized for {loc} logistics lane."
         if total_weight < 500 and days_to_dispatch > 1:
@@ -84,30 +133,10 @@ def optimize_shipments(pending_pos: List[PurchaseOrder]) -> List[Dict]:
             route = f"{loc.upper()} → {drop.upper()}"
         
         # Calculate Distance and ETA (Assuming 600km/day)
-        is_local = loc.upper() in ["BIHAR", "PATNA", "MUZAFFARPUR"]
-        
-        # Standardize distances to common supply hubs for consistent data
-        distance_map = {
-            "MUMBAI": 1850,
-            "DELHI": 1050,
-            "PUNE": 1780,
-            "AHMEDABAD": 1500,
-            "CHENNAI": 2300,
-            "BANGALORE": 2100,
-            "KOLKATA": 550,
-            "SURAT": 1450,
-        }
-        
-        # Determine distance
-        if is_local:
-            distance_km = random.randint(50, 250)
-        else:
-            # Try to match the location name to our map, or generate a realistic far distance
-            loc_upper = loc.upper()
-            found_dist = next((v for k, v in distance_map.items() if k in loc_upper), None)
-            distance_km = found_dist if found_dist else random.randint(800, 2500)
+        with phase("distance"):
+            distance_km = estimate_lane_distance(loc, drop)
             
-        days_on_road = max(1, math.ceil(distance_km / 600.0))
+        days_on_road = max(1, math.ceil(distance_km / KM_PER_DAY))
         expected_arrival = primary_date + timedelta(days=days_on_road)
 
         plan = {
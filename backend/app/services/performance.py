@@ -1,48 +1,243 @@
+import os
+import datetime
+from sqlalchemy import select, func, case, union_all, delete, or_, Date
 from sqlalchemy.orm import Session
 from .. import models
-from typing import Dict
+from typing import Dict, List, Optional
 
-def get_supplier_performance(db: Session) -> Dict[str, Dict]:
+# How many trailing days each rollup run recomputes, so late edits to recent
+# POs (date changes, cancellations, dispatches) are picked up.
+ROLLUP_LOOKBACK_DAYS = int(os.getenv("SUPPLIER_ROLLUP_LOOKBACK_DAYS", "30"))
+SCORE_WINDOWS = [30, 90, 365]
+
+def _grade(score) -> Dict[str, str]:
+    if score >= 80:
+        return {"grade": "A", "color": "emerald"}
+    elif score >= 50:
+        return {"grade": "B", "color": "amber"}
+    return {"grade": "C", "color": "red"}
+
+def get_supplier_performance(db: Session, include_history: bool = False) -> Dict[str, Dict]:
     # Fetch all POs to aggregate performance
     pos = db.query(models.PurchaseOrder).all()
-    
+    if include_history:
+        pos += db.query(models.PurchaseOrderHistory).all()
+
     stats = {} # { "Supplier Name": { "score": 0, "pos": 0, "changes": 0, "cancelled": 0 } }
-    
+
     for po in pos:
         name = po.supplier_name
         if name not in stats:
             stats[name] = {"score": 100, "total_pos": 0, "changes": 0, "cancelled": 0}
-        
+
         stats[name]["total_pos"] += 1
         stats[name]["changes"] += po.date_change_count
-        
+
         # Penalize for changes and cancellations
         penalty = (po.date_change_count * 10)
         if po.status == "Cancelled":
             penalty += 50
-        
+
         stats[name]["score"] -= penalty
 
     # Assign Grades
     grades = {}
     for name, data in stats.items():
         score = data["score"]
-        if score >= 80:
-            grade = "A"
-            color = "emerald"
-        elif score >= 50:
-            grade = "B"
-            color = "amber"
-        else:
-            grade = "C"
-            color = "red"
-        
         grades[name] = {
             "supplier_name": name,
-            "grade": grade,
-            "color": color,
+            **_grade(score),
             "score": max(0, score),
             "reliability": f"{max(0, score)}%"
         }
-        
+
     return grades
+
+def _all_pos():
+    """Hot and archived POs as one selectable, so rollups survive archiving."""
+    cols = ["id", "supplier_name", "created_at", "expected_delivery_date", "date_change_count", "status"]
+    return union_all(
+        select(*[models.PurchaseOrder.__table__.c[c] for c in cols]),
+        select(*[models.PurchaseOrderHistory.__table__.c[c] for c in cols]),
+    ).subquery("all_pos")
+
+def _first_dispatch():
+    """Earliest shipment dispatch date per PO across hot and archived shipments."""
+    links = union_all(
+        select(models.shipment_po_association.c.po_id, models.Shipment.dispatch_date)
+        .join(models.Shipment, models.Shipment.id == models.shipment_po_association.c.shipment_id),
+        select(models.shipment_po_association_history.c.po_id, models.ShipmentHistory.dispatch_date)
+        .join(models.ShipmentHistory, models.ShipmentHistory.id == models.shipment_po_association_history.c.shipment_id),
+    ).subquery("links")
+    return (
+        select(links.c.po_id, func.min(links.c.dispatch_date).label("dispatched_on"))
+        .group_by(links.c.po_id)
+        .subquery("first_dispatch")
+    )
+
+def _touched_days(db: Session, since: datetime.date, changed_after: datetime.datetime) -> List[datetime.date]:
+    """
+    Creation and due days before `since` of POs edited after `changed_after`,
+    so an edit to an old PO still reaches its rollup rows.
+    """
+    po = models.PurchaseOrder
+    created_day = func.date(po.created_at, type_=Date)
+    days = set()
+    rows = db.execute(
+        select(created_day, po.expected_delivery_date).where(po.updated_at >= changed_after)
+    )
+    for created, due in rows:
+        days.update(day for day in (created, due) if day and day < since)
+    return sorted(days)
+
+def refresh_supplier_rollups(db: Session, since: Optional[datetime.date] = None, full: bool = False) -> Dict:
+    """
+    Recomputes supplier_daily_rollups for every day from `since` to today.
+    Without `since`, continues from the last rolled-up day minus the lookback
+    window plus the older days of POs updated since the last run, or
+    backfills everything on the first run or with `full`.
+    """
+    today = datetime.date.today()
+    # Stamped on the rows before reading, so edits made during this run are picked up by the next
+    started = datetime.datetime.utcnow()
+    touched = []
+    if full:
+        since = None
+    elif since is None:
+        last_day, last_refresh = db.query(
+            func.max(models.SupplierDailyRollup.day), func.max(models.SupplierDailyRollup.refreshed_at)
+        ).one()
+        since = (last_day - datetime.timedelta(days=ROLLUP_LOOKBACK_DAYS)) if last_day else None
+        if since and last_refresh:
+            touched = _touched_days(db, since, last_refresh)
+
+    pos = _all_pos()
+    buckets = {}
+
+    def bucket(supplier, day):
+        key = (supplier, day)
+        if key not in buckets:
+            buckets[key] = {"pos_created": 0, "date_changes": 0, "cancelled": 0, "due": 0, "on_time": 0, "late": 0}
+        return buckets[key]
+
+    created_day = func.date(pos.c.created_at, type_=Date)
+    created_query = (
+        select(
+            pos.c.supplier_name,
+            created_day.label("day"),
+            func.count().label("pos_created"),
+            func.coalesce(func.sum(pos.c.date_change_count), 0).label("date_changes"),
+            func.sum(case((pos.c.status == "Cancelled", 1), else_=0)).label("cancelled"),
+        )
+        .where(pos.c.created_at.is_not(None))
+        .group_by(pos.c.supplier_name, created_day)
+    )
+    if since:
+        created_query = created_query.where(or_(
+            pos.c.created_at >= datetime.datetime.combine(since, datetime.time.min), created_day.in_(touched)
+        ))
+    for row in db.execute(created_query):
+        b = bucket(row.supplier_name, row.day)
+        b["pos_created"] = row.pos_created
+        b["date_changes"] = row.date_changes
+        b["cancelled"] = row.cancelled
+
+    dispatch = _first_dispatch()
+    due_day = pos.c.expected_delivery_date
+    on_time = case((dispatch.c.dispatched_on <= due_day, 1), else_=0)
+    late = case(
+        (dispatch.c.dispatched_on > due_day, 1),
+        ((dispatch.c.dispatched_on.is_(None)) & (due_day < today), 1),
+        else_=0,
+    )
+    due_query = (
+        select(
+            pos.c.supplier_name,
+            due_day.label("day"),
+            func.count().label("due"),
+            func.sum(on_time).label("on_time"),
+            func.sum(late).label("late"),
+        )
+        .select_from(pos.outerjoin(dispatch, dispatch.c.po_id == pos.c.id))
+        .where(due_day.is_not(None), due_day <= today, pos.c.status != "Cancelled")
+        .group_by(pos.c.supplier_name, due_day)
+    )
+    if since:
+        due_query = due_query.where(or_(due_day >= since, due_day.in_(touched)))
+    for row in db.execute(due_query):
+        b = bucket(row.supplier_name, row.day)
+        b["due"] = row.due
+        b["on_time"] = row.on_time
+        b["late"] = row.late
+
+    stale = delete(models.SupplierDailyRollup)
+    if since:
+        stale = stale.where(or_(models.SupplierDailyRollup.day >= since, models.SupplierDailyRollup.day.in_(touched)))
+    db.execute(stale)
+    db.add_all([
+        models.SupplierDailyRollup(supplier_name=supplier, day=day, refreshed_at=started, **counts)
+        for (supplier, day), counts in buckets.items()
+    ])
+    db.commit()
+    return {"since": since, "touched_days": len(touched), "rows": len(buckets)}
+
+def _score(totals: Dict) -> Dict:
+    """Same penalties as the lifetime score, averaged per PO so windows of any length compare."""
+    pos_created = totals["pos_created"] or 0
+    penalty = (totals["date_changes"] or 0) * 10 + (totals["cancelled"] or 0) * 50
+    score = max(0, round(100 - penalty / pos_created)) if pos_created else 100
+    resolved = (totals["on_time"] or 0) + (totals["late"] or 0)
+    return {
+        "score": score,
+        **_grade(score),
+        "total_pos": pos_created,
+        "changes": totals["date_changes"] or 0,
+        "cancelled": totals["cancelled"] or 0,
+        "on_time_rate": round((totals["on_time"] or 0) / resolved * 100, 1) if resolved else None,
+    }
+
+def _rollup_sums():
+    r = models.SupplierDailyRollup
+    return [
+        func.sum(r.pos_created).label("pos_created"),
+        func.sum(r.date_changes).label("date_changes"),
+        func.sum(r.cancelled).label("cancelled"),
+        func.sum(r.on_time).label("on_time"),
+        func.sum(r.late).label("late"),
+    ]
+
+def get_windowed_supplier_scores(db: Session, windows: List[int] = SCORE_WINDOWS) -> Dict[str, Dict]:
+    """Trailing-window scores per supplier, read from the daily rollups only."""
+    r = models.SupplierDailyRollup
+    today = datetime.date.today()
+    scores = {}
+    for days in windows:
+        rows = db.execute(
+            select(r.supplier_name, *_rollup_sums())
+            .where(r.day > today - datetime.timedelta(days=days))
+            .group_by(r.supplier_name)
+        )
+        for row in rows:
+            entry = scores.setdefault(row.supplier_name, {"supplier_name": row.supplier_name, "windows": {}})
+            entry["windows"][f"{days}d"] = _score(row._mapping)
+    return scores
+
+def get_supplier_trend(db: Session, supplier_name: str, days: int = 90, bucket_days: int = 7) -> List[Dict]:
+    """Score and on-time rate per `bucket_days` period over the last `days` days."""
+    r = models.SupplierDailyRollup
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=days - 1)
+    rows = db.query(r).filter(r.supplier_name == supplier_name, r.day >= start).order_by(r.day).all()
+
+    periods = {}
+    for row in rows:
+        index = (row.day - start).days // bucket_days
+        p = periods.setdefault(index, {"pos_created": 0, "date_changes": 0, "cancelled": 0, "on_time": 0, "late": 0})
+        for key in p:
+            p[key] += getattr(row, key) or 0
+
+    trend = []
+    for index in range((days + bucket_days - 1) // bucket_days):
+        p = periods.get(index, {"pos_created": 0, "date_changes": 0, "cancelled": 0, "on_time": 0, "late": 0})
+        trend.append({"period_start": start + datetime.timedelta(days=index * bucket_days), **_score(p)})
+    return trend
@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import time
+import hmac
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+# Profiling is off unless a token is configured; requests opt in with
+# "X-Profile: 1" (or ?profile=1) and must present the token in X-Profile-Token.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_timings: ContextVar[Optional["PhaseTimings"]] = ContextVar("phase_timings", default=None)
+
+class PhaseTimings:
+    """Named durations collected while serving one request."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def header(self, total_ms: float) -> str:
+        with self._lock:
+            parts = [f"{name};dur={ms:.1f}" for name, ms in self.durations.items()]
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+@contextmanager
+def phase(name: str):
+    """
+    Times a block under `name` for the Server-Timing header of the current
+    request. Repeated phases add up. Outside a request (scheduler jobs,
+    worker processes) this is a no-op.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+class StackSampler:
+    """
+    Samples the stacks of threads that are running portal code and keeps
+    them in collapsed ("folded") form, which flamegraph.pl and speedscope read.
+    Concurrent requests doing app work show up in the same profile.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if in_app:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _profile_requested(conn: HTTPConnection) -> bool:
+    if not PROFILING_TOKEN:
+        return False
+    wanted = conn.headers.get("x-profile") == "1" or conn.query_params.get("profile") == "1"
+    return wanted and hmac.compare_digest(conn.headers.get("x-profile-token", ""), PROFILING_TOKEN)
+
+class ProfilingMiddleware:
+    """
+    Adds a Server-Timing header to every response and samples opted-in
+    requests. Plain ASGI, so the phase timings stay bound to the request
+    until its body has been sent; the header goes out with the response
+    start. Event streams never end, so they get neither.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        conn = HTTPConnection(scope)
+        timings = PhaseTimings()
+        token = _timings.set(timings)
+        sampler, profile_name = None, None
+        if _profile_requested(conn):
+            sampler = StackSampler(PROFILE_SAMPLE_MS / 1000)
+            sampler.start()
+            slug = re.sub(r"[^A-Za-z0-9]+", "-", conn.url.path).strip("-")
+            profile_name = f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S%f}-{scope['method']}-{slug}.folded"
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal sampler
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if headers.get("content-type", "").startswith("text/event-stream"):
+                    if sampler:
+                        sampler.stop()
+                        sampler = None
+                else:
+                    headers.append("Server-Timing", timings.header((time.perf_counter() - started) * 1000))
+                    if sampler:
+                        headers.append("X-Profile-File", profile_name)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            if sampler:
+                # Written after the body, so streamed work is in the profile too
+                sampler.stop()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                sampler.write(os.path.join(PROFILE_DIR, profile_name))
@@ -0,0 +1,240 @@
+import os
+import math
+import time
+from functools import lru_cache
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from ..models import PurchaseOrder
+from .item_master import ItemDimensions
+from .profiling import phase
+from .optimization import (
+    VEHICLE_CLASSES, KM_PER_DAY, calculate_totals, suggest_vehicle, estimate_lane_distance,
+    group_by_lane, get_next_dispatch_dates
+)
+
+MILK_RUN_TIME_BUDGET_SECONDS = float(os.getenv("MILK_RUN_TIME_BUDGET_SECONDS", "2"))
+MILK_RUN_MAX_STOPS = int(os.getenv("MILK_RUN_MAX_STOPS", "6"))
+# Vehicle class whose capacity bounds a milk run (defaults to the largest class)
+MILK_RUN_VEHICLE = os.getenv("MILK_RUN_VEHICLE", VEHICLE_CLASSES[-1][0])
+
+# Roads are longer than the great-circle distance between two towns
+ROAD_FACTOR = 1.3
+# Drop-to-drop distance when either town has no known coordinates
+FALLBACK_HOP_KM = 150
+ROUTE_COLUMN_LIMIT = 255
+
+# (lat, lon) of supply hubs and the drop towns we serve
+LOCATION_COORDS = {
+    "MUMBAI": (19.076, 72.877), "DELHI": (28.704, 77.102), "PUNE": (18.520, 73.856),
+    "AHMEDABAD": (23.022, 72.571), "CHENNAI": (13.082, 80.270), "BANGALORE": (12.971, 77.594),
+    "KOLKATA": (22.572, 88.363), "SURAT": (21.170, 72.831),
+    "PATNA": (25.594, 85.137), "MUZAFFARPUR": (26.120, 85.390), "GAYA": (24.796, 85.003),
+    "BHAGALPUR": (25.244, 86.972), "DARBHANGA": (26.152, 85.897), "PURNIA": (25.778, 87.475),
+    "BEGUSARAI": (25.418, 86.129), "ARA": (25.556, 84.663), "CHAPRA": (25.781, 84.747),
+    "SAMASTIPUR": (25.863, 85.781), "MOTIHARI": (26.648, 84.917), "SITAMARHI": (26.595, 85.480),
+    "HAJIPUR": (25.686, 85.221), "KATIHAR": (25.539, 87.571), "SAHARSA": (25.879, 86.597),
+    "BETTIAH": (26.802, 84.503), "SIWAN": (26.221, 84.356), "BIHAR SHARIF": (25.197, 85.523),
+    "MUNGER": (25.375, 86.473), "KISHANGANJ": (26.105, 87.951),
+}
+
+@lru_cache(maxsize=4096)
+def _town_coords(name: str) -> Optional[Tuple[float, float]]:
+    """Coordinates of a location name, memoised since the fuzzy match scans every known town."""
+    upper = name.upper()
+    if upper in LOCATION_COORDS:
+        return LOCATION_COORDS[upper]
+    # Longest matching town name wins, e.g. "WH - Bihar Sharif" -> BIHAR SHARIF
+    matches = [k for k in LOCATION_COORDS if k in upper]
+    return LOCATION_COORDS[max(matches, key=len)] if matches else None
+
+class DistanceOracle:
+    """Memoised distances between the origin and drops of one origin group."""
+
+    def __init__(self, origin: str):
+        self.origin = origin
+        self._cache = {}
+
+    @staticmethod
+    def _road_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * 6371 * math.asin(math.sqrt(h)) * ROAD_FACTOR
+
+    def from_origin(self, drop: str) -> float:
+        key = (None, drop)
+        if key not in self._cache:
+            self._cache[key] = float(estimate_lane_distance(self.origin, drop))
+        return self._cache[key]
+
+    def between(self, a: str, b: str) -> float:
+        if a == b:
+            return 0.0
+        key = (a, b) if a < b else (b, a)
+        if key not in self._cache:
+            ca, cb = _town_coords(a), _town_coords(b)
+            if ca and cb:
+                self._cache[key] = self._road_km(ca, cb)
+            else:
+                self._cache[key] = max(abs(self.from_origin(a) - self.from_origin(b)), FALLBACK_HOP_KM)
+        return self._cache[key]
+
+    def route_km(self, stops: List[str]) -> float:
+        if not stops:
+            return 0.0
+        return self.from_origin(stops[0]) + sum(self.between(a, b) for a, b in zip(stops, stops[1:]))
+
+def clarke_wright(drops: List[str], demand: Dict[str, Tuple[float, float]], capacity: Tuple[float, float],
+                  dist: DistanceOracle, deadline: float, max_stops: int) -> List[List[str]]:
+    """
+    Savings heuristic for open routes (trucks do not return to the origin):
+    appending drop j after drop i saves d(origin, j) - d(i, j) against serving
+    j with its own vehicle. Routes only merge tail-to-head within capacity.
+    Past the deadline no more savings are computed, but the ones already
+    found are always merged: that pass is linear and makes the routes.
+    """
+    route_of = {d: [d] for d in drops}
+    load = {d: demand[d] for d in drops}
+
+    savings = []
+    for i in drops:
+        if time.perf_counter() > deadline:
+            break
+        for j in drops:
+            if i != j:
+                saving = dist.from_origin(j) - dist.between(i, j)
+                if saving > 0:
+                    savings.append((saving, i, j))
+    savings.sort(key=lambda s: (-s[0], s[1], s[2]))
+
+    for _, i, j in savings:
+        ri, rj = route_of[i], route_of[j]
+        if ri is rj or ri[-1] != i or rj[0] != j:
+            continue
+        if len(ri) + len(rj) > max_stops:
+            continue
+        li, lj = load[ri[0]], load[rj[0]]
+        merged_load = (li[0] + lj[0], li[1] + lj[1])
+        if merged_load[0] > capacity[0] or merged_load[1] > capacity[1]:
+            continue
+        merged = ri + rj
+        for d in merged:
+            route_of[d] = merged
+        load[merged[0]] = merged_load
+
+    routes, seen = [], set()
+    for d in drops:
+        route = route_of[d]
+        if id(route) not in seen:
+            seen.add(id(route))
+            routes.append(route)
+    return routes
+
+def two_opt(route: List[str], dist: DistanceOracle, deadline: float) -> List[str]:
+    """Reverses segments of an open route while that shortens it."""
+    best = list(route)
+    best_km = dist.route_km(best)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(len(best) - 1):
+            for j in range(i + 1, len(best)):
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                km = dist.route_km(candidate)
+                if km < best_km - 1e-6:
+                    best, best_km, improved = candidate, km, True
+    return best
+
+def _route_label(origin: str, stops: List[str]) -> str:
+    label = " → ".join([origin.upper()] + [s.upper() for s in stops])
+    if len(label) <= ROUTE_COLUMN_LIMIT:
+        return label
+    short = f"{origin.upper()} → {stops[0].upper()} → … → {stops[-1].upper()} ({len(stops)} drops)"
+    return short[:ROUTE_COLUMN_LIMIT]
+
+def plan_milk_runs(pending_pos: List[PurchaseOrder], dimensions: Optional[Dict[str, ItemDimensions]] = None,
+                   time_budget: Optional[float] = None, dispatch_date: Optional[date] = None,
+                   vehicle_classes: Optional[List[tuple]] = None) -> List[Dict]:
+    """
+    Merges lanes that share an origin into multi-stop milk runs and returns one
+    shipment plan per vehicle with its ordered stop list. Lanes that fill a
+    vehicle on their own stay direct. `vehicle_classes` restricts the fleet
+    (default VEHICLE_CLASSES). Stops improving once `time_budget`
+    seconds are used up and returns the best routes found so far; each
+    origin gets a share of the budget left in proportion to its stops.
+    """
+    if not pending_pos:
+        return []
+    deadline = time.perf_counter() + (MILK_RUN_TIME_BUDGET_SECONDS if time_budget is None else time_budget)
+
+    classes = vehicle_classes or VEHICLE_CLASSES
+    vehicle = next((v for v in classes if v[0] == MILK_RUN_VEHICLE), classes[-1])
+    capacity = (vehicle[1], vehicle[2])
+
+    by_origin = {}
+    with phase("grouping"):
+        for (loc, drop), pos in group_by_lane(pending_pos).items():
+            totals = calculate_totals(pos, dimensions)
+            by_origin.setdefault(loc, {})[drop] = {"pos": pos, "weight": totals["weight"], "cbm": totals["cbm"]}
+
+    if dispatch_date is None:
+        dispatch_dates = get_next_dispatch_dates(date.today())
+        dispatch_date = dispatch_dates[0] if dispatch_dates else date.today()
+
+    plans = []
+    stops_left = sum(len(lanes) for lanes in by_origin.values())
+    for origin in sorted(by_origin):
+        lanes = by_origin[origin]
+        dist = DistanceOracle(origin)
+        demand = {drop: (lane["weight"], lane["cbm"]) for drop, lane in lanes.items()}
+        shared = sorted(d for d, (w, c) in demand.items() if w <= capacity[0] and c <= capacity[1])
+        direct = sorted(d for d in demand if d not in shared)
+
+        # Origins early in name order must not use up the budget of the rest; time one leaves unused rolls over
+        now = time.perf_counter()
+        origin_deadline = now + max(0.0, deadline - now) * len(lanes) / stops_left
+        stops_left -= len(lanes)
+        with phase("savings"):
+            routes = clarke_wright(shared, demand, capacity, dist, origin_deadline, MILK_RUN_MAX_STOPS)
+        with phase("two-opt"):
+            routes = [two_opt(r, dist, origin_deadline) if len(r) > 2 else r for r in routes]
+        routes += [[d] for d in direct]
+        routes.sort(key=lambda r: (-len(r), r[0]))
+
+        for stops in routes:
+            total_weight = sum(demand[d][0] for d in stops)
+            total_cbm = sum(demand[d][1] for d in stops)
+            stop_list, previous = [], None
+            for drop in stops:
+                hop = dist.from_origin(drop) if previous is None else dist.between(previous, drop)
+                stop_list.append({
+                    "drop_location": drop,
+                    "po_ids": [po.id for po in lanes[drop]["pos"]],
+                    "weight": round(demand[drop][0], 2),
+                    "cbm": round(demand[drop][1], 3),
+                    "km_from_previous": round(hop),
+                })
+                previous = drop
+            distance_km = round(dist.route_km(stops))
+
+            if len(stops) > 1:
+                recommendation = f"Milk run from {origin}: {len(stops)} drops share one vehicle."
+            else:
+                recommendation = f"Optimized for {origin} logistics lane."
+
+            plans.append({
+                "dispatch_date": dispatch_date,
+                "expected_arrival_date": dispatch_date + timedelta(days=max(1, math.ceil(distance_km / KM_PER_DAY))),
+                "distance_km": distance_km,
+                "vehicle_type": suggest_vehicle(total_weight, total_cbm, classes),
+                "total_weight": total_weight,
+                "total_cbm": total_cbm,
+                "recommendation": recommendation,
+                "location": origin,
+                "drop_location": stops[-1],
+                "route": _route_label(origin, stops),
+                "po_ids": [po_id for stop in stop_list for po_id in stop["po_ids"]],
+                "status": "Proposed",
+                "stops": stop_list,
+            })
+
+    return plans
@@ -0,0 +1,135 @@
+import os
+import datetime
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session, selectinload
+from .. import models
+from .item_master import resolve_dimensions, effective_dimensions
+from .optimization import VEHICLE_CLASSES, optimize_shipments, vehicles_needed, calculate_totals, group_by_lane
+from .routing import plan_milk_runs
+
+SCENARIO_WORKERS = int(os.getenv("SCENARIO_WORKERS", str(os.cpu_count() or 2)))
+MAX_SCENARIOS = 50
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Plain, picklable copies of the open POs; the optimizer only reads these attributes
+SnapshotItem = namedtuple("SnapshotItem", ["item_code", "quantity", "weight_per_unit", "cbm_per_unit"])
+SnapshotPO = namedtuple("SnapshotPO", ["id", "location", "drop_location", "expected_delivery_date", "items"])
+
+# Context for every planner process pool (scenarios and the sharded optimizer): workers
+# start from a clean interpreter, not a fork of a server with scheduler and DB threads
+if "forkserver" in multiprocessing.get_all_start_methods():
+    POOL_CONTEXT = multiprocessing.get_context("forkserver")
+    # The fork server imports the planners once, so each pool's workers start warm
+    POOL_CONTEXT.set_forkserver_preload([__name__, f"{__package__}.sharding"])
+else:
+    POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+# The snapshot and fleet a scenario worker process plans with, set once by the pool initializer
+_snapshot: List[SnapshotPO] = []
+_vehicle_classes: Optional[List[tuple]] = None
+
+def take_snapshot(db: Session) -> List[SnapshotPO]:
+    """Open POs with item dimensions already resolved, so workers never touch the database."""
+    pos = (
+        db.query(models.PurchaseOrder)
+        .options(selectinload(models.PurchaseOrder.items))
+        .filter(models.PurchaseOrder.status == "Open")
+        .all()
+    )
+    dimensions = resolve_dimensions(db, (item.item_code for po in pos for item in po.items))
+    snapshot = []
+    for po in pos:
+        items = []
+        for item in po.items:
+            w, c = effective_dimensions(item, dimensions)
+            items.append(SnapshotItem(item.item_code, item.quantity or 0, w, c))
+        snapshot.append(SnapshotPO(po.id, po.location, po.drop_location, po.expected_delivery_date, items))
+    return snapshot
+
+def _dispatch_date(params: Dict, today: datetime.date) -> Optional[datetime.date]:
+    if params.get("dispatch_date"):
+        return params["dispatch_date"]
+    weekday = (params.get("dispatch_weekday") or "").lower()
+    if weekday:
+        days_ahead = (WEEKDAYS.index(weekday) - today.weekday() - 1) % 7 + 1
+        return today + datetime.timedelta(days=days_ahead)
+    return None
+
+def evaluate_scenario(snapshot: List[SnapshotPO], params: Dict, vehicle_classes: Optional[List[tuple]] = None) -> Dict:
+    """
+    Plans one parameter set against the snapshot and summarises it as one
+    comparison row. `vehicle_classes` is the fleet (default VEHICLE_CLASSES).
+    """
+    today = datetime.date.today()
+    fleet = vehicle_classes or VEHICLE_CLASSES
+    classes = fleet
+    if params.get("allowed_vehicles"):
+        classes = [v for v in fleet if v[0] in params["allowed_vehicles"]] or fleet
+
+    # Hold lanes below the load threshold for the next cycle
+    planned, held = snapshot, []
+    hold_below = params.get("hold_below_weight") or 0
+    if hold_below > 0:
+        planned = []
+        for pos in group_by_lane(snapshot).values():
+            (held if calculate_totals(pos)["weight"] < hold_below else planned).extend(pos)
+
+    dispatch_date = _dispatch_date(params, today)
+    if params.get("mode") == "milk_run":
+        plans = plan_milk_runs(planned, time_budget=params.get("time_budget"), dispatch_date=dispatch_date, vehicle_classes=classes)
+    else:
+        plans = optimize_shipments(planned, dispatch_date=dispatch_date, vehicle_classes=classes)
+
+    capacity = {name: (max_weight, max_cbm) for name, max_weight, max_cbm in classes}
+    vehicles, kms, fill = 0, 0, []
+    for plan in plans:
+        count = vehicles_needed(plan["total_weight"], plan["total_cbm"], classes)
+        max_weight, max_cbm = capacity[plan["vehicle_type"]]
+        vehicles += count
+        kms += plan["distance_km"] * count
+        fill.append(min(1.0, max(plan["total_weight"] / (max_weight * count), plan["total_cbm"] / (max_cbm * count))))
+
+    transit_days = [(p["expected_arrival_date"] - today).days for p in plans]
+    return {
+        "name": params.get("name"),
+        "dispatch_date": plans[0]["dispatch_date"] if plans else dispatch_date,
+        "vehicles": vehicles,
+        "utilization_pct": round(sum(fill) / len(fill) * 100, 1) if fill else 0.0,
+        "total_km": kms,
+        "avg_eta_days": round(sum(transit_days) / len(transit_days), 1) if transit_days else None,
+        "latest_arrival": max((p["expected_arrival_date"] for p in plans), default=None),
+        "planned_pos": sum(len(p["po_ids"]) for p in plans),
+        "held_pos": len(held),
+        "total_weight": round(sum(p["total_weight"] for p in plans), 2),
+        "total_cbm": round(sum(p["total_cbm"] for p in plans), 3),
+    }
+
+def _load_snapshot(snapshot: List[SnapshotPO], vehicle_classes: Optional[List[tuple]]):
+    global _snapshot, _vehicle_classes
+    _snapshot, _vehicle_classes = snapshot, vehicle_classes
+
+def _evaluate(params: Dict) -> Dict:
+    return evaluate_scenario(_snapshot, params, _vehicle_classes)
+
+def run_scenarios(db: Session, scenarios: List[Dict], vehicle_classes: Optional[List[tuple]] = None) -> Dict:
+    """
+    Evaluates every parameter set against one snapshot of the open POs. The
+    snapshot reaches each worker process once, through the pool initializer;
+    scenarios are then submitted one by one, so a slow one does not hold up
+    the others queued behind it.
+    """
+    taken_at = datetime.datetime.utcnow()
+    snapshot = take_snapshot(db)
+
+    workers = min(SCENARIO_WORKERS, len(scenarios))
+    if workers <= 1:
+        results = [evaluate_scenario(snapshot, params, vehicle_classes) for params in scenarios]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT,
+                                 initializer=_load_snapshot, initargs=(snapshot, vehicle_classes)) as pool:
+            results = list(pool.map(_evaluate, scenarios))
+
+    return {"snapshot": {"open_pos": len(snapshot), "taken_at": taken_at}, "results": results}
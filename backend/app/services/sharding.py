@@ -0,0 +1,163 @@
+import os
+import math
+import time
+import heapq
+import threading
+from array import array
+from collections import namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date
+from typing import Dict, List, Optional
+from ..models import PurchaseOrder
+from .item_master import ItemDimensions, effective_dimensions
+from .optimization import optimize_shipments, get_next_dispatch_dates
+from .profiling import phase
+from .routing import plan_milk_runs, MILK_RUN_TIME_BUDGET_SECONDS
+from .scenarios import POOL_CONTEXT, SnapshotItem, SnapshotPO
+
+OPTIMIZER_WORKERS = int(os.getenv("OPTIMIZER_WORKERS", str(os.cpu_count() or 2)))
+# Milk-run backlogs at least this large are sharded automatically (0 disables the automatic switch)
+OPTIMIZER_SHARD_MIN_POS = int(os.getenv("OPTIMIZER_SHARD_MIN_POS", "5000"))
+
+# One partition of the open POs in flat arrays, which pickle as raw bytes: PO i has
+# location locations[po_location[i]], drop drops[po_drop[i]] and the items
+# item_end[i - 1]:item_end[i]. Item k has quantity item_qty[k] and the resolved
+# per-unit dimensions dim_weight[item_dim[k]], dim_cbm[item_dim[k]]; SKUs share
+# few distinct dimensions, so those are stored once.
+Shard = namedtuple("Shard", [
+    "locations", "drops", "po_ids", "po_location", "po_drop", "item_end",
+    "item_qty", "item_dim", "dim_weight", "dim_cbm",
+])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OPTIMIZER_WORKERS, mp_context=POOL_CONTEXT)
+        return _pool
+
+def should_shard(open_pos: int, mode: str) -> bool:
+    """Lane planning is linear and cheaper than shipping its input to workers, so only routing shards by default."""
+    return (mode == "milk_run" and OPTIMIZER_WORKERS > 1 and OPTIMIZER_SHARD_MIN_POS > 0
+            and open_pos >= OPTIMIZER_SHARD_MIN_POS)
+
+def partition_by_origin(pending_pos: List[PurchaseOrder], dimensions: Optional[Dict[str, ItemDimensions]],
+                        shards: int, mode: str = "lane") -> List[Shard]:
+    """
+    Splits the POs into at most `shards` partitions. Every origin stays whole,
+    so no lane or milk run crosses partitions; origins are spread over the
+    partitions largest first (by estimated planning cost) to balance them.
+    """
+    by_origin = {}
+    for po in pending_pos:
+        by_origin.setdefault(po.location or "Unknown Origin", []).append(po)
+
+    def cost(pos):
+        # Milk runs compare every pair of drops; lane planning is linear in the lines
+        lines = sum(len(po.items) for po in pos) + len(pos)
+        if mode == "milk_run":
+            return lines + len({po.drop_location for po in pos}) ** 2
+        return lines
+
+    bins = [(0, n, []) for n in range(max(1, min(shards, len(by_origin))))]
+    for origin in sorted(by_origin, key=lambda o: (-cost(by_origin[o]), o)):
+        load, n, origins = heapq.heappop(bins)
+        origins.append(origin)
+        heapq.heappush(bins, (load + cost(by_origin[origin]), n, origins))
+
+    shard_of = {origin: n for _, n, origins in bins for origin in origins}
+    shards = [
+        Shard([], [], array("q"), array("i"), array("i"), array("i"), array("q"), array("i"), array("d"), array("d"))
+        for _ in bins
+    ]
+    indexes = [({}, {}, {}) for _ in bins]
+    # Input order is kept inside each shard so lanes are planned as they would be unsharded
+    for po in pending_pos:
+        n = shard_of[po.location or "Unknown Origin"]
+        shard, (location_index, drop_index, dim_index) = shards[n], indexes[n]
+        if po.location not in location_index:
+            location_index[po.location] = len(shard.locations)
+            shard.locations.append(po.location)
+        if po.drop_location not in drop_index:
+            drop_index[po.drop_location] = len(shard.drops)
+            shard.drops.append(po.drop_location)
+        shard.po_ids.append(po.id)
+        shard.po_location.append(location_index[po.location])
+        shard.po_drop.append(drop_index[po.drop_location])
+        for item in po.items:
+            dims = effective_dimensions(item, dimensions)
+            if dims not in dim_index:
+                dim_index[dims] = len(shard.dim_weight)
+                shard.dim_weight.append(dims[0])
+                shard.dim_cbm.append(dims[1])
+            shard.item_dim.append(dim_index[dims])
+            shard.item_qty.append(item.quantity or 0)
+        shard.item_end.append(len(shard.item_qty))
+    return shards
+
+def plan_shard(shard: Shard, mode: str, dispatch_date: date, time_budget: Optional[float],
+               vehicle_classes: Optional[List[tuple]]) -> List[Dict]:
+    """Runs in a worker process: rebuilds plain POs from the arrays and plans them."""
+    pos, start = [], 0
+    for i, po_id in enumerate(shard.po_ids):
+        end = shard.item_end[i]
+        items = [
+            SnapshotItem(None, shard.item_qty[k], shard.dim_weight[shard.item_dim[k]], shard.dim_cbm[shard.item_dim[k]])
+            for k in range(start, end)
+        ]
+        pos.append(SnapshotPO(po_id, shard.locations[shard.po_location[i]], shard.drops[shard.po_drop[i]], None, items))
+        start = end
+    if mode == "milk_run":
+        return plan_milk_runs(pos, time_budget=time_budget, dispatch_date=dispatch_date, vehicle_classes=vehicle_classes)
+    return optimize_shipments(pos, dispatch_date=dispatch_date, vehicle_classes=vehicle_classes)
+
+def optimize_sharded(pending_pos: List[PurchaseOrder], dimensions: Optional[Dict[str, ItemDimensions]] = None,
+                     mode: str = "lane", time_budget: Optional[float] = None, dispatch_date: Optional[date] = None,
+                     vehicle_classes: Optional[List[tuple]] = None, workers: Optional[int] = None,
+                     executor: Optional[Executor] = None) -> List[Dict]:
+    """
+    Same plans as optimize_shipments / plan_milk_runs, computed per origin
+    partition on a process pool and merged in the order the unsharded
+    planner would return them, whatever order the shards finish in.
+    `time_budget` covers the whole call: shards that queue behind others
+    on the pool run in later waves, so each gets its wave's share.
+    """
+    if not pending_pos:
+        return []
+    started = time.perf_counter()
+    workers = workers or OPTIMIZER_WORKERS
+    if time_budget is None and mode == "milk_run":
+        time_budget = MILK_RUN_TIME_BUDGET_SECONDS
+    if dispatch_date is None:
+        # Fixed once here so no shard sees a different "today"
+        dispatch_dates = get_next_dispatch_dates(date.today())
+        dispatch_date = dispatch_dates[0] if dispatch_dates else date.today()
+
+    with phase("shard"):
+        shards = partition_by_origin(pending_pos, dimensions, workers, mode)
+    with phase("pool"):
+        pool = None if len(shards) == 1 else executor or _get_pool()
+        shard_budget = time_budget
+        if time_budget is not None:
+            slots = getattr(pool, "_max_workers", workers) if pool else 1
+            waves = math.ceil(len(shards) / max(1, min(slots, workers)))
+            shard_budget = max(0.0, time_budget - (time.perf_counter() - started)) / waves
+        if pool is None:
+            results = [plan_shard(shards[0], mode, dispatch_date, shard_budget, vehicle_classes)]
+        else:
+            futures = [pool.submit(plan_shard, s, mode, dispatch_date, shard_budget, vehicle_classes) for s in shards]
+            results = [future.result() for future in futures]
+
+    with phase("merge"):
+        plans = [plan for shard_plans in results for plan in shard_plans]
+        if mode == "milk_run":
+            # Unsharded milk runs come out origin by origin in name order
+            plans.sort(key=lambda p: p["location"])
+        else:
+            # Unsharded lanes come out in order of their first PO
+            position = {po.id: n for n, po in enumerate(pending_pos)}
+            plans.sort(key=lambda p: position[p["po_ids"][0]])
+    return plans
@@ -0,0 +1,182 @@
+import os
+import gzip
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from fastapi import Response
+from sqlalchemy import select, null
+from sqlalchemy.orm import Session
+from .. import models
+
+# Optional accelerators; every format still works without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compact alternatives to the default nested JSON of the list endpoints. In the
+# columnar layouts every table is {column: [values...]}; shipments reference
+# purchase orders through a po_ids column and items through po_id, so each
+# PO and item is sent once however many shipments it belongs to.
+NDJSON = "application/x-ndjson"
+COLUMNAR_JSON = "application/vnd.logistics.columnar+json"
+MSGPACK = "application/x-msgpack"
+
+WIRE_COMPRESS_MIN_BYTES = int(os.getenv("WIRE_COMPRESS_MIN_BYTES", "1024"))
+WIRE_GZIP_LEVEL = int(os.getenv("WIRE_GZIP_LEVEL", "6"))
+WIRE_BROTLI_QUALITY = int(os.getenv("WIRE_BROTLI_QUALITY", "5"))
+
+PO_COLUMNS = [
+    "id", "po_number", "order_date", "expected_delivery_date", "date_change_count", "supplier_name",
+    "location", "drop_location", "status", "created_at", "updated_at", "archived_at",
+]
+ITEM_COLUMNS = [
+    "id", "po_id", "item_code", "item_name", "item_group", "hsn_code", "uom",
+    "quantity", "rate", "weight_per_unit", "cbm_per_unit", "updated_at",
+]
+SHIPMENT_COLUMNS = [
+    "id", "dispatch_date", "vehicle_type", "total_weight", "total_cbm", "recommendation", "status",
+    "location", "drop_location", "route", "stops", "vehicle_count", "freight_cost",
+    "created_at", "updated_at", "archived_at",
+]
+
+def supported_formats() -> List[str]:
+    return [NDJSON, COLUMNAR_JSON] + ([MSGPACK] if msgpack else [])
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    The compact format the Accept header prefers, or None for the default JSON
+    response. JSON (named, or through */* and application/*) wins ties.
+    """
+    if not accept:
+        return None
+    supported = supported_formats()
+    best, best_q, json_q = None, 0.0, 0.0
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        media_type = media_type.lower()
+        if media_type == "application/msgpack":
+            media_type = MSGPACK
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ("application/json", "*/*", "application/*"):
+            json_q = max(json_q, q)
+        elif media_type in supported and q > best_q:
+            best, best_q = media_type, q
+    if best is None or json_q >= best_q:
+        return None
+    return best
+
+def _columns(names: List[str], rows) -> Dict[str, list]:
+    rows = list(rows)
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
+
+def _select(table, names: List[str]):
+    """SELECT of `names`, with NULL for columns the table lacks (archived_at on hot tables, updated_at on history)."""
+    return select(*[
+        getattr(table, name) if hasattr(table, name) else null().label(name)
+        for name in names
+    ])
+
+def _tables(include_history: bool):
+    yield models.PurchaseOrder, models.Item, models.Shipment, models.shipment_po_association
+    if include_history:
+        yield models.PurchaseOrderHistory, models.ItemHistory, models.ShipmentHistory, models.shipment_po_association_history
+
+def purchase_order_columns(db: Session, include_history: bool = False) -> Dict[str, Dict[str, list]]:
+    po_rows, item_rows = [], []
+    for po, item, _, _ in _tables(include_history):
+        po_rows += db.execute(_select(po, PO_COLUMNS).order_by(po.id)).all()
+        item_rows += db.execute(_select(item, ITEM_COLUMNS).order_by(item.po_id, item.id)).all()
+    return {"purchase_orders": _columns(PO_COLUMNS, po_rows), "items": _columns(ITEM_COLUMNS, item_rows)}
+
+def shipment_columns(db: Session, include_history: bool = False) -> Dict[str, Dict[str, list]]:
+    shipment_rows, po_ids, po_rows, item_rows = [], [], [], []
+    for po, item, shipment, link in _tables(include_history):
+        rows = db.execute(_select(shipment, SHIPMENT_COLUMNS).order_by(shipment.id)).all()
+        members = {}
+        for shipment_id, po_id in db.execute(select(link.c.shipment_id, link.c.po_id).order_by(link.c.po_id)):
+            members.setdefault(shipment_id, []).append(po_id)
+        shipment_rows += rows
+        po_ids += [members.get(row[0], []) for row in rows]
+
+        linked = select(link.c.po_id).where(link.c.po_id.is_not(None))
+        po_rows += db.execute(_select(po, PO_COLUMNS).where(po.id.in_(linked)).order_by(po.id)).all()
+        item_rows += db.execute(
+            _select(item, ITEM_COLUMNS).where(item.po_id.in_(linked)).order_by(item.po_id, item.id)
+        ).all()
+
+    shipments = _columns(SHIPMENT_COLUMNS, shipment_rows)
+    shipments["po_ids"] = po_ids
+    return {
+        "shipments": shipments,
+        "purchase_orders": _columns(PO_COLUMNS, po_rows),
+        "items": _columns(ITEM_COLUMNS, item_rows),
+    }
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def dumps(value) -> bytes:
+    if orjson:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+# Record type written on each NDJSON line, per table
+NDJSON_TYPES = {"shipments": "shipment", "purchase_orders": "purchase_order", "items": "item"}
+
+def encode(payload: Dict[str, Dict[str, list]], media_type: str) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    if media_type == NDJSON:
+        lines = []
+        for table, columns in payload.items():
+            names = list(columns)
+            record_type = NDJSON_TYPES.get(table, table)
+            for values in zip(*columns.values()):
+                lines.append(dumps({"type": record_type, **dict(zip(names, values))}))
+        return b"\n".join(lines) + b"\n" if lines else b""
+    return dumps(payload)
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> List[str]:
+    accepted = []
+    for part in (accept_encoding or "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if coding and "q=0" not in params:
+            accepted.append(coding.lower())
+    return accepted
+
+def compress(body: bytes, accept_encoding: Optional[str]):
+    """(body, Content-Encoding) using brotli when the client and server both support it, else gzip."""
+    if len(body) < WIRE_COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli and "br" in accepted:
+        return brotli.compress(body, quality=WIRE_BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=WIRE_GZIP_LEVEL), "gzip"
+    return body, None
+
+def render(payload: Dict[str, Dict[str, list]], media_type: str, accept_encoding: Optional[str] = None) -> Response:
+    body, encoding = compress(encode(payload, media_type), accept_encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,91 @@
+"""
+Speedup of the region-sharded optimizer over the single-process one.
+
+Builds a synthetic national backlog in memory (N open POs spread over many
+origins and drops), plans it once with optimize_shipments / plan_milk_runs
+as the reference, then with optimize_sharded on 1, 2, 4 ... worker
+processes. Reports wall time, speedup and the pickled shard payload, and
+checks every sharded plan is identical to the reference.
+
+    cd backend && python benchmarks/sharded_optimizer.py [--pos 100000] [--origins 64] [--drops 150]
+"""
+import os
+import sys
+import time
+import pickle
+import random
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.optimization import optimize_shipments, get_next_dispatch_dates
+from app.services.routing import plan_milk_runs
+from app.services.scenarios import SnapshotItem, SnapshotPO
+from app.services.sharding import optimize_sharded, partition_by_origin
+
+# Routing never gives up early here, so both runs plan to completion and must agree
+TIME_BUDGET = 3600
+
+def backlog(count: int, origins: int, drops: int, seed: int = 3):
+    rng = random.Random(seed)
+    origin_names = [f"Origin {n:03d}" for n in range(origins)]
+    drop_names = [f"Drop {n:03d}" for n in range(drops)]
+    pos = []
+    for po_id in range(1, count + 1):
+        items = [
+            SnapshotItem(f"SKU-{rng.randint(0, 999):04d}", rng.randint(1, 40),
+                         rng.choice([0, 1.5, 3.2, 6.0]), rng.choice([0, 0.02, 0.085, 0.2]))
+            for _ in range(rng.randint(1, 4))
+        ]
+        # A few big origins and a long tail, like a real supplier base
+        origin = origin_names[min(int(rng.paretovariate(1.2)) - 1, origins - 1)] if rng.random() < 0.3 else rng.choice(origin_names)
+        pos.append(SnapshotPO(po_id, origin, rng.choice(drop_names), None, items))
+    return pos
+
+def worker_counts(limit: int):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pos", type=int, default=100000)
+    parser.add_argument("--origins", type=int, default=64)
+    parser.add_argument("--drops", type=int, default=150)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modes", default="lane,milk_run")
+    args = parser.parse_args()
+
+    pos = backlog(args.pos, args.origins, args.drops)
+    dispatch_date = get_next_dispatch_dates(datetime.date.today())[0]
+    print(f"{len(pos)} POs, {args.origins} origins, {args.drops} drops; {os.cpu_count()} CPUs")
+    print(f"Pickled POs: {len(pickle.dumps(pos)) / 1024:.0f} KB; "
+          f"as shards: {len(pickle.dumps(partition_by_origin(pos, None, args.max_workers))) / 1024:.0f} KB")
+
+    print(f"\n{'mode':<10}{'workers':>8}{'seconds':>10}{'speedup':>9}{'plans':>8}  identical")
+    print("-" * 56)
+    for mode in args.modes.split(","):
+        started = time.perf_counter()
+        if mode == "milk_run":
+            reference = plan_milk_runs(pos, time_budget=TIME_BUDGET, dispatch_date=dispatch_date)
+        else:
+            reference = optimize_shipments(pos, dispatch_date=dispatch_date)
+        serial = time.perf_counter() - started
+        print(f"{mode:<10}{'serial':>8}{serial:>10.2f}{1:>9.2f}{len(reference):>8}")
+
+        for workers in worker_counts(args.max_workers):
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Start the workers before timing, as the app's long-lived pool would be
+                list(pool.map(abs, range(workers)))
+                started = time.perf_counter()
+                plans = optimize_sharded(pos, mode=mode, time_budget=TIME_BUDGET, dispatch_date=dispatch_date,
+                                         workers=workers, executor=pool)
+                elapsed = time.perf_counter() - started
+            print(f"{mode:<10}{workers:>8}{elapsed:>10.2f}{serial / elapsed:>9.2f}{len(plans):>8}  {plans == reference}")
+
+if __name__ == "__main__":
+    main()
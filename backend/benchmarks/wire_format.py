@@ -0,0 +1,114 @@
+"""
+Payload size and serialization time of the list endpoints per wire format.
+
+Seeds a throwaway SQLite database with N open POs (3 lines each) grouped
+into shipments of 10, then fetches /api/purchase-orders and /api/shipments
+with each Accept type and reports server time, raw size and the size after
+gzip / brotli.
+
+    cd backend && python benchmarks/wire_format.py [--pos 10000] [--repeat 3]
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+import datetime
+import statistics
+
+# The app reads DATABASE_URL at import time
+_db_dir = tempfile.mkdtemp(prefix="wire-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from app.main import app, scheduler
+from app.database import SessionLocal
+from app import models
+from app.services import wire
+
+FORMATS = [
+    ("json (default)", "application/json"),
+    ("ndjson", wire.NDJSON),
+    ("columnar json", wire.COLUMNAR_JSON),
+]
+if wire.msgpack:
+    FORMATS.append(("msgpack", wire.MSGPACK))
+
+def seed(count: int):
+    db = SessionLocal()
+    now = datetime.datetime.utcnow()
+    db.bulk_insert_mappings(models.PurchaseOrder, [
+        {
+            "po_number": f"BENCH-{i:06d}", "order_date": now.date(), "supplier_name": f"Supplier {i % 40}",
+            "location": ["Mumbai", "Delhi", "Pune", "Surat"][i % 4], "drop_location": f"Warehouse {i % 25}",
+            "expected_delivery_date": now.date() + datetime.timedelta(days=i % 30),
+            "status": "Consolidated", "created_at": now, "updated_at": now,
+        }
+        for i in range(count)
+    ])
+    db.commit()
+    po_ids = [row[0] for row in db.query(models.PurchaseOrder.id).order_by(models.PurchaseOrder.id)]
+    db.bulk_insert_mappings(models.Item, [
+        {
+            "po_id": po_id, "item_code": f"SKU-{(po_id * 7 + line) % 500:04d}", "item_name": f"Trolley case {line}",
+            "item_group": "Luggage", "hsn_code": "420212", "uom": "Nos", "quantity": 10 + line,
+            "rate": 1450.0, "weight_per_unit": 3.2, "cbm_per_unit": 0.085, "updated_at": now,
+        }
+        for po_id in po_ids for line in range(3)
+    ])
+    shipments = [
+        {"dispatch_date": now.date(), "vehicle_type": "19ft Container", "total_weight": 1000.0, "total_cbm": 30.0,
+         "location": "Mumbai", "drop_location": "Warehouse 1", "route": "MUMBAI → WAREHOUSE 1",
+         "recommendation": "Optimized for Mumbai logistics lane.", "status": "Proposed",
+         "created_at": now, "updated_at": now}
+        for _ in range(0, count, 10)
+    ]
+    db.bulk_insert_mappings(models.Shipment, shipments)
+    db.commit()
+    shipment_ids = [row[0] for row in db.query(models.Shipment.id).order_by(models.Shipment.id)]
+    db.execute(models.shipment_po_association.insert(), [
+        {"shipment_id": shipment_ids[n // 10], "po_id": po_id} for n, po_id in enumerate(po_ids)
+    ])
+    db.commit()
+    db.close()
+
+def measure(client: TestClient, path: str, accept: str, repeat: int):
+    timings, body = [], b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, headers={"Accept": accept, "Accept-Encoding": "identity"})
+        timings.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        body = response.content
+    started = time.perf_counter()
+    gzipped = gzip.compress(body, compresslevel=wire.WIRE_GZIP_LEVEL)
+    gzip_ms = (time.perf_counter() - started) * 1000
+    brotli_size = len(wire.brotli.compress(body, quality=wire.WIRE_BROTLI_QUALITY)) if wire.brotli else None
+    return statistics.median(timings), len(body), len(gzipped), gzip_ms, brotli_size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pos", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    scheduler.shutdown(wait=False)
+    print(f"Seeding {args.pos} POs ({args.pos * 3} lines, {args.pos // 10} shipments)...")
+    seed(args.pos)
+    print(f"Encoder: {'orjson' if wire.orjson else 'json'}; msgpack: {'yes' if wire.msgpack else 'not installed'}; "
+          f"brotli: {'yes' if wire.brotli else 'not installed'}\n")
+
+    client = TestClient(app)
+    header = f"{'endpoint':<22}{'format':<16}{'server ms':>10}{'raw KB':>10}{'gzip KB':>10}{'gzip ms':>9}{'br KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for path in ("/api/purchase-orders", "/api/shipments"):
+        for label, accept in FORMATS:
+            ms, raw, gz, gz_ms, br = measure(client, path, accept, args.repeat)
+            br_text = f"{br / 1024:>9.0f}" if br is not None else f"{'-':>9}"
+            print(f"{path:<22}{label:<16}{ms:>10.0f}{raw / 1024:>10.0f}{gz / 1024:>10.0f}{gz_ms:>9.0f}{br_text}")
+
+if __name__ == "__main__":
+    main()
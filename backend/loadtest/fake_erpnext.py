@@ -0,0 +1,169 @@
+"""
+A small stand-in for the Frappe/ERPNext REST API, enough for the portal's
+sync, item master lookup and status write-back, with configurable latency
+and failure rate.
+
+    python loadtest/fake_erpnext.py --port 8001 --pos 500 --latency-ms 80 --failure-rate 0.02
+
+Point the portal at it with ERPNEXT_URL=http://127.0.0.1:8001 and any
+ERPNEXT_API_KEY / ERPNEXT_API_SECRET.
+"""
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+ORIGINS = ["Mumbai", "Delhi", "Pune", "Surat", "Kolkata", "Ahmedabad"]
+DROPS = ["Patna", "Muzaffarpur", "Gaya", "Bhagalpur", "Darbhanga", "Purnia"]
+
+class FakeERPNext:
+    """Deterministic catalogue of open POs and items plus the request counters."""
+
+    def __init__(self, pos: int = 500, items_per_po: int = 3, skus: int = 300,
+                 latency_ms: float = 50, jitter_ms: float = 25, failure_rate: float = 0.0, seed: int = 7):
+        rng = random.Random(seed)
+        today = datetime.date.today()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.items = {
+            f"LT-SKU-{n:04d}": {
+                "item_code": f"LT-SKU-{n:04d}",
+                "item_name": f"Load test item {n}",
+                "weight_per_unit": round(rng.uniform(0.5, 12), 2),
+                "custom_cbm_per_unit": round(rng.uniform(0.005, 0.2), 3),
+            }
+            for n in range(skus)
+        }
+        codes = sorted(self.items)
+        self.pos = {}
+        for n in range(pos):
+            name = f"PO-LT-{n:05d}"
+            supplier = f"Load Test Supplier {n % 25}"
+            self.pos[name] = {
+                "name": name,
+                "supplier": supplier,
+                "status": "To Receive and Bill",
+                "transaction_date": (today - datetime.timedelta(days=rng.randint(0, 30))).isoformat(),
+                "schedule_date": (today + datetime.timedelta(days=rng.randint(3, 40))).isoformat(),
+                "modified": f"{today.isoformat()} 00:00:00.000000",
+                "supplier_address_name": f"{supplier}-{ORIGINS[n % len(ORIGINS)]}",
+                "shipping_address_name": f"WH-{DROPS[n % len(DROPS)]}",
+                "items": [
+                    {
+                        "item_code": code,
+                        "item_name": self.items[code]["item_name"],
+                        "qty": rng.randint(5, 200),
+                        "uom": "Nos",
+                        "rate": round(rng.uniform(100, 3000), 2),
+                        # Only some PO lines carry dimensions, like real ERPNext data
+                        "weight_per_unit": self.items[code]["weight_per_unit"] if rng.random() < 0.5 else 0,
+                    }
+                    for code in rng.sample(codes, items_per_po)
+                ],
+            }
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        seconds = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if seconds:
+            time.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = random.random() < self.failure_rate
+            self.failures += failed
+            return failed
+
+def make_handler(erp: FakeERPNext):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _begin(self) -> bool:
+            erp.delay()
+            if erp.should_fail():
+                self._send({"exc_type": "FakeFailure", "message": "Injected failure"}, 503)
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path, query = unquote(url.path), parse_qs(url.query)
+            if not self._begin():
+                return
+            if path == "/api/resource/Purchase Order":
+                start = int(query.get("limit_start", ["0"])[0])
+                length = int(query.get("limit_page_length", ["20"])[0])
+                names = sorted(erp.pos)[start:start + length]
+                fields = ("name", "transaction_date", "supplier", "status", "modified")
+                return self._send({"data": [{k: erp.pos[n][k] for k in fields} for n in names]})
+            if path.startswith("/api/resource/Purchase Order/"):
+                po = erp.pos.get(path.rsplit("/", 1)[1])
+                return self._send({"data": po} if po else {"exc_type": "DoesNotExistError"}, 200 if po else 404)
+            if path == "/api/resource/Item":
+                filters = json.loads(query.get("filters", ["[]"])[0])
+                codes = next((f[2] for f in filters if f[0] == "item_code" and f[1] == "in"), [])
+                return self._send({"data": [erp.items[c] for c in codes if c in erp.items]})
+            self._send({"exc_type": "NotFound"}, 404)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self._begin():
+                return
+            if self.path.startswith("/api/method/"):
+                return self._send({"message": "ok"})
+            self._send({"exc_type": "NotFound"}, 404)
+
+        do_PUT = do_POST
+
+    return Handler
+
+def start(erp: FakeERPNext, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serves `erp` from a daemon thread; port 0 picks a free port (see server.server_port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(erp))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--pos", type=int, default=500)
+    parser.add_argument("--items-per-po", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=25)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    erp = FakeERPNext(args.pos, args.items_per_po, latency_ms=args.latency_ms,
+                      jitter_ms=args.jitter_ms, failure_rate=args.failure_rate)
+    server = start(erp, args.host, args.port)
+    print(f"Fake ERPNext on http://{args.host}:{server.server_port} with {len(erp.pos)} POs")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"{erp.requests} requests, {erp.failures} injected failures")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
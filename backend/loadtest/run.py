@@ -0,0 +1,451 @@
+"""
+Load test for the portal API: simulated dashboards, uploads and ERPNext sync.
+
+Each simulated dashboard follows App.jsx: it loads the dashboard summary,
+the PO list (columnar), the optimizer and supplier performance once, then
+either repeats that every --poll-interval seconds (the 60 s fallback) or,
+with --mode sse, keeps /api/events open and refetches on change events.
+Dashboards also patch PO statuses. Alongside them, uploaders post Excel and
+PDF files and a syncer triggers the ERPNext sync against a fake Frappe
+server (loadtest/fake_erpnext.py) with configurable latency and failures.
+
+The report has per-route throughput and p50/p95/p99 latency, plus DB
+statement timings, slow writes (likely lock waits) and lock errors taken
+from /api/metrics/db on every worker.
+
+Against a running server (which must use the fake ERPNext for the sync):
+
+    python loadtest/run.py --base-url http://127.0.0.1:8000 --dashboards 50 --duration 120
+
+Capacity curve: starts gunicorn as in the Procfile for every worker count
+and runs every dashboard count against a fresh SQLite database:
+
+    python loadtest/run.py --workers 1,2,4 --dashboards 10,50,100 --duration 60 --poll-interval 10
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+import requests
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_erpnext
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMNAR_JSON = "application/vnd.logistics.columnar+json"
+ORIGINS = ["Mumbai", "Delhi", "Pune", "Surat"]
+
+class Recorder:
+    """Latencies and errors per route, shared by all client threads."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, route: str, ms: float, ok: bool):
+        with self._lock:
+            self.latencies[route].append(ms)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, duration: float):
+        rows = []
+        everything = []
+        with self._lock:
+            for route in sorted(self.latencies):
+                samples = sorted(self.latencies[route])
+                everything += samples
+                rows.append(_stats(route, samples, self.errors[route], duration))
+            total_errors = sum(self.errors.values())
+        rows.append(_stats("ALL", sorted(everything), total_errors, duration))
+        return rows
+
+def _percentile(ordered, q):
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+
+def _stats(route, ordered, errors, duration):
+    return {
+        "route": route,
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / duration, 2) if duration else 0,
+        "p50_ms": _percentile(ordered, 0.50),
+        "p95_ms": _percentile(ordered, 0.95),
+        "p99_ms": _percentile(ordered, 0.99),
+        "max_ms": round(ordered[-1], 1) if ordered else None,
+    }
+
+class Client:
+    """One simulated browser or job: a requests session that records every call."""
+
+    def __init__(self, base_url: str, recorder: Recorder, stop: threading.Event, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.stop = stop
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, method: str, route: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(route, (time.perf_counter() - started) * 1000, ok)
+        return response if ok else None
+
+def _po_ids(response):
+    if response is None:
+        return []
+    try:
+        data = response.json()
+    except ValueError:
+        return []
+    if isinstance(data, list):
+        return [po["id"] for po in data]
+    return data.get("purchase_orders", {}).get("id", [])
+
+def dashboard(client: Client, args, rng: random.Random):
+    known_ids = []
+
+    def fetch(resources=("summary", "pos", "optimization", "performance")):
+        nonlocal known_ids
+        if "summary" in resources:
+            client.call("GET", "GET /api/dashboard/summary", "/api/dashboard/summary")
+        if "pos" in resources:
+            ids = _po_ids(client.call("GET", "GET /api/purchase-orders", "/api/purchase-orders",
+                                      headers={"Accept": COLUMNAR_JSON}))
+            known_ids = ids or known_ids
+        if "optimization" in resources:
+            client.call("POST", "POST /api/optimize", "/api/optimize")
+        if "performance" in resources:
+            client.call("GET", "GET /api/suppliers/performance", "/api/suppliers/performance")
+
+    def maybe_patch():
+        if known_ids and rng.random() < args.patch_rate:
+            status = rng.choice(["Confirmed", "In Production", "Open"])
+            client.call("PATCH", "PATCH /api/purchase-orders/{id}/status",
+                        f"/api/purchase-orders/{rng.choice(known_ids)}/status", json={"status": status})
+
+    # Browsers open at different moments
+    if client.stop.wait(rng.uniform(0, min(args.poll_interval, args.ramp_up))):
+        return
+    fetch()
+
+    if args.mode == "poll":
+        while not client.stop.wait(args.poll_interval):
+            fetch()
+            maybe_patch()
+        return
+
+    # SSE: refetch per resource on change events, debounced like App.jsx
+    pending, changed = set(), threading.Event()
+    routes = {
+        "po.created": ("summary", "pos", "performance"), "po.updated": ("summary", "pos", "performance"),
+        "po.deleted": ("summary", "pos", "performance"), "po.archived": ("summary", "pos", "performance"),
+        "shipment.created": ("summary", "pos", "performance"), "optimization.changed": ("optimization",),
+        "sync.finished": ("summary", "pos", "optimization", "performance"),
+        "resync": ("summary", "pos", "optimization", "performance"),
+    }
+
+    def listen():
+        stream = requests.Session()
+        while not client.stop.is_set():
+            try:
+                with stream.get(client.base_url + "/api/events", stream=True, timeout=(5, 60)) as response:
+                    for line in response.iter_lines(decode_unicode=True):
+                        if client.stop.is_set():
+                            return
+                        if line and line.startswith("event:"):
+                            pending.update(routes.get(line.split(":", 1)[1].strip(), ()))
+                            changed.set()
+            except requests.RequestException:
+                client.recorder.record("SSE /api/events (disconnect)", 0, False)
+                client.stop.wait(1)
+
+    threading.Thread(target=listen, daemon=True).start()
+    next_patch = time.monotonic() + args.poll_interval
+    while not client.stop.is_set():
+        if changed.wait(timeout=1):
+            client.stop.wait(0.3)
+            changed.clear()
+            resources = tuple(pending)
+            pending.clear()
+            fetch(resources)
+        if time.monotonic() >= next_patch:
+            maybe_patch()
+            next_patch = time.monotonic() + args.poll_interval
+
+def excel_upload(rows: int, rng: random.Random, prefix: str) -> bytes:
+    records = []
+    for n in range(rows):
+        po = f"{prefix}-{n // 3:05d}"
+        records.append({
+            "Document No.": po,
+            "Supplier": f"Upload Supplier {n % 10}",
+            "State": ORIGINS[(n // 3) % len(ORIGINS)],
+            "Item Code": f"LT-SKU-{rng.randint(0, 299):04d}",
+            "Item Name": "Load test item",
+            "Qty": rng.randint(5, 100),
+            "Rate": 1200,
+            "Weight/Unit": rng.choice([0, 2.5, 4.0]),
+            "CBM/Unit": rng.choice([0, 0.05, 0.08]),
+        })
+    buffer = io.BytesIO()
+    pd.DataFrame(records).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+def pdf_upload(po_number: str, lines: int, rng: random.Random) -> bytes:
+    """A one-page PDF in the High Spirit layout the PDF parser understands, built by hand."""
+    text = [
+        f"Order No. : {po_number}",
+        f"Order Date : {time.strftime('%d-%m-%Y')}",
+        "Vendor Name : Load Test PDF Vendor",
+        f"State : {rng.choice(ORIGINS)}",
+    ]
+    for n in range(lines):
+        qty = rng.randint(10, 500)
+        text.append(f"LTSKU{n:04d} Trolley Case 420212 {qty} Pcs 1450.00 {qty * 1450:.2f}")
+    content = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(
+        "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '" for line in text
+    ) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def uploader(client: Client, args, rng: random.Random, worker: int):
+    sequence = 0
+    while not client.stop.wait(rng.uniform(0.5, 1.5) * args.upload_interval):
+        sequence += 1
+        prefix = f"LT-UP{worker}-{sequence:04d}"
+        if sequence % 2:
+            files = {"file": (f"{prefix}.xlsx", excel_upload(args.upload_rows, rng, prefix),
+                              "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+            client.call("POST", "POST /api/purchase-orders/upload (xlsx)", "/api/purchase-orders/upload", files=files)
+        else:
+            files = {"file": (f"{prefix}.pdf", pdf_upload(prefix, 8, rng), "application/pdf")}
+            client.call("POST", "POST /api/purchase-orders/upload (pdf)", "/api/purchase-orders/upload", files=files)
+
+def syncer(client: Client, args):
+    while not client.stop.wait(args.sync_interval):
+        client.call("POST", "POST /api/erpnext/sync", "/api/erpnext/sync")
+
+def collect_db_metrics(base_url: str, workers: int) -> dict:
+    """Latest /api/metrics/db snapshot from as many distinct workers as answer within a few tries."""
+    by_pid = {}
+    for _ in range(max(4, workers * 8)):
+        try:
+            # A new connection each time, so the kernel can hand it to a different worker
+            snapshot = requests.get(base_url.rstrip("/") + "/api/metrics/db", timeout=10,
+                                    headers={"Connection": "close"}).json()
+        except (requests.RequestException, ValueError):
+            continue
+        by_pid[snapshot["pid"]] = snapshot
+        if len(by_pid) >= workers:
+            break
+    return by_pid
+
+def summarize_db(before: dict, after: dict) -> dict:
+    """Sums the per-worker counters accumulated during the run."""
+    totals = {"workers_seen": len(after), "reads": 0, "writes": 0, "write_ms": 0.0,
+              "slow_writes": 0, "slow_write_ms": 0.0, "lock_errors": 0, "write_p95_ms_max": None, "server": None}
+    for pid, snapshot in after.items():
+        base = before.get(pid, {})
+        base_statements = base.get("statements", {})
+        statements = snapshot["statements"]
+        totals["reads"] += statements["read"]["count"] - base_statements.get("read", {}).get("count", 0)
+        totals["writes"] += statements["write"]["count"] - base_statements.get("write", {}).get("count", 0)
+        totals["write_ms"] += statements["write"]["total_ms"] - base_statements.get("write", {}).get("total_ms", 0)
+        totals["slow_writes"] += snapshot["slow_writes"] - base.get("slow_writes", 0)
+        totals["slow_write_ms"] += snapshot["slow_write_ms"] - base.get("slow_write_ms", 0)
+        totals["lock_errors"] += snapshot["lock_errors"] - base.get("lock_errors", 0)
+        p95 = statements["write"]["p95_ms"]
+        if p95 is not None:
+            totals["write_p95_ms_max"] = max(p95, totals["write_p95_ms_max"] or 0)
+        totals["server"] = snapshot.get("server")
+    totals["write_ms"] = round(totals["write_ms"], 1)
+    totals["slow_write_ms"] = round(totals["slow_write_ms"], 1)
+    return totals
+
+def run_load(base_url: str, args, dashboards: int, workers: int) -> dict:
+    recorder, stop = Recorder(), threading.Event()
+    rng = random.Random(args.seed)
+    before = collect_db_metrics(base_url, workers)
+
+    threads = []
+    for n in range(dashboards):
+        client = Client(base_url, recorder, stop, args.timeout)
+        threads.append(threading.Thread(target=dashboard, args=(client, args, random.Random(rng.random())), daemon=True))
+    for n in range(args.uploaders):
+        client = Client(base_url, recorder, stop, args.timeout)
+        threads.append(threading.Thread(target=uploader, args=(client, args, random.Random(rng.random()), n), daemon=True))
+    if args.sync_interval > 0:
+        threads.append(threading.Thread(target=syncer, args=(Client(base_url, recorder, stop, args.timeout), args), daemon=True))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(args.duration)
+    finally:
+        stop.set()
+    for thread in threads:
+        thread.join(timeout=args.timeout)
+    duration = time.perf_counter() - started
+
+    return {
+        "workers": workers,
+        "dashboards": dashboards,
+        "duration_s": round(duration, 1),
+        "routes": recorder.report(duration),
+        "db": summarize_db(before, collect_db_metrics(base_url, workers)),
+    }
+
+def seed(base_url: str, args):
+    """Initial data: one ERPNext sync and one large Excel upload."""
+    session = requests.Session()
+    session.post(base_url + "/api/erpnext/sync", timeout=300)
+    if args.seed_pos:
+        data = excel_upload(args.seed_pos * 3, random.Random(args.seed), "LT-SEED")
+        session.post(base_url + "/api/purchase-orders/upload", timeout=300,
+                     files={"file": ("seed.xlsx", data, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")})
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers: int, erpnext_url: str, database_url: str):
+    """gunicorn with uvicorn workers, as in the Procfile, on a free local port."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, ERPNEXT_URL=erpnext_url,
+               ERPNEXT_API_KEY="loadtest", ERPNEXT_API_SECRET="loadtest")
+    # Create the schema once so the workers don't race on CREATE TABLE
+    subprocess.run([sys.executable, "-c", "from app.database import Base, engine; from app import models; "
+                    "Base.metadata.create_all(bind=engine)"], cwd=BACKEND_DIR, env=env, check=True)
+    process = subprocess.Popen(
+        ["gunicorn", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker", "app.main:app",
+         "--bind", f"127.0.0.1:{port}", "--timeout", "120"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + "/", timeout=2).ok:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"gunicorn with {workers} workers did not start")
+
+def print_run(result: dict):
+    print(f"\n=== {result['workers']} worker(s), {result['dashboards']} dashboards, {result['duration_s']} s ===")
+    print(f"{'route':<44}{'reqs':>7}{'err':>6}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for row in result["routes"]:
+        print(f"{row['route']:<44}{row['requests']:>7}{row['errors']:>6}{row['rps']:>8}"
+              f"{row['p50_ms'] or '-':>8}{row['p95_ms'] or '-':>8}{row['p99_ms'] or '-':>8}{row['max_ms'] or '-':>8}")
+    db = result["db"]
+    print(f"DB ({db['workers_seen']} worker(s) reporting): {db['reads']} reads, {db['writes']} writes "
+          f"({db['write_ms']} ms), write p95 {db['write_p95_ms_max']} ms, "
+          f"{db['slow_writes']} slow writes ({db['slow_write_ms']} ms), {db['lock_errors']} lock errors"
+          + (f", server: {db['server']}" if db["server"] else ""))
+
+def print_curve(results):
+    print("\n=== Capacity curve ===")
+    print(f"{'workers':>8}{'dashboards':>11}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'err %':>7}{'slow wr':>9}{'lock err':>9}")
+    for result in results:
+        total = result["routes"][-1]
+        error_pct = round(total["errors"] / total["requests"] * 100, 1) if total["requests"] else 0
+        print(f"{result['workers']:>8}{result['dashboards']:>11}{total['rps']:>8}{total['p50_ms'] or '-':>8}"
+              f"{total['p95_ms'] or '-':>8}{total['p99_ms'] or '-':>8}{error_pct:>7}"
+              f"{result['db']['slow_writes']:>9}{result['db']['lock_errors']:>9}")
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Test a running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=_int_list, default=[4], help="Comma-separated gunicorn worker counts")
+    parser.add_argument("--dashboards", type=_int_list, default=[20], help="Comma-separated concurrent dashboard counts")
+    parser.add_argument("--mode", choices=["poll", "sse"], default="poll")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds per run")
+    parser.add_argument("--poll-interval", type=float, default=60)
+    parser.add_argument("--ramp-up", type=float, default=10, help="Dashboards open within this many seconds")
+    parser.add_argument("--patch-rate", type=float, default=0.2, help="Chance of a status patch per dashboard cycle")
+    parser.add_argument("--uploaders", type=int, default=1)
+    parser.add_argument("--upload-interval", type=float, default=30)
+    parser.add_argument("--upload-rows", type=int, default=150)
+    parser.add_argument("--sync-interval", type=float, default=60, help="0 disables the ERPNext sync")
+    parser.add_argument("--seed-pos", type=int, default=1000, help="POs uploaded before each spawned run")
+    parser.add_argument("--erpnext-url", help="Use this ERPNext instead of starting the fake one")
+    parser.add_argument("--erp-pos", type=int, default=500)
+    parser.add_argument("--erp-latency-ms", type=float, default=80)
+    parser.add_argument("--erp-failure-rate", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write all results to this file")
+    args = parser.parse_args()
+
+    erpnext_url = args.erpnext_url
+    if not erpnext_url and not args.base_url:
+        erp = fake_erpnext.FakeERPNext(args.erp_pos, latency_ms=args.erp_latency_ms, failure_rate=args.erp_failure_rate)
+        erpnext_url = f"http://127.0.0.1:{fake_erpnext.start(erp).server_port}"
+        print(f"Fake ERPNext at {erpnext_url} ({args.erp_latency_ms} ms, {args.erp_failure_rate:.0%} failures)")
+
+    results = []
+    if args.base_url:
+        for dashboards in args.dashboards:
+            result = run_load(args.base_url, args, dashboards, max(args.workers))
+            print_run(result)
+            results.append(result)
+    else:
+        for workers in args.workers:
+            for dashboards in args.dashboards:
+                db_dir = tempfile.mkdtemp(prefix="loadtest-")
+                process, base_url = start_server(workers, erpnext_url, f"sqlite:///{os.path.join(db_dir, 'load.db')}")
+                try:
+                    seed(base_url, args)
+                    result = run_load(base_url, args, dashboards, workers)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+                print_run(result)
+                results.append(result)
+
+    if len(results) > 1:
+        print_curve(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import {
     Package,
@@ -37,9 +37,27 @@ import { motion, AnimatePresence } from 'framer-motion';
 // Configure axios for deployment
 axios.defaults.baseURL = import.meta.env.VITE_API_URL || '';
 
+// Compact list format: one {column: values[]} object per table, items reference their PO by po_id
+const COLUMNAR_JSON = 'application/vnd.logistics.columnar+json';
+
+const rowsFromColumns = (table) => {
+    const keys = Object.keys(table);
+    return (table.id || []).map((_, i) => Object.fromEntries(keys.map(k => [k, table[k][i]])));
+};
+
+const posFromColumnar = (data) => {
+    if (Array.isArray(data)) return data; // Older backends answer with the nested JSON list
+    const itemsByPo = {};
+    rowsFromColumns(data.items).forEach(item => {
+        (itemsByPo[item.po_id] = itemsByPo[item.po_id] || []).push(item);
+    });
+    return rowsFromColumns(data.purchase_orders).map(po => ({ ...po, items: itemsByPo[po.id] || [] }));
+};
+
 function App() {
     const [pos, setPos] = useState([]);
     const [performance, setPerformance] = useState({});
+    const [summary, setSummary] = useState(null);
     const [loading, setLoading] = useState(false);
     const [plans, setPlans] = useState([]);
     const [activeTab, setActiveTab] = useState('dashboard');
@@ -70,32 +88,83 @@ function App() {
         localStorage.setItem('theme', theme);
     }, [theme]);
 
+    // True while the /api/events stream is open; actions then rely on the pushed change events
+    const liveUpdates = useRef(false);
+
     useEffect(() => {
         if (isLoggedIn) {
             fetchData();
 
-            const timer = setInterval(() => {
-                fetchData();
-            }, 60000);
-            return () => clearInterval(timer);
+            if (!window.EventSource) {
+                const timer = setInterval(() => {
+                    fetchData();
+                }, 60000);
+                return () => clearInterval(timer);
+            }
+
+            // Coalesce bursts of change events into one refetch per resource
+            const pending = new Set();
+            let flushTimer = null;
+            const schedule = (...resources) => {
+                resources.forEach(r => pending.add(r));
+                clearTimeout(flushTimer);
+                flushTimer = setTimeout(() => {
+                    if (pending.has('pos')) fetchPos();
+                    if (pending.has('summary')) fetchSummary();
+                    if (pending.has('optimization')) fetchOptimization();
+                    if (pending.has('performance')) fetchPerformance();
+                    pending.clear();
+                }, 300);
+            };
+
+            const source = new EventSource(`${axios.defaults.baseURL}/api/events`);
+            source.onopen = () => { liveUpdates.current = true; };
+            source.onerror = () => { liveUpdates.current = false; };
+            ['po.created', 'po.updated', 'po.deleted', 'po.archived', 'shipment.created'].forEach(type =>
+                source.addEventListener(type, () => schedule('pos', 'summary', 'performance'))
+            );
+            source.addEventListener('optimization.changed', () => schedule('optimization'));
+            source.addEventListener('sync.finished', () => schedule('pos', 'summary', 'optimization', 'performance'));
+            source.addEventListener('resync', () => schedule('pos', 'summary', 'optimization', 'performance'));
+
+            return () => {
+                clearTimeout(flushTimer);
+                source.close();
+                liveUpdates.current = false;
+            };
         }
     }, [isLoggedIn]);
 
     const fetchData = () => {
+        fetchSummary();
         fetchPos();
         fetchOptimization();
         fetchPerformance();
     };
 
+    // After our own writes: the event stream triggers the refetch when connected
+    const refreshAfterAction = () => {
+        if (!liveUpdates.current) fetchData();
+    };
+
     const fetchPos = async () => {
         try {
-            const res = await axios.get('/api/purchase-orders');
-            setPos(res.data);
+            const res = await axios.get('/api/purchase-orders', { headers: { Accept: COLUMNAR_JSON } });
+            setPos(posFromColumnar(res.data));
         } catch (err) {
             console.error("Error fetching POs", err);
         }
     };
 
+    const fetchSummary = async () => {
+        try {
+            const res = await axios.get('/api/dashboard/summary');
+            setSummary(res.data);
+        } catch (err) {
+            console.error("Error fetching dashboard summary", err);
+        }
+    };
+
     const fetchOptimization = async () => {
         try {
             const res = await axios.post('/api/optimize');
@@ -130,7 +199,7 @@ function App() {
             setLoading(true);
             const res = await axios.patch(`/api/purchase-orders/${poId}/status`, { status });
             alert(res.data.message);
-            fetchData();
+            refreshAfterAction();
         } catch (err) {
             alert("Status update failed: " + (err.response?.data?.detail || err.message));
         } finally {
@@ -143,7 +212,7 @@ function App() {
             setLoading(true);
             const res = await axios.patch(`/api/purchase-orders/${poId}/delivery-date`, { expected_delivery_date: date });
             alert(res.data.message);
-            fetchData();
+            refreshAfterAction();
         } catch (err) {
             alert("Update failed: " + (err.response?.data?.detail || err.message));
         } finally {
@@ -156,7 +225,7 @@ function App() {
         try {
             const res = await axios.post('/api/erpnext/sync');
             alert("ORDER SYNC: " + (res.data.message || "Refresh Complete"));
-            fetchData();
+            refreshAfterAction();
         } catch (err) {
             alert("Sync failed.");
         } finally {
@@ -169,7 +238,7 @@ function App() {
         setLoading(true);
         try {
             await axios.delete('/api/purchase-orders');
-            fetchData();
+            refreshAfterAction();
         } finally {
             setLoading(false);
         }
@@ -179,7 +248,7 @@ function App() {
         setLoading(true);
         try {
             const res = await axios.post('/api/shipments', plan);
-            await fetchData();
+            refreshAfterAction();
             alert("✅ SHIPMENT DISPATCHED: All POs consolidated and synced.");
         } catch (err) {
             console.error(err);
@@ -453,29 +522,42 @@ function App() {
                                             <div>
                                                 <div className="flex justify-between text-xs mb-2">
                                                     <span className="text-slate-400 font-bold uppercase">Ready to Dispatch</span>
-                                                    <span className="text-white font-bold">{pos.filter(p => ['Completed', 'Dispatch'].includes(p.status)).length} / {pos.filter(p => p.status !== 'Cancelled').length} Orders</span>
+                                                    <span className="text-white font-bold">{summary?.ready_pos ?? 0} / {summary?.active_pos ?? 0} Orders</span>
                                                 </div>
                                                 <div className="h-1.5 bg-black/40 rounded-full overflow-hidden">
                                                     <div
                                                         className="h-full bg-brand-500 transition-all duration-1000"
-                                                        style={{ width: `${(pos.filter(p => ['Completed', 'Dispatch'].includes(p.status)).length / (pos.filter(p => p.status !== 'Cancelled').length || 1)) * 100}%` }}
+                                                        style={{ width: `${summary?.ready_pct ?? 0}%` }}
                                                     />
                                                 </div>
                                             </div>
                                             <div className="grid grid-cols-2 gap-4">
                                                 <div className="bg-white/5 p-4 rounded-xl border border-white/5">
                                                     <div className="text-2xl font-bold text-emerald-400 whitespace-nowrap">
-                                                        {Math.round((pos.filter(p => ['Completed', 'Dispatch'].includes(p.status)).length / (pos.filter(p => p.status !== 'Cancelled').length || 1)) * 100) || 0}
+                                                        {summary?.ready_pct ?? 0}
                                                         <span className="text-[10px] ml-1">%</span>
                                                     </div>
                                                     <div className="text-[10px] text-slate-500 font-bold uppercase tracking-widest mt-1">Ready</div>
                                                 </div>
                                                 <div className="bg-white/5 p-4 rounded-xl border border-white/5">
                                                     <div className="text-2xl font-bold text-red-500 whitespace-nowrap">
-                                                        {pos.filter(p => p.status === 'Cancelled').length}
+                                                        {summary?.status_counts?.Cancelled ?? 0}
                                                     </div>
                                                     <div className="text-[10px] text-slate-500 font-bold uppercase tracking-widest mt-1">Alerts</div>
                                                 </div>
+                                                <div className="bg-white/5 p-4 rounded-xl border border-white/5">
+                                                    <div className="text-2xl font-bold text-amber-400 whitespace-nowrap">
+                                                        {summary?.overdue?.count ?? 0}
+                                                    </div>
+                                                    <div className="text-[10px] text-slate-500 font-bold uppercase tracking-widest mt-1">Overdue</div>
+                                                </div>
+                                                <div className="bg-white/5 p-4 rounded-xl border border-white/5">
+                                                    <div className="text-2xl font-bold text-brand-400 whitespace-nowrap">
+                                                        {Math.round(summary?.pending?.weight ?? 0)}
+                                                        <span className="text-[10px] ml-1">KG</span>
+                                                    </div>
+                                                    <div className="text-[10px] text-slate-500 font-bold uppercase tracking-widest mt-1">Pending Load</div>
+                                                </div>
                                             </div>
                                         </div>
                                     </div>